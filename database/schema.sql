@@ -95,8 +95,17 @@ CREATE TABLE embeddings (
     id SERIAL PRIMARY KEY,
     chunk_id INTEGER REFERENCES chunks(id) ON DELETE CASCADE,
     
-    -- Vector column (384 dimensions for all-MiniLM-L6-v2)
-    embedding vector(384) NOT NULL,
+    -- JSON array (384 floats for all-MiniLM-L6-v2) - legacy format
+    embedding JSONB,
+    
+    -- Raw little-endian float16/float32 bytes (768 / 1536 bytes);
+    -- convert older rows with scripts/convert_embeddings_binary.py
+    embedding_blob BYTEA,
+    embedding_dtype VARCHAR(10),
+    
+    -- Vector column (384 dimensions), searched with <=> through HNSW
+    -- (backfill older databases with scripts/migrate_embeddings_pgvector.py)
+    embedding_vector vector(384),
     
     model_name VARCHAR(100) DEFAULT 'all-MiniLM-L6-v2',
     created_at TIMESTAMP DEFAULT NOW()
@@ -106,7 +115,7 @@ CREATE INDEX idx_embeddings_chunk ON embeddings(chunk_id);
 
 -- CRITICAL: Create HNSW index for fast similarity search
 CREATE INDEX idx_embeddings_vector ON embeddings 
-USING hnsw (embedding vector_cosine_ops)
+USING hnsw (embedding_vector vector_cosine_ops)
 WITH (m = 16, ef_construction = 64);
 
 -- ============================================
@@ -130,12 +139,12 @@ BEGIN
         c.id,
         c.text,
         c.page_number,
-        1 - (e.embedding <=> query_emb) as sim
+        1 - (e.embedding_vector <=> query_emb) as sim
     FROM embeddings e
     JOIN chunks c ON c.id = e.chunk_id
     JOIN documents d ON d.id = c.document_id
     WHERE d.document_id = doc_id
-    ORDER BY e.embedding <=> query_emb
+    ORDER BY e.embedding_vector <=> query_emb
     LIMIT top_k;
 END;
 $$ LANGUAGE plpgsql;
@@ -7,7 +7,9 @@ import argparse
 from typing import List, Dict
 
 # Configuration
-API_URL = "http://localhost:5000/api/ask"
+# Start the app with LLM_CASSETTE_MODE=record once, then =replay to rerun
+# without the model (LLM_CASSETTE_DELAY_SCALE=1 replays recorded timings)
+API_URL = os.getenv("RAG_API_URL", "http://localhost:5000/api/ask")
 DOCUMENT_ID = "policybazar_ipo"
 QUESTIONS_FILE = "complex_questions.json"
 OUTPUT_DIR = "evaluation_complex"
@@ -21,7 +23,9 @@ def query_rag(question: str, rag_mode: str) -> Dict:
     payload = {
         "question": question,
         "document_id": DOCUMENT_ID,
-        "rag_mode": rag_mode
+        "rag_mode": rag_mode,
+        "priority": "evaluation",  # yield the LLM to interactive users
+        "no_cache": True  # measure real generations, never cached answers
     }
     
     try:
@@ -35,7 +39,7 @@ def query_rag(question: str, rag_mode: str) -> Dict:
                 if line:
                     try:
                         data = json.loads(line)
-                        # The API sends the full answer in a "token" message
+                        # The API streams the answer as a sequence of "token" deltas
                         if data.get("type") == "token":
                             full_answer += data.get("content", "")
                     except json.JSONDecodeError:
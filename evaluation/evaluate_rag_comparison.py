@@ -8,7 +8,9 @@ import numpy as np
 from datetime import datetime
 
 # Configuration
-API_URL = "http://localhost:5000/api/ask"
+# Start the app with LLM_CASSETTE_MODE=record once, then =replay to rerun
+# without the model (LLM_CASSETTE_DELAY_SCALE=1 replays recorded timings)
+API_URL = os.getenv("RAG_API_URL", "http://localhost:5000/api/ask")
 DOCUMENT_ID = "policybazar_ipo"
 OUTPUT_FILE_JSON = "evaluation_results.json"
 OUTPUT_FILE_CSV = "evaluation_results.csv"
@@ -91,7 +93,9 @@ def query_api(question, rag_mode):
     payload = {
         "question": question,
         "document_id": DOCUMENT_ID,
-        "rag_mode": rag_mode
+        "rag_mode": rag_mode,
+        "priority": "evaluation",  # yield the LLM to interactive users
+        "no_cache": True  # measure real generations, never cached answers
     }
     
     start_time = time.time()
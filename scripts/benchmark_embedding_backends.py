@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+Parity check and benchmark of the embedding backends (torch / onnx / onnx-int8)
+
+Chunks a PDF the same way /api/upload does, encodes the chunks and a set of
+short queries with each backend, and reports:
+  - cosine similarity of every ONNX embedding against torch (must be >= 0.99)
+  - single-query encode latency
+  - ingestion throughput in chunks/sec
+
+Run scripts/export_onnx_model.py first.
+
+Usage:
+    python scripts/benchmark_embedding_backends.py
+    python scripts/benchmark_embedding_backends.py --pdf data/sample_ipo.pdf --backends torch,onnx-int8
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "src"))
+
+from utils.config import EMBEDDING_MODEL_NAME, EMBEDDING_TORCH_THREADS
+
+PARITY_THRESHOLD = 0.99
+
+QUERIES = [
+    "Who is the CEO of the company?",
+    "What are the objects of the issue?",
+    "What was the restated loss for the last fiscal year?",
+    "Who are the selling shareholders in the offer for sale?",
+    "Where is the registered office located?",
+    "What are the key risk factors?",
+]
+
+
+def load_chunk_texts(pdf_path: str):
+    from utils.pdf_utils import extract_pages
+    from utils.text_utils import detect_chapters, build_chunks
+
+    pages = extract_pages(pdf_path)
+    chunks = build_chunks(pages, detect_chapters(pages))
+    return [c['text'] for c in chunks]
+
+
+def load_backend(backend: str):
+    if backend == 'torch':
+        import torch
+        from sentence_transformers import SentenceTransformer
+        torch.set_num_threads(EMBEDDING_TORCH_THREADS)
+        return SentenceTransformer(EMBEDDING_MODEL_NAME, device='cpu')
+
+    from utils.onnx_encoder import OnnxSentenceEncoder
+    return OnnxSentenceEncoder(quantized=backend == 'onnx-int8')
+
+
+def normalized(vectors: np.ndarray) -> np.ndarray:
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def benchmark(model, texts, batch_size: int, repeats: int):
+    """Returns (chunk embeddings, query embeddings, query ms, chunks/sec)"""
+    model.encode(QUERIES[:1], convert_to_numpy=True)  # warm-up
+
+    start = time.perf_counter()
+    for _ in range(repeats):
+        for q in QUERIES:
+            model.encode([q], convert_to_numpy=True)
+    query_ms = (time.perf_counter() - start) * 1000 / (repeats * len(QUERIES))
+
+    start = time.perf_counter()
+    chunk_embeddings = model.encode(texts, batch_size=batch_size, convert_to_numpy=True)
+    chunks_per_sec = len(texts) / (time.perf_counter() - start)
+
+    query_embeddings = model.encode(QUERIES, convert_to_numpy=True)
+    return chunk_embeddings, query_embeddings, query_ms, chunks_per_sec
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Embedding backend parity and speed benchmark')
+    parser.add_argument('--pdf', default=os.path.join(ROOT, 'data', 'sample_ipo.pdf'), help='PDF to chunk')
+    parser.add_argument('--backends', default='torch,onnx,onnx-int8', help='Comma-separated backends')
+    parser.add_argument('--batch-size', '-b', type=int, default=32, help='Encode batch size')
+    parser.add_argument('--repeats', type=int, default=5, help='Query latency repeats')
+    args = parser.parse_args()
+
+    texts = load_chunk_texts(args.pdf)
+    backends = [b.strip() for b in args.backends.split(',')]
+
+    print(f"""
+{'='*60}
+  {os.path.basename(args.pdf)}: {len(texts)} chunks, {EMBEDDING_TORCH_THREADS} thread(s)
+{'='*60}""")
+
+    reference = None
+    failed = False
+    for backend in backends:
+        try:
+            model = load_backend(backend)
+        except (ImportError, FileNotFoundError) as e:
+            print(f"  ⚠️  {backend:<10}: skipped ({e})")
+            continue
+
+        chunks_emb, query_emb, query_ms, chunks_per_sec = benchmark(model, texts, args.batch_size, args.repeats)
+        line = f"  {backend:<10}: {query_ms:6.2f} ms/query   {chunks_per_sec:7.1f} chunks/sec"
+
+        if backend == 'torch':
+            reference = (normalized(chunks_emb), normalized(query_emb))
+        elif reference is not None:
+            cos = np.concatenate([
+                (normalized(chunks_emb) * reference[0]).sum(axis=1),
+                (normalized(query_emb) * reference[1]).sum(axis=1)
+            ])
+            ok = cos.min() >= PARITY_THRESHOLD
+            failed |= not ok
+            line += f"   cosine min {cos.min():.4f} / mean {cos.mean():.4f} {'✅' if ok else '❌'}"
+
+        print(line)
+
+    if reference is None and len(backends) > 1:
+        print("\n  (parity skipped: torch backend not available)")
+    if failed:
+        print(f"\n❌ Parity below {PARITY_THRESHOLD}")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
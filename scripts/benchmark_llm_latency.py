@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+Cold-start vs warm latency of the local LLM (Ollama /api/chat)
+
+Unloads the model, then times:
+  - the first request (model load + full prompt prefill)
+  - repeated requests with the model resident
+  - requests sharing the static system prompt but asking different
+    questions (prefix reuse shows up as fewer prompt_eval tokens)
+
+Reports time to first token, total time and Ollama's load / prompt-eval
+timings for each.
+
+Usage:
+    python scripts/benchmark_llm_latency.py
+    python scripts/benchmark_llm_latency.py --repeats 5 --max-tokens 64
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+from utils.deepseek_client import DeepSeekClient
+
+SYSTEM_PROMPT = """You are an expert analyst answering questions about an IPO offer document.
+Answer concisely and accurately, citing figures exactly as stated in the context."""
+
+CONTEXT = """Context:
+PB Fintech Limited operates Policybazaar and Paisabazaar. Yashish Dahiya is the Chairman,
+Executive Director and Chief Executive Officer. The registered office is in Gurugram, Haryana.
+The offer comprises a fresh issue and an offer for sale by selling shareholders."""
+
+QUESTIONS = [
+    "Who is the CEO of the company?",
+    "Where is the registered office located?",
+    "What does the offer comprise?",
+    "Which platforms does the company operate?",
+]
+
+
+def unload(client: DeepSeekClient):
+    """keep_alive=0 with no messages evicts the model"""
+    response = client.http.post(
+        f"{client.base_url}/api/chat",
+        json={"model": client.model, "messages": [], "keep_alive": 0, "stream": False},
+        timeout=60
+    )
+    response.raise_for_status()
+
+
+def timed_chat(client: DeepSeekClient, question: str, max_tokens: int) -> dict:
+    """Stream one uncached request; returns ttft/total seconds and Ollama timings"""
+    payload = client._chat_payload(f"{CONTEXT}\n\nQuestion: {question}\n\nAnswer:", SYSTEM_PROMPT, max_tokens, stream=True)
+
+    start = time.perf_counter()
+    ttft = None
+    final = {}
+    with client.http.post(f"{client.base_url}/api/chat", json=payload, stream=True, timeout=300) as response:
+        response.raise_for_status()
+        for line in response.iter_lines():
+            if not line:
+                continue
+            chunk = json.loads(line)
+            if ttft is None and chunk.get('message', {}).get('content'):
+                ttft = time.perf_counter() - start
+            if chunk.get('done'):
+                final = chunk
+                break
+
+    return {
+        'ttft': ttft or 0.0,
+        'total': time.perf_counter() - start,
+        'load': final.get('load_duration', 0) / 1e9,
+        'prompt_tokens': final.get('prompt_eval_count', 0),
+        'prompt_eval': final.get('prompt_eval_duration', 0) / 1e9,
+    }
+
+
+def report(label: str, r: dict):
+    print(f"  {label:<22} ttft {r['ttft']*1000:8.0f} ms   total {r['total']*1000:8.0f} ms   "
+          f"load {r['load']*1000:7.0f} ms   prefill {r['prompt_tokens']:4d} tok / {r['prompt_eval']*1000:6.0f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Cold vs warm LLM latency')
+    parser.add_argument('--repeats', '-n', type=int, default=3, help='Warm repeats of the same request')
+    parser.add_argument('--max-tokens', type=int, default=32, help='num_predict per request')
+    args = parser.parse_args()
+
+    client = DeepSeekClient(use_cache=False)
+
+    print("=" * 60)
+    print(f"  LLM LATENCY: {client.model} @ {client.base_url}")
+    print("=" * 60)
+
+    print("\n🧊 Cold start")
+    unload(client)
+    report("first request", timed_chat(client, QUESTIONS[0], args.max_tokens))
+
+    print("\n🔥 Warm, identical request")
+    warm = [timed_chat(client, QUESTIONS[0], args.max_tokens) for _ in range(args.repeats)]
+    for i, r in enumerate(warm):
+        report(f"repeat {i + 1}", r)
+
+    print("\n🔁 Warm, shared system prompt + context, new question")
+    for question in QUESTIONS[1:]:
+        report(question[:22], timed_chat(client, question, args.max_tokens))
+
+    print("\n🔥 Warm-up call (as run at server start)")
+    unload(client)
+    client.warm_up(SYSTEM_PROMPT)
+    report("after warm-up", timed_chat(client, QUESTIONS[0], args.max_tokens))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Recall vs. memory benchmark: int8 quantized index against the exact path
+
+Loads a document's embeddings once, builds the exact float32 index and
+the int8 index, and compares top-k results for each re-rank depth.
+
+Queries are the evaluation questions encoded with the embedding model,
+or (with --synthetic N) noisy copies of random chunk vectors, which
+needs no model.
+
+Usage:
+    python scripts/benchmark_vector_index.py --document policybazar_ipo
+    python scripts/benchmark_vector_index.py -d policybazar_ipo --synthetic 500 --rerank 0,50,200
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "src"))
+
+from utils.vector_index import DocumentVectorIndex, QuantizedDocumentIndex, normalize_rows
+
+QUESTION_FILES = [
+    os.path.join(ROOT, "evaluation", "evaluation_results.json"),
+    os.path.join(ROOT, "evaluation", "complex_questions.json"),
+]
+
+
+def load_question_embeddings() -> np.ndarray:
+    """Encode the evaluation questions"""
+    from utils.embedding_utils import get_embedding_model
+
+    questions = []
+    for path in QUESTION_FILES:
+        if os.path.exists(path):
+            with open(path, 'r') as f:
+                questions.extend(q['question'] for q in json.load(f) if q.get('question'))
+
+    print(f"Encoding {len(questions)} evaluation questions...")
+    return get_embedding_model().encode(questions, convert_to_numpy=True)
+
+
+def synthetic_queries(matrix: np.ndarray, count: int, noise: float = 0.5, seed: int = 0) -> np.ndarray:
+    """Noisy copies of random chunk vectors"""
+    rng = np.random.default_rng(seed)
+    picks = rng.integers(0, len(matrix), size=count)
+    return matrix[picks] + rng.normal(scale=noise / np.sqrt(matrix.shape[1]), size=(count, matrix.shape[1]))
+
+
+def recall_at_k(exact, approx, top_k: int) -> float:
+    exact_ids = {chunk_id for chunk_id, _ in exact[:top_k]}
+    approx_ids = {chunk_id for chunk_id, _ in approx[:top_k]}
+    return len(exact_ids & approx_ids) / max(len(exact_ids), 1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Int8 index recall/memory benchmark')
+    parser.add_argument('--document', '-d', default='policybazar_ipo', help='Document ID')
+    parser.add_argument('--top-k', '-k', type=int, default=5, help='Results per query')
+    parser.add_argument('--rerank', default='0,50,100,200', help='Comma-separated re-rank depths')
+    parser.add_argument('--synthetic', type=int, default=0, help='Use N synthetic queries instead of questions')
+    args = parser.parse_args()
+
+    print(f"📄 Loading embeddings for {args.document}...")
+    exact_index = DocumentVectorIndex.load(args.document)
+    if len(exact_index) == 0:
+        print("❌ No embeddings found")
+        return
+
+    quantized = QuantizedDocumentIndex.from_matrix(args.document, exact_index.chunk_ids, exact_index.matrix)
+
+    if args.synthetic:
+        queries = synthetic_queries(exact_index.matrix, args.synthetic)
+    else:
+        queries = load_question_embeddings()
+    queries = normalize_rows(queries)
+
+    exact_results = []
+    start = time.perf_counter()
+    for q in queries:
+        exact_results.append(exact_index.search(q, args.top_k))
+    exact_ms = (time.perf_counter() - start) * 1000 / len(queries)
+
+    print(f"""
+{'='*60}
+  {args.document}: {len(exact_index)} chunks, {len(queries)} queries, top-{args.top_k}
+{'='*60}
+  float32 exact : {exact_index.nbytes / 1024:8.1f} KB resident   {exact_ms:6.2f} ms/query
+""")
+
+    for depth in [int(d) for d in args.rerank.split(',')]:
+        recalls = []
+        start = time.perf_counter()
+        for q, exact in zip(queries, exact_results):
+            recalls.append(recall_at_k(exact, quantized.search(q, args.top_k, rerank_candidates=depth), args.top_k))
+        ms = (time.perf_counter() - start) * 1000 / len(queries)
+
+        label = f"int8 rerank={depth}"
+        print(f"  {label:<14}: {quantized.nbytes / 1024:8.1f} KB resident   {ms:6.2f} ms/query   "
+              f"recall@{args.top_k} = {np.mean(recalls):.3f}")
+
+    print(f"\n  Memory ratio: {exact_index.nbytes / quantized.nbytes:.1f}x smaller")
+
+
+if __name__ == '__main__':
+    main()
@@ -16,6 +16,7 @@ sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(
 from utils.kg_extractor import KnowledgeGraphExtractor
 from utils.entity_resolver import EntityResolver
 from utils.graph_store import GraphStore
+from utils.document_meta import invalidate_document_meta
 
 
 def extract_batch(batch_args):
@@ -186,6 +187,7 @@ def build_knowledge_graph(document_id: str, num_workers: int = 10, max_chunks: i
     graph_file = f"{output_dir}/knowledge_graph.json"
     print(f"\n7. Saving knowledge graph to {graph_file}...")
     graph.save(graph_file)
+    invalidate_document_meta(document_id)
     
     # Save visualization export
     viz_file = f"{output_dir}/graph_viz.json"
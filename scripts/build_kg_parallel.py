@@ -9,20 +9,19 @@ Expected time: ~45 minutes for 816 chunks (vs 41 hours sequential)
 import os
 import sys
 import json
-import asyncio
-import aiohttp
 import argparse
 from datetime import datetime
-from concurrent.futures import ThreadPoolExecutor
 from typing import List, Dict, Any
 
 sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
 
 from database.connection import engine
 from sqlalchemy import text
+from utils.deepseek_client import DeepSeekClient
+from utils.llm_cache import get_llm_cache
+from utils.document_meta import invalidate_document_meta
 
 # Configuration
-OLLAMA_URL = "http://localhost:11434/api/generate"
 MODEL = "llama3:latest"
 BATCH_SIZE = 10  # chunks per batch
 MAX_CONCURRENT = 3  # parallel requests
@@ -30,12 +29,9 @@ TIMEOUT = 300  # 5 minutes per request
 
 
 def get_unified_extraction_prompt(chunks_text: str) -> str:
-    """Single prompt that extracts all KG elements at once"""
+    """Single prompt that extracts all KG elements at once (static instructions first, text last)"""
     return f"""You are extracting structured information from IPO (Initial Public Offering) document text.
 
-TEXT TO ANALYZE:
-{chunks_text}
-
 Extract ALL of the following in a single JSON response:
 
 1. ENTITIES: People, companies, organizations, regulators mentioned
@@ -71,33 +67,11 @@ CRITICAL RULES:
 - Always include the FULL entity names in claims (subject and object)
 - If no items found for a category, use empty array []
 
-JSON Response:"""
-
+TEXT TO ANALYZE:
+{chunks_text}
 
+JSON Response:"""
 
-async def call_ollama_async(session: aiohttp.ClientSession, prompt: str, batch_id: int) -> Dict:
-    """Async call to Ollama API"""
-    payload = {
-        "model": MODEL,
-        "prompt": prompt,
-        "stream": False,
-        "options": {
-            "temperature": 0.1,
-            "num_predict": 4096
-        }
-    }
-    
-    try:
-        async with session.post(OLLAMA_URL, json=payload, timeout=aiohttp.ClientTimeout(total=TIMEOUT)) as resp:
-            if resp.status == 200:
-                result = await resp.json()
-                return {"batch_id": batch_id, "response": result.get("response", ""), "success": True}
-            else:
-                return {"batch_id": batch_id, "error": f"HTTP {resp.status}", "success": False}
-    except asyncio.TimeoutError:
-        return {"batch_id": batch_id, "error": "Timeout", "success": False}
-    except Exception as e:
-        return {"batch_id": batch_id, "error": str(e), "success": False}
 
 
 def parse_llm_response(response: str) -> Dict:
@@ -145,38 +119,35 @@ def create_batches(chunks: List[Dict], batch_size: int) -> List[List[Dict]]:
     return batches
 
 
-async def process_batches_async(batches: List[List[Dict]], max_concurrent: int) -> List[Dict]:
-    """Process batches with parallel requests"""
-    results = []
-    semaphore = asyncio.Semaphore(max_concurrent)
+def process_batches(batches: List[List[Dict]], max_concurrent: int, use_cache: bool = True) -> List[Dict]:
+    """Process batches with parallel requests (DeepSeekClient.batch_extract)"""
+    client = DeepSeekClient(use_cache=use_cache)
+    client.model = MODEL
     
-    async with aiohttp.ClientSession() as session:
-        async def process_batch(batch_id: int, batch: List[Dict]):
-            async with semaphore:
-                # Combine chunk texts
-                combined_text = "\n\n---CHUNK BOUNDARY---\n\n".join([c["text"][:2000] for c in batch])
-                prompt = get_unified_extraction_prompt(combined_text)
-                
-                result = await call_ollama_async(session, prompt, batch_id)
-                return result
-        
-        # Create tasks
-        tasks = [process_batch(i, batch) for i, batch in enumerate(batches)]
-        
-        # Process with progress
-        total = len(tasks)
-        completed = 0
-        
-        for coro in asyncio.as_completed(tasks):
-            result = await coro
-            completed += 1
-            
-            status = "✓" if result.get("success") else "✗"
-            print(f"\r[{completed}/{total}] Batch {result['batch_id']} {status}   ", end="", flush=True)
-            
-            results.append(result)
+    prompts = []
+    for batch in batches:
+        # Combine chunk texts
+        combined_text = "\n\n---CHUNK BOUNDARY---\n\n".join([c["text"][:2000] for c in batch])
+        prompts.append(get_unified_extraction_prompt(combined_text))
+    
+    def progress(completed, total):
+        print(f"\r[{completed}/{total}] batches done   ", end="", flush=True)
     
+    responses = client.batch_extract(
+        prompts,
+        max_concurrent=max_concurrent,
+        timeout=TIMEOUT,
+        progress_callback=progress,
+        json_mode=False
+    )
     print()  # New line after progress
+    
+    results = []
+    for batch_id, response in enumerate(responses):
+        if response.get("error"):
+            results.append({"batch_id": batch_id, "error": response["error"], "success": False})
+        else:
+            results.append({"batch_id": batch_id, "response": response.get("output", ""), "success": True})
     return results
 
 
@@ -349,8 +320,8 @@ def save_to_database(doc_db_id: int, all_results: List[Dict]):
     return entities_count, claims_count, terms_count, events_count
 
 
-async def main_async(document_id: str, limit: int = None):
-    """Main async entry point"""
+def run(document_id: str, limit: int = None, use_cache: bool = True):
+    """Main entry point"""
     print(f"""
 {'='*60}
 🚀 PARALLEL KG EXTRACTION (Optimized for M3 Pro)
@@ -387,16 +358,19 @@ Model: {MODEL}
     print(f"\n⚡ Processing {len(batches)} batches ({MAX_CONCURRENT} parallel)...")
     start_time = datetime.now()
     
-    results = await process_batches_async(batches, MAX_CONCURRENT)
+    results = process_batches(batches, MAX_CONCURRENT, use_cache)
     
     elapsed = (datetime.now() - start_time).total_seconds()
     success_count = sum(1 for r in results if r.get("success"))
     
     print(f"\n   Completed: {success_count}/{len(results)} batches in {elapsed:.1f}s")
+    if use_cache:
+        print(f"   {get_llm_cache().summary()}")
     
     # Save to database
     print("\n💾 Saving to database...")
     entities, claims, terms, events = save_to_database(doc_db_id, results)
+    invalidate_document_meta(document_id)  # running servers pick up the new KG counts
     
     print(f"""
 {'='*60}
@@ -419,15 +393,16 @@ def main():
     parser.add_argument('--limit', '-l', type=int, default=None, help='Limit chunks (for testing)')
     parser.add_argument('--batch-size', '-b', type=int, default=10, help='Chunks per batch')
     parser.add_argument('--parallel', '-p', type=int, default=3, help='Parallel workers')
+    parser.add_argument('--no-cache', action='store_true', help='Bypass the LLM response cache')
     
     args = parser.parse_args()
     
     # Update module-level config
-    import build_kg_parallel
-    build_kg_parallel.BATCH_SIZE = args.batch_size
-    build_kg_parallel.MAX_CONCURRENT = args.parallel
+    global BATCH_SIZE, MAX_CONCURRENT
+    BATCH_SIZE = args.batch_size
+    MAX_CONCURRENT = args.parallel
     
-    asyncio.run(main_async(args.document, args.limit))
+    run(args.document, args.limit, use_cache=not args.no_cache)
 
 
 if __name__ == "__main__":
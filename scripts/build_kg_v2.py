@@ -18,6 +18,8 @@ from datetime import datetime
 sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
 
 from utils.kg_pipeline import KGPipeline
+from utils.llm_cache import get_llm_cache
+from utils.document_meta import invalidate_document_meta
 from database.connection import get_db
 from database.repositories import DocumentRepository
 from database.kg_repositories import (
@@ -185,7 +187,7 @@ def save_extraction_results(doc_db_id: int, results: dict):
     return stats
 
 
-def build_kg(document_id: str, limit: int = None):
+def build_kg(document_id: str, limit: int = None, use_cache: bool = True):
     """Build KG for a document"""
     
     print("=" * 60)
@@ -220,11 +222,14 @@ def build_kg(document_id: str, limit: int = None):
     
     # Run pipeline
     print("\n🚀 Running extraction pipeline...")
-    pipeline = KGPipeline(use_local=True)
+    pipeline = KGPipeline(use_local=True, use_cache=use_cache)
     results = pipeline.process_document(chunks)
+    if use_cache:
+        print(f"   {get_llm_cache().summary()}")
     
     # Save to database
     save_stats = save_extraction_results(doc_db_id, results)
+    invalidate_document_meta(document_id)  # running servers pick up the new KG counts
     
     # Save JSON backup
     output_dir = f"data/documents/{document_id}/knowledge_graph_v2"
@@ -259,6 +264,7 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser(description='Build KG v2 for document')
     parser.add_argument('--document', '-d', required=True, help='Document ID')
     parser.add_argument('--limit', '-l', type=int, default=None, help='Limit chunks (for testing)')
+    parser.add_argument('--no-cache', action='store_true', help='Bypass the LLM response cache')
     
     args = parser.parse_args()
-    build_kg(args.document, args.limit)
+    build_kg(args.document, args.limit, use_cache=not args.no_cache)
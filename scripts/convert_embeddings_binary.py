@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+Convert JSONB embeddings to compact binary (bytea) storage
+
+Adds embeddings.embedding_blob / embedding_dtype if missing and rewrites
+every JSONB array as raw little-endian float16 or float32 bytes. With
+--drop-json the JSONB copy is cleared afterwards; run VACUUM FULL
+embeddings to return the space to the OS.
+
+scripts/migrate_embeddings.py runs this after the pgvector migration, so
+the vector column is filled before --drop-json removes the JSONB copy.
+
+Usage:
+    python scripts/convert_embeddings_binary.py
+    python scripts/convert_embeddings_binary.py --format float32 --document policybazar_ipo
+    python scripts/convert_embeddings_binary.py --drop-json
+"""
+import argparse
+import os
+import sys
+import time
+
+# Add src to path
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+from sqlalchemy import text
+from database.connection import engine
+from utils.embedding_codec import BINARY_FORMATS, encode_embedding
+
+
+def prepare_schema():
+    """Add the binary columns and relax NOT NULL on the JSONB column"""
+    print("\n🧩 Preparing schema...")
+    with engine.begin() as conn:
+        conn.execute(text("ALTER TABLE embeddings ADD COLUMN IF NOT EXISTS embedding_blob BYTEA"))
+        conn.execute(text("ALTER TABLE embeddings ADD COLUMN IF NOT EXISTS embedding_dtype VARCHAR(10)"))
+        conn.execute(text("ALTER TABLE embeddings ALTER COLUMN embedding DROP NOT NULL"))
+    print("  ✅ embedding_blob BYTEA, embedding_dtype VARCHAR(10)")
+
+
+def table_size() -> int:
+    """Total on-disk size of the embeddings table (incl. TOAST and indexes)"""
+    with engine.connect() as conn:
+        return conn.execute(text("SELECT pg_total_relation_size('embeddings')")).scalar()
+
+
+def convert(storage_format: str, batch_size: int, document_id: str = None, drop_json: bool = False) -> int:
+    """Rewrite JSONB rows as binary, one batch per transaction"""
+    print(f"\n📦 Converting JSONB rows to {storage_format}...")
+
+    doc_filter = ""
+    params = {"batch": batch_size}
+    if document_id:
+        doc_filter = """
+            AND e.chunk_id IN (
+                SELECT c.id FROM chunks c
+                JOIN documents d ON d.id = c.document_id
+                WHERE d.document_id = :doc_id
+            )
+        """
+        params["doc_id"] = document_id
+
+    total = 0
+    start = time.time()
+    while True:
+        with engine.begin() as conn:
+            rows = conn.execute(text(f"""
+                SELECT e.id, e.embedding
+                FROM embeddings e
+                WHERE e.embedding_blob IS NULL
+                AND e.embedding IS NOT NULL
+                {doc_filter}
+                ORDER BY e.id
+                LIMIT :batch
+            """), params).fetchall()
+
+            if not rows:
+                break
+
+            set_json = ", embedding = NULL" if drop_json else ""
+            conn.execute(text(f"""
+                UPDATE embeddings
+                SET embedding_blob = :blob, embedding_dtype = :dtype{set_json}
+                WHERE id = :id
+            """), [
+                {"id": r[0], "blob": encode_embedding(r[1], storage_format), "dtype": storage_format}
+                for r in rows
+            ])
+
+        total += len(rows)
+        print(f"\r  Converted {total} rows ({time.time() - start:.1f}s)", end='', flush=True)
+
+    print(f"\n  ✅ Converted {total} rows")
+    return total
+
+
+def drop_converted_json(document_id: str = None) -> int:
+    """Clear JSONB on rows that already have a binary copy"""
+    query = "UPDATE embeddings SET embedding = NULL WHERE embedding_blob IS NOT NULL AND embedding IS NOT NULL"
+    params = {}
+    if document_id:
+        query += """
+            AND chunk_id IN (
+                SELECT c.id FROM chunks c
+                JOIN documents d ON d.id = c.document_id
+                WHERE d.document_id = :doc_id
+            )
+        """
+        params["doc_id"] = document_id
+
+    with engine.begin() as conn:
+        return conn.execute(text(query), params).rowcount
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Convert JSONB embeddings to binary bytea')
+    parser.add_argument('--format', '-f', choices=sorted(BINARY_FORMATS), default='float16', help='Binary format')
+    parser.add_argument('--document', '-d', default=None, help='Only convert this document_id')
+    parser.add_argument('--batch-size', '-b', type=int, default=500, help='Rows per batch')
+    parser.add_argument('--drop-json', action='store_true', help='Clear the JSONB copy after conversion')
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print("  EMBEDDING BINARY CONVERSION")
+    print("=" * 60)
+
+    prepare_schema()
+    size_before = table_size()
+
+    convert(args.format, args.batch_size, args.document, args.drop_json)
+    if args.drop_json:
+        cleared = drop_converted_json(args.document)
+        if cleared:
+            print(f"  🗑️  Cleared JSONB on {cleared} previously converted rows")
+
+    size_after = table_size()
+    print(f"\n📊 embeddings table: {size_before / 1e6:.1f} MB -> {size_after / 1e6:.1f} MB")
+    if args.drop_json:
+        print("   Run VACUUM FULL embeddings; to reclaim the freed space.")
+
+    print("\n✅ Done")
+
+
+if __name__ == '__main__':
+    main()
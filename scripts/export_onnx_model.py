@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+Export the sentence embedding model to ONNX for the 'onnx' backends
+
+Writes model.onnx (fp32), model_int8.onnx (dynamic int8 quantization of
+the MatMul weights) and tokenizer.json to ONNX_MODEL_DIR. Needs torch and
+sentence-transformers plus the optional ONNX packages
+(pip install -r requirements-onnx.txt); the server then only needs
+onnxruntime + tokenizers with EMBEDDING_BACKEND = 'onnx' or 'onnx-int8'.
+
+Usage:
+    python scripts/export_onnx_model.py
+    python scripts/export_onnx_model.py --output data/models/minilm-onnx --no-int8
+"""
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+from utils.config import EMBEDDING_MODEL_NAME, ONNX_MODEL_DIR
+from utils.onnx_encoder import ONNX_MODEL_FILE, ONNX_INT8_MODEL_FILE, TOKENIZER_FILE
+
+
+def export_fp32(output_dir: str, opset: int) -> str:
+    """Export the transformer (token embeddings output) with dynamic batch/sequence axes"""
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    print(f"\n📦 Loading {EMBEDDING_MODEL_NAME}...")
+    st_model = SentenceTransformer(EMBEDDING_MODEL_NAME, device='cpu')
+    transformer = st_model[0].auto_model.eval()
+    tokenizer = st_model.tokenizer
+
+    # The fast tokenizer's tokenizer.json is all the runtime needs
+    tokenizer.backend_tokenizer.save(os.path.join(output_dir, TOKENIZER_FILE))
+
+    sample = tokenizer(["export sample sentence"], return_tensors='pt')
+    input_names = [name for name in ('input_ids', 'attention_mask', 'token_type_ids') if name in sample]
+    dynamic_axes = {name: {0: 'batch', 1: 'sequence'} for name in input_names}
+    dynamic_axes['last_hidden_state'] = {0: 'batch', 1: 'sequence'}
+
+    class TokenEmbeddings(torch.nn.Module):
+        def __init__(self, model):
+            super().__init__()
+            self.model = model
+
+        def forward(self, *inputs):
+            return self.model(**dict(zip(input_names, inputs))).last_hidden_state
+
+    model_path = os.path.join(output_dir, ONNX_MODEL_FILE)
+    print(f"🔧 Exporting to {model_path} (opset {opset})...")
+    with torch.no_grad():
+        torch.onnx.export(
+            TokenEmbeddings(transformer),
+            tuple(sample[name] for name in input_names),
+            model_path,
+            input_names=input_names,
+            output_names=['last_hidden_state'],
+            dynamic_axes=dynamic_axes,
+            opset_version=opset,
+            do_constant_folding=True
+        )
+    print(f"  ✅ {os.path.getsize(model_path) / 1e6:.1f} MB")
+    return model_path
+
+
+def quantize_int8(model_path: str, output_dir: str) -> str:
+    """Dynamic (weight-only, per-channel) int8 quantization"""
+    from onnxruntime.quantization import quantize_dynamic, QuantType
+
+    int8_path = os.path.join(output_dir, ONNX_INT8_MODEL_FILE)
+    print(f"\n🔧 Quantizing to {int8_path}...")
+    quantize_dynamic(model_path, int8_path, weight_type=QuantType.QInt8, per_channel=True)
+    print(f"  ✅ {os.path.getsize(int8_path) / 1e6:.1f} MB")
+    return int8_path
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Export the embedding model to ONNX')
+    parser.add_argument('--output', '-o', default=ONNX_MODEL_DIR, help='Output directory')
+    parser.add_argument('--opset', type=int, default=17, help='ONNX opset version')
+    parser.add_argument('--no-int8', action='store_true', help='Skip the int8 quantized copy')
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print("  ONNX EXPORT")
+    print("=" * 60)
+
+    os.makedirs(args.output, exist_ok=True)
+    model_path = export_fp32(args.output, args.opset)
+    if not args.no_int8:
+        quantize_int8(model_path, args.output)
+
+    print("\n✅ Done. Check parity with scripts/benchmark_embedding_backends.py")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+Bring the embeddings table of an existing database up to the current schema
+
+Runs the two embedding migrations in order:
+  1. migrate_embeddings_pgvector.py - vector column, backfill, HNSW index
+     (with VECTOR_SEARCH_BACKEND = 'pgvector', or --pgvector)
+  2. convert_embeddings_binary.py - binary columns, nullable JSONB, and
+     JSONB rows rewritten as EMBEDDING_STORAGE_FORMAT (schema only when
+     the format is 'jsonb')
+
+The pgvector backfill runs first because --drop-json removes the JSONB
+copy. Both steps are idempotent, so the script can be re-run at any time.
+
+Usage:
+    python scripts/migrate_embeddings.py
+    python scripts/migrate_embeddings.py --pgvector --drop-json
+"""
+import argparse
+import os
+import sys
+
+# Add src (and this directory, for the migration scripts) to path
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(SCRIPTS_DIR), "src"))
+sys.path.insert(0, SCRIPTS_DIR)
+
+import convert_embeddings_binary
+import migrate_embeddings_pgvector
+from utils.config import EMBEDDING_STORAGE_FORMAT, VECTOR_SEARCH_BACKEND
+from utils.embedding_codec import is_binary_format
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run the embeddings table migrations in order')
+    parser.add_argument('--pgvector', action='store_true',
+                        help='Add and backfill the vector column even if the pgvector backend is not configured')
+    parser.add_argument('--skip-index', action='store_true', help='Do not (re)build the HNSW index')
+    parser.add_argument('--drop-json', action='store_true', help='Clear the JSONB copy after binary conversion')
+    parser.add_argument('--batch-size', '-b', type=int, default=500, help='Rows per batch')
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print("  EMBEDDINGS MIGRATION")
+    print("=" * 60)
+
+    if args.pgvector or VECTOR_SEARCH_BACKEND == 'pgvector':
+        print("\n[1/2] pgvector column")
+        migrate_embeddings_pgvector.add_vector_column()
+        migrate_embeddings_pgvector.backfill(args.batch_size)
+        if not args.skip_index:
+            migrate_embeddings_pgvector.build_index()
+    else:
+        print(f"\n[1/2] pgvector column skipped (VECTOR_SEARCH_BACKEND = '{VECTOR_SEARCH_BACKEND}')")
+
+    print("\n[2/2] Binary embedding storage")
+    convert_embeddings_binary.prepare_schema()
+    if is_binary_format(EMBEDDING_STORAGE_FORMAT):
+        convert_embeddings_binary.convert(EMBEDDING_STORAGE_FORMAT, args.batch_size, drop_json=args.drop_json)
+        if args.drop_json:
+            convert_embeddings_binary.drop_converted_json()
+    else:
+        print("  Rows kept as JSONB (EMBEDDING_STORAGE_FORMAT = 'jsonb')")
+
+    print("\n✅ Done")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+"""
+Backfill the native pgvector column from existing embeddings
+
+Adds embeddings.embedding_vector if missing, fills it in batches from the
+JSONB arrays and, for rows stored only in binary form, from the decoded
+blobs, and builds the HNSW cosine index used by
+EmbeddingRepository.search_similar_pgvector.
+
+Required before setting VECTOR_SEARCH_BACKEND = 'pgvector' on a database
+created without the column; the other backends never read it. New rows
+only get a vector while the pgvector backend is configured, so run it
+again after switching. scripts/migrate_embeddings.py runs it together
+with the binary conversion, in the right order.
+
+Usage:
+    python scripts/migrate_embeddings_pgvector.py
+    python scripts/migrate_embeddings_pgvector.py --batch-size 2000 --skip-index
+"""
+import argparse
+import os
+import sys
+import time
+
+# Add src to path
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+from sqlalchemy import text
+from database.connection import engine
+from database.repositories.embedding_repo import to_vector_literal
+from utils.config import EMBEDDING_DIM
+from utils.embedding_codec import decode_embedding
+
+
+def add_vector_column():
+    """Enable pgvector and add the vector column"""
+    print("\n🧩 Preparing schema...")
+    with engine.begin() as conn:
+        conn.execute(text("CREATE EXTENSION IF NOT EXISTS vector"))
+        conn.execute(text(f"""
+            ALTER TABLE embeddings
+            ADD COLUMN IF NOT EXISTS embedding_vector vector({EMBEDDING_DIM})
+        """))
+    print(f"  ✅ embeddings.embedding_vector vector({EMBEDDING_DIM})")
+
+
+def backfill(batch_size: int) -> int:
+    """Copy JSONB arrays, then decoded binary blobs, into the vector column, one batch per transaction"""
+    print("\n📦 Backfilling vectors...")
+
+    with engine.connect() as conn:
+        pending = conn.execute(text(
+            "SELECT COUNT(*) FROM embeddings WHERE embedding_vector IS NULL"
+        )).scalar()
+    print(f"  {pending} rows to convert")
+
+    total = 0
+    start = time.time()
+    while True:
+        with engine.begin() as conn:
+            # jsonb arrays print as '[0.1, 0.2, ...]', which is valid vector input
+            result = conn.execute(text("""
+                UPDATE embeddings
+                SET embedding_vector = CAST(embedding::text AS vector)
+                WHERE id IN (
+                    SELECT id FROM embeddings
+                    WHERE embedding_vector IS NULL
+                    AND embedding IS NOT NULL
+                    ORDER BY id
+                    LIMIT :batch
+                )
+            """), {"batch": batch_size})
+            updated = result.rowcount
+
+        if not updated:
+            break
+
+        total += updated
+        print(f"\r  Converted {total}/{pending} rows ({time.time() - start:.1f}s)", end='', flush=True)
+
+    # Rows without a JSONB copy (binary storage) are decoded here
+    with engine.connect() as conn:
+        has_blobs = conn.execute(text("""
+            SELECT 1 FROM information_schema.columns
+            WHERE table_name = 'embeddings' AND column_name = 'embedding_blob'
+        """)).first() is not None
+    while has_blobs:
+        with engine.begin() as conn:
+            rows = conn.execute(text("""
+                SELECT id, embedding_blob, embedding_dtype FROM embeddings
+                WHERE embedding_vector IS NULL
+                AND embedding IS NULL
+                AND embedding_blob IS NOT NULL
+                ORDER BY id
+                LIMIT :batch
+            """), {"batch": batch_size}).fetchall()
+            if not rows:
+                break
+            conn.execute(text("""
+                UPDATE embeddings SET embedding_vector = CAST(:vector AS vector) WHERE id = :id
+            """), [
+                {"id": r[0], "vector": to_vector_literal(decode_embedding(r[1], r[2]))}
+                for r in rows
+            ])
+
+        total += len(rows)
+        print(f"\r  Converted {total}/{pending} rows ({time.time() - start:.1f}s)", end='', flush=True)
+
+    print(f"\n  ✅ Backfilled {total} rows")
+    return total
+
+
+def build_index():
+    """(Re)build the HNSW cosine index on embedding_vector"""
+    print("\n⚡ Building HNSW index...")
+    start = time.time()
+    with engine.begin() as conn:
+        conn.execute(text("DROP INDEX IF EXISTS idx_embeddings_vector"))
+        conn.execute(text("""
+            CREATE INDEX idx_embeddings_vector ON embeddings
+            USING hnsw (embedding_vector vector_cosine_ops)
+            WITH (m = 16, ef_construction = 64)
+        """))
+        conn.execute(text("ANALYZE embeddings"))
+    print(f"  ✅ idx_embeddings_vector built in {time.time() - start:.1f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Backfill pgvector embeddings from JSONB')
+    parser.add_argument('--batch-size', '-b', type=int, default=1000, help='Rows per UPDATE batch')
+    parser.add_argument('--skip-index', action='store_true', help='Do not (re)build the HNSW index')
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print("  PGVECTOR MIGRATION")
+    print("=" * 60)
+
+    add_vector_column()
+    backfill(args.batch_size)
+
+    if not args.skip_index:
+        build_index()
+
+    print("\n✅ Done. Set VECTOR_SEARCH_BACKEND = 'pgvector' in src/utils/config.py to search via HNSW.")
+
+
+if __name__ == '__main__':
+    main()
@@ -11,6 +11,7 @@ from pathlib import Path
 sys.path.insert(0, str(Path(__file__).parent.parent / 'src'))
 
 from database.repositories import DocumentRepository, ChunkRepository, EmbeddingRepository
+from utils.document_meta import invalidate_document_meta
 
 def migrate_documents():
     """Migrate documents.json to database"""
@@ -111,14 +112,8 @@ def migrate_document_chunks(document_id):
         print(f"  ❌ Failed to insert chunks: {e}")
         return False
     
-    # Prepare embedding data for bulk insert
-    embeddings_data = []
-    for chunk_id, embedding in zip(chunk_ids, embeddings):
-        embeddings_data.append({
-            'chunk_id': chunk_id,
-            'embedding': embedding.tolist(),  # Convert numpy to list
-            'model_name': 'all-MiniLM-L6-v2'
-        })
+    # Prepare embedding data for bulk insert (storage format from config)
+    embeddings_data = EmbeddingRepository.build_rows(chunk_ids, embeddings)
     
     # Bulk insert embeddings
     try:
@@ -130,6 +125,7 @@ def migrate_document_chunks(document_id):
     
     # Update document total_chunks
     DocumentRepository.update(document_id, {'total_chunks': len(chunks)})
+    invalidate_document_meta(document_id)
     
     print(f"  ✅ Migration complete for {document_id}")
     return True
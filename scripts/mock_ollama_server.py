@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+"""
+Stand-in Ollama server for deterministic benchmarks and load tests
+
+Implements /api/generate, /api/chat (both stream modes, format: json),
+/api/embeddings and /api/tags with a configurable time to first token,
+generation rate and concurrency limit (requests beyond it queue, like
+OLLAMA_NUM_PARALLEL). Responses are looked up in order:
+
+  1. recorded: an LLM response cache file (utils.llm_cache) filled by
+     real runs, matched by the same request fingerprint DeepSeekClient uses
+  2. canned: a JSON list of {"match": "substring", "response": "..."}
+     checked against the last user message / prompt
+  3. a deterministic default ("{}" for format: json)
+
+Point the app, scripts and evaluation runs at it through the environment:
+
+    python scripts/mock_ollama_server.py --port 11435 --ttft-ms 300 --tokens-per-sec 25
+    OLLAMA_BASE_URL=http://localhost:11435 python src/app.py
+
+GET /mock/stats reports request counts and peak concurrency.
+"""
+import argparse
+import hashlib
+import json
+import os
+import random
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+from utils.config import DEEPSEEK_MODEL
+from utils.deepseek_client import DeepSeekClient
+from utils.llm_cache import LLMResponseCache
+
+
+class MockBackend:
+    """Timing model, response lookup and counters shared by all handler threads"""
+
+    def __init__(self, ttft_ms: float = 200, tokens_per_sec: float = 30, max_concurrent: int = 1,
+                 response_tokens: int = 64, canned: List[Dict] = None, recorded: str = None,
+                 embedding_dim: int = 768, model: str = DEEPSEEK_MODEL):
+        self.ttft = ttft_ms / 1000
+        self.token_interval = 1 / tokens_per_sec if tokens_per_sec > 0 else 0
+        self.response_tokens = response_tokens
+        self.canned = canned or []
+        self.recorded = LLMResponseCache(recorded, ttl=0, max_entries=0) if recorded else None
+        self.embedding_dim = embedding_dim
+        self.model = model
+
+        self.slots = threading.BoundedSemaphore(max(1, max_concurrent))
+        self._lock = threading.Lock()
+        self.stats = {'requests': 0, 'recorded_hits': 0, 'canned_hits': 0, 'active': 0, 'peak_concurrency': 0}
+
+    def _count(self, key: str, delta: int = 1):
+        with self._lock:
+            self.stats[key] += delta
+            self.stats['peak_concurrency'] = max(self.stats['peak_concurrency'], self.stats['active'])
+
+    def response_text(self, endpoint: str, payload: Dict) -> str:
+        """Recorded, canned or default response for a request"""
+        if self.recorded is not None:
+            # Same fingerprint DeepSeekClient caches under (endpoint name without /api/)
+            text = self.recorded.get(DeepSeekClient._fingerprint(endpoint, payload))
+            if text is not None:
+                self._count('recorded_hits')
+                return text
+
+        if endpoint == 'chat':
+            user = [m.get('content', '') for m in payload.get('messages', []) if m.get('role') == 'user']
+            prompt = user[-1] if user else ''
+        else:
+            prompt = payload.get('prompt', '')
+
+        for entry in self.canned:
+            if entry.get('match', '') in prompt:
+                self._count('canned_hits')
+                return entry['response']
+
+        if payload.get('format') == 'json':
+            return '{}'
+
+        # Deterministic filler, sized by response_tokens and num_predict
+        seed = hashlib.sha256(prompt.encode('utf-8')).hexdigest()
+        words = ["Mock", "answer", seed[:8] + "."] + ["lorem"] * self.response_tokens
+        return ' '.join(words)
+
+    @staticmethod
+    def tokens(text: str, num_predict: Optional[int]) -> List[str]:
+        """Split into word-sized stream deltas; text (not JSON, which would stop parsing) stops at num_predict"""
+        parts = text.split(' ')
+        pieces = [p + (' ' if i < len(parts) - 1 else '') for i, p in enumerate(parts)]
+        if num_predict and not text.lstrip().startswith(('{', '[')):
+            pieces = pieces[:max(1, num_predict)]
+        return pieces
+
+    def embedding(self, text: str) -> List[float]:
+        rng = random.Random(hashlib.sha256(text.encode('utf-8')).digest())
+        return [rng.uniform(-1, 1) for _ in range(self.embedding_dim)]
+
+
+def make_handler(backend: MockBackend):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, *args):
+            pass
+
+        def _send_json(self, obj: Dict, status: int = 200):
+            body = json.dumps(obj).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _write_chunk(self, obj: Dict):
+            data = (json.dumps(obj) + '\n').encode('utf-8')
+            self.wfile.write(b'%x\r\n%s\r\n' % (len(data), data))
+            self.wfile.flush()
+
+        def do_GET(self):
+            if self.path == '/api/tags':
+                self._send_json({'models': [{'name': backend.model, 'model': backend.model}]})
+            elif self.path == '/mock/stats':
+                with backend._lock:
+                    self._send_json(dict(backend.stats))
+            else:
+                self._send_json({'error': 'not found'}, 404)
+
+        def do_POST(self):
+            length = int(self.headers.get('Content-Length', 0))
+            try:
+                payload = json.loads(self.rfile.read(length) or b'{}')
+            except json.JSONDecodeError:
+                self._send_json({'error': 'invalid JSON'}, 400)
+                return
+
+            if self.path == '/api/embeddings':
+                self._send_json({'embedding': backend.embedding(payload.get('prompt', ''))})
+            elif self.path in ('/api/generate', '/api/chat'):
+                self._generate(self.path.rsplit('/', 1)[-1], payload)
+            else:
+                self._send_json({'error': 'not found'}, 404)
+
+        def _generate(self, endpoint: str, payload: Dict):
+            backend._count('requests')
+            base = {'model': payload.get('model', backend.model)}
+
+            # Empty prompt / message list: Ollama's load or unload request
+            if not payload.get('messages' if endpoint == 'chat' else 'prompt'):
+                reason = 'unload' if payload.get('keep_alive') in (0, '0') else 'load'
+                self._send_json(self._final(base, endpoint, '', reason, 0, 0))
+                return
+
+            text = backend.response_text(endpoint, payload)
+            pieces = backend.tokens(text, payload.get('options', {}).get('num_predict'))
+            stream = payload.get('stream', True)
+
+            with backend.slots:
+                backend._count('active')
+                try:
+                    start = time.perf_counter()
+                    time.sleep(backend.ttft)
+                    if stream:
+                        self.send_response(200)
+                        self.send_header('Content-Type', 'application/x-ndjson')
+                        self.send_header('Transfer-Encoding', 'chunked')
+                        self.end_headers()
+                        for i, piece in enumerate(pieces):
+                            if i:
+                                time.sleep(backend.token_interval)
+                            self._write_chunk({**base, **self._delta(endpoint, piece), 'done': False})
+                        self._write_chunk(self._final(base, endpoint, '', 'stop', len(pieces), time.perf_counter() - start))
+                        self.wfile.write(b'0\r\n\r\n')
+                    else:
+                        time.sleep(backend.token_interval * max(0, len(pieces) - 1))
+                        self._send_json(self._final(base, endpoint, ''.join(pieces), 'stop',
+                                                    len(pieces), time.perf_counter() - start))
+                finally:
+                    backend._count('active', -1)
+
+        @staticmethod
+        def _delta(endpoint: str, text: str) -> Dict:
+            if endpoint == 'chat':
+                return {'message': {'role': 'assistant', 'content': text}}
+            return {'response': text}
+
+        def _final(self, base: Dict, endpoint: str, text: str, reason: str, eval_count: int, elapsed: float) -> Dict:
+            ns = lambda seconds: int(seconds * 1e9)
+            return {
+                **base,
+                **self._delta(endpoint, text),
+                'created_at': datetime.now(timezone.utc).isoformat(),
+                'done': True,
+                'done_reason': reason,
+                'total_duration': ns(elapsed),
+                'load_duration': 0,
+                'prompt_eval_count': 0,
+                'prompt_eval_duration': ns(backend.ttft),
+                'eval_count': eval_count,
+                'eval_duration': ns(max(0.0, elapsed - backend.ttft)),
+            }
+
+    return Handler
+
+
+def create_server(host: str = '127.0.0.1', port: int = 11435, **backend_options) -> ThreadingHTTPServer:
+    """Build (but do not start) a mock server; port 0 picks a free port"""
+    server = ThreadingHTTPServer((host, port), make_handler(MockBackend(**backend_options)))
+    server.daemon_threads = True
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Mock Ollama server for deterministic performance tests')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', '-p', type=int, default=11435, help='Listen port (real Ollama uses 11434)')
+    parser.add_argument('--ttft-ms', type=float, default=200, help='Time to first token, milliseconds')
+    parser.add_argument('--tokens-per-sec', type=float, default=30, help='Generation rate after the first token')
+    parser.add_argument('--max-concurrent', type=int, default=1, help='Generations served at once; the rest queue')
+    parser.add_argument('--response-tokens', type=int, default=64, help='Length of default text responses')
+    parser.add_argument('--canned', help='JSON file: [{"match": "substring", "response": "..."}]')
+    parser.add_argument('--recorded', help='LLM response cache file to replay (e.g. data/cache/llm_responses.sqlite)')
+    parser.add_argument('--embedding-dim', type=int, default=768)
+    args = parser.parse_args()
+
+    canned = None
+    if args.canned:
+        with open(args.canned) as f:
+            canned = json.load(f)
+
+    server = create_server(
+        args.host, args.port,
+        ttft_ms=args.ttft_ms,
+        tokens_per_sec=args.tokens_per_sec,
+        max_concurrent=args.max_concurrent,
+        response_tokens=args.response_tokens,
+        canned=canned,
+        recorded=args.recorded,
+        embedding_dim=args.embedding_dim
+    )
+
+    print("=" * 60)
+    print(f"  MOCK OLLAMA on http://{args.host}:{server.server_port}")
+    print(f"  ttft {args.ttft_ms:.0f} ms, {args.tokens_per_sec:g} tok/s, {args.max_concurrent} concurrent")
+    print("=" * 60)
+    print(f"\n  OLLAMA_BASE_URL=http://{args.host}:{server.server_port} python src/app.py\n")
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n👋 Stopped")
+
+
+if __name__ == '__main__':
+    main()
@@ -11,16 +11,22 @@ os.environ['NUMEXPR_NUM_THREADS'] = '1'
 os.environ['TOKENIZERS_PARALLELISM'] = 'false'
 os.environ['PYTORCH_MPS_HIGH_WATERMARK_RATIO'] = '0.0'
 
-import torch
-torch.set_num_threads(1)
+from utils.config import EMBEDDING_BACKEND, EMBEDDING_TORCH_THREADS
+if EMBEDDING_BACKEND == 'torch':
+    import torch
+    # Model access is serialized by the encoding service, so its worker may use several intra-op threads
+    torch.set_num_threads(EMBEDDING_TORCH_THREADS)
 from flask import Flask, request, jsonify, render_template, send_from_directory, Response, stream_with_context
 from werkzeug.utils import secure_filename
 import os
 import json
 import hashlib
+import threading
+import uuid
 import numpy as np
 import requests
 from datetime import datetime
+from contextlib import nullcontext
 
 # Import configuration
 from utils.config import (
@@ -33,10 +39,15 @@ from utils.config import (
     EMBEDDING_MODEL_NAME,
     OLLAMA_BASE_URL,
     DEFAULT_TOP_K,
+    VECTOR_SEARCH_BACKEND,
+    USE_EMBEDDING_STORE,
+    USE_ENCODING_SERVICE,
     LLM_TEMPERATURE,
     LLM_NUM_PREDICT,
-    LLM_TOP_P
+    LLM_TOP_P,
+    LLM_WARMUP_ON_STARTUP
 )
+from utils.text_utils import question_budget
 
 # Constants for KG Retrieval
 PRIORITY_RELATIONS = {
@@ -75,7 +86,13 @@ from utils.pdf_utils import extract_pages
 # from utils.embedding_utils import search_similar_chunks, get_embedding_model, cosine_similarity  # Lazy loaded
 from utils.graph_store import GraphStore
 from utils.answer_formatter import AnswerFormatter
-from utils.deepseek_client import DeepSeekClient
+from utils.deepseek_client import get_shared_client
+from utils.llm_cache import bypass_llm_cache
+from utils.llm_scheduler import llm_priority, INTERACTIVE, PRIORITIES
+from utils.admission import get_admission_controller
+from utils.rag_registry import get_rag_registry
+from utils.document_meta import get_document_meta, get_document_meta_cache, json_kg_path
+from utils.ingestion import get_ingestion_manager
 
 # Database repositories
 from database.repositories import DocumentRepository, ChunkRepository, EmbeddingRepository, KGRepository
@@ -91,6 +108,24 @@ os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 os.makedirs(app.config['DOCUMENTS_FOLDER'], exist_ok=True)
 os.makedirs(app.config['DATA_FOLDER'], exist_ok=True)
 
+# Refuse to start on an embeddings table older than the configured storage format: every
+# upload would fail on insert
+try:
+    schema_problems = EmbeddingRepository.schema_problems()
+except Exception as e:
+    schema_problems = []
+    print(f"⚠️  Could not check the embeddings table schema: {e}")
+if schema_problems:
+    raise RuntimeError("The embeddings table needs migrating, run: python scripts/migrate_embeddings.py\n  - "
+                       + "\n  - ".join(schema_problems))
+
+# Build the /api/ask admission controller now so unreachable limits are reported at startup
+get_admission_controller()
+
+# Continue uploads interrupted by the last shutdown from their last completed stage. At import,
+# so WSGI servers resume them too; each job is claimed by one process
+get_ingestion_manager().resume_pending()
+
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
@@ -199,46 +234,19 @@ def check_kg_availability(document_id: str) -> bool:
     Returns:
         True if KG exists, False otherwise
     """
-    # Check in DATABASE first (new preferred method)
-    doc_id_int = KGRepository.get_document_id(document_id)
-    if doc_id_int:
-        from sqlalchemy import text
-        from database.connection import engine
-        with engine.connect() as conn:
-            result = conn.execute(text("""
-                SELECT COUNT(*) FROM kg_entities WHERE document_id = :doc_id
-            """), {"doc_id": doc_id_int})
-            count = result.scalar()
-            if count and count > 0:
-                return True
-    
-    # Check in DATA_DIR (legacy file-based storage)
-    kg_path_data = os.path.join(DATA_DIR, 'documents', document_id, 'knowledge_graph', 'knowledge_graph.json')
-    if os.path.exists(kg_path_data):
-        return True
-    
-    # Check in DOCUMENTS_FOLDER (new storage location)
-    kg_path_docs = os.path.join(DOCUMENTS_FOLDER, document_id, 'knowledge_graph', 'knowledge_graph.json')
-    if os.path.exists(kg_path_docs):
-        return True
+    # Database KG or legacy JSON files, from the cached document metadata
+    meta = get_document_meta(document_id)
+    if meta is not None:
+        return meta['has_kg']
     
-    return False
+    # Legacy JSON KG of a document that is not in the database
+    return json_kg_path(document_id) is not None
 
 
 def check_database_kg_available(document_id: str) -> bool:
     """Check if Database-backed KG is available (preferred over JSON)."""
-    doc_id_int = KGRepository.get_document_id(document_id)
-    if not doc_id_int:
-        return False
-    
-    from sqlalchemy import text
-    from database.connection import engine
-    with engine.connect() as conn:
-        result = conn.execute(text("""
-            SELECT COUNT(*) FROM kg_entities WHERE document_id = :doc_id
-        """), {"doc_id": doc_id_int})
-        count = result.scalar()
-        return count and count > 0
+    meta = get_document_meta(document_id)
+    return bool(meta and meta['has_db_kg'])
 
 def load_documents_index():
     """Load documents from database."""
@@ -260,12 +268,14 @@ def check_duplicate(file_hash):
         print(f"Error checking duplicate: {e}")
         return None
 
-def generate_document_id(filename):
-    """Generate a unique document ID from filename."""
+def generate_document_id(filename, reserved_ids=()):
+    """Generate a unique document ID from filename (also avoiding reserved_ids)."""
     base_name = os.path.splitext(filename)[0]
     doc_id = ''.join(c if c.isalnum() or c == '_' else '_' for c in base_name).lower()
     documents = load_documents_index()
     existing_ids = {doc['document_id'] for doc in documents}
+    # Ids of documents still being ingested are taken too
+    existing_ids |= set(reserved_ids)
     
     if doc_id not in existing_ids:
         return doc_id
@@ -275,6 +285,27 @@ def generate_document_id(filename):
         counter += 1
     return f"{doc_id}_{counter}"
 
+# Static system prompts: kept identical across requests (and ahead of the
+# retrieved context) so the backend can reuse the prompt prefix
+KG_SYSTEM_PROMPT = """You are an expert analyst answering questions using a Knowledge Graph.
+Relationships are shown as: EntityA --[RELATIONSHIP_TYPE]--> EntityB.
+Use the context to answer directly."""
+
+HYBRID_SYSTEM_PROMPT = """You are an expert analyst with access to both a Knowledge Graph (structured data) and Document Chunks (text).
+- Use KG data for specific relationships, ownership, and stats.
+- Use Textual Evidence for definitions, policies, and descriptions.
+- Synthesize both sources into a coherent answer."""
+
+VECTOR_SYSTEM_PROMPT = """Based on the information provided with the question, answer the question concisely and accurately."""
+
+DB_KG_SYSTEM_PROMPT = """Answer questions based on the Knowledge Graph relationships provided with the question.
+Answer based ONLY on the facts shown. Be specific and cite the relationships."""
+
+NO_EVIDENCE_ANSWER = "No relevant information found."
+
+DB_HYBRID_SYSTEM_PROMPT = """Answer questions using the information provided with the question.
+Use BOTH the Knowledge Graph facts AND the document text for a complete answer."""
+
 class QueryRouter:
     """Routes queries to appropriate RAG system based on intent"""
     def __init__(self):
@@ -317,7 +348,7 @@ class KnowledgeGraphRAG:
         self.graph_store = graph_store
         self.entity_map = entity_map
         self.entity_list = list(entity_map.values())
-        self.client = DeepSeekClient()
+        self.client = get_shared_client()
         self.formatter = AnswerFormatter()
 
     def retrieve_context(self, question):
@@ -382,18 +413,29 @@ class KnowledgeGraphRAG:
                     
         return "\n\n".join(context_parts) if context_parts else "No relevant entities found in Knowledge Graph."
 
-    def query(self, question):
+    def build_prompt(self, question):
+        """Returns (user_prompt, system_prompt)"""
         context = self.retrieve_context(question)
-        
-        system_prompt = """You are an expert analyst answering questions using a Knowledge Graph.
-        Relationships are shown as: EntityA --[RELATIONSHIP_TYPE]--> EntityB.
-        Use the context to answer directly."""
-        
         user_prompt = f"Context:\n{context}\n\nQuestion: {question}\n\nAnswer:"
-        
-        output = self.client.query(user_prompt, system_prompt)
+        return user_prompt, KG_SYSTEM_PROMPT
+
+    def evidence(self, question, budget=None):
+        """Retrieved context only, for degraded (no generation) answers"""
+        return self.retrieve_context(question)
+
+    def query(self, question, budget=None):
+        budget = budget or question_budget(question)
+        user_prompt, system_prompt = self.build_prompt(question)
+        output = self.client.query(user_prompt, system_prompt, budget['num_predict'], timeout=budget['timeout'])
         return self.formatter.format(output, question)
 
+    def query_stream(self, question, budget=None):
+        """Like query(), but yields answer text as it is generated"""
+        budget = budget or question_budget(question)
+        user_prompt, system_prompt = self.build_prompt(question)
+        deltas = self.client.query_stream(user_prompt, system_prompt, budget['num_predict'], timeout=budget['timeout'])
+        yield from self.formatter.format_stream(deltas, question)
+
 class HybridRAG:
     """Orchestrates KG and Vector RAG with simple keyword routing (fast, no mutex issues)"""
     def __init__(self, kg_rag, vector_rag):
@@ -407,7 +449,7 @@ class HybridRAG:
         self.client = vector_rag.client
         self.formatter = vector_rag.formatter
     
-    def query(self, question):
+    def _route(self, question):
         # Get routing decision from simple keyword-based router
         route = self.router.route(question)
         
@@ -415,37 +457,63 @@ class HybridRAG:
         
         if route == 'kg':
             print(f"  → Routing to KG: {question[:50]}...")
-            return self.kg_rag.query(question)
         elif route == 'vector':
             print(f"  → Routing to Vector: {question[:50]}...")
-            return self.vector_rag.query(question)
         else:
             # Hybrid - use both
             print(f"  → Routing to Hybrid (both): {question[:50]}...")
-            return self._execute_hybrid(question)
+        return route
     
-    def _execute_hybrid(self, question):
+    def query(self, question, budget=None):
+        budget = budget or question_budget(question)
+        route = self._route(question)
+        if route == 'kg':
+            return self.kg_rag.query(question, budget=budget)
+        elif route == 'vector':
+            return self.vector_rag.query(question, budget=budget)
+        return self._execute_hybrid(question, budget)
+    
+    def query_stream(self, question, budget=None):
+        """Like query(), but yields answer text as it is generated"""
+        budget = budget or question_budget(question)
+        route = self._route(question)
+        if route == 'kg':
+            yield from self.kg_rag.query_stream(question, budget=budget)
+        elif route == 'vector':
+            yield from self.vector_rag.query_stream(question, budget=budget)
+        else:
+            user_prompt, system_prompt = self._hybrid_prompt(question, budget['top_k'])
+            deltas = self.client.query_stream(user_prompt, system_prompt, budget['num_predict'], timeout=budget['timeout'])
+            yield from self.formatter.format_stream(deltas, question)
+    
+    def _execute_hybrid(self, question, budget):
         """Execute using both KG and Vector context"""
+        user_prompt, system_prompt = self._hybrid_prompt(question, budget['top_k'])
+        output = self.client.query(user_prompt, system_prompt, budget['num_predict'], timeout=budget['timeout'])
+        return self.formatter.format(output, question)
+    
+    def evidence(self, question, budget=None):
+        """Retrieved context only, for degraded (no generation) answers"""
+        budget = budget or question_budget(question)
+        return self._hybrid_context(question, budget['top_k']).strip()
+    
+    def _hybrid_context(self, question, top_k=5):
         kg_context = self.kg_rag.retrieve_context(question)
-        vec_context = self.vector_rag.retrieve_context(question)
+        vec_context = self.vector_rag.retrieve_context(question, top_k)
         
-        combined_context = f"""
+        return f"""
 [STRUCTURED DATA from Knowledge Graph]
 {kg_context}
 
 [TEXTUAL EVIDENCE from Document Chunks]
 {vec_context}
 """
-        
-        system_prompt = """You are an expert analyst with access to both a Knowledge Graph (structured data) and Document Chunks (text).
-- Use KG data for specific relationships, ownership, and stats.
-- Use Textual Evidence for definitions, policies, and descriptions.
-- Synthesize both sources into a coherent answer."""
-        
+    
+    def _hybrid_prompt(self, question, top_k=5):
+        """Returns (user_prompt, system_prompt) combining KG and Vector context"""
+        combined_context = self._hybrid_context(question, top_k)
         user_prompt = f"Context:\n{combined_context}\n\nQuestion: {question}\n\nAnswer:"
-        
-        output = self.client.query(user_prompt, system_prompt)
-        return self.formatter.format(output, question)
+        return user_prompt, HYBRID_SYSTEM_PROMPT
     
     def _execute_multi_step(self, original_question, queries):
         """Execute multiple sub-queries and synthesize results"""
@@ -495,31 +563,52 @@ Synthesized Answer:"""
 class VectorRAG:
     """Vector-based RAG using embeddings and cosine similarity from database"""
     
-    def __init__(self, doc_folder, document_id):
+    def __init__(self, doc_folder, document_id, search_backend=VECTOR_SEARCH_BACKEND):
         # Lazy import to avoid dependency issues at startup
         from utils.embedding_utils import get_embedding_model
         
         self.doc_folder = doc_folder  # Keep for compatibility
         self.document_id = document_id
-        self.client = DeepSeekClient()
+        self.search_backend = search_backend
+        self.client = get_shared_client()
         self.formatter = AnswerFormatter()
         
         # Get embedding model for query encoding
         self.model = get_embedding_model()
         
+        # Resident index loaded now, inside the registry build, so RAG_REGISTRY_MAX_INDEX_MB
+        # accounts for it before the instance is shared; searches only use this handle
+        self.index = None
+        if search_backend == 'memory':
+            from utils.vector_index import get_document_index
+            self.index = get_document_index(document_id)
+        
         print(f"Vector RAG initialized for document: {document_id}")
     
-    def retrieve_context(self, question, top_k=5):
-        """Retrieve relevant context chunks from database"""
-        # Encode question
-        question_embedding = self.model.encode([question], convert_to_numpy=True)[0]
-        
-        # Search using database
-        results = EmbeddingRepository.search_similar(
+    def search(self, question_embedding, top_k=5):
+        """Most similar chunks of the document, as EmbeddingRepository.search_similar result dicts"""
+        # Search resident index (loaded once per document), pgvector HNSW, or scan in database
+        if self.search_backend == 'memory':
+            from utils.vector_index import search_document
+            return search_document(question_embedding, self.document_id, top_k, index=self.index)
+        elif self.search_backend == 'pgvector':
+            return EmbeddingRepository.search_similar_pgvector(
+                query_embedding=question_embedding,
+                document_id=self.document_id,
+                top_k=top_k
+            )
+        return EmbeddingRepository.search_similar(
             query_embedding=question_embedding,
             document_id=self.document_id,
             top_k=top_k
         )
+    
+    def retrieve_context(self, question, top_k=5):
+        """Retrieve relevant context chunks from database"""
+        # Encode question (cached across requests and RAG modes)
+        from utils.embedding_utils import encode_query
+        question_embedding = encode_query(question)
+        results = self.search(question_embedding, top_k)
         
         # Build context from results
         context_parts = []
@@ -530,22 +619,30 @@ class VectorRAG:
         
         return "\n\n".join(context_parts)
     
-    def query(self, question, top_k=5):
-        """Answer question using vector similarity"""
-        context = self.retrieve_context(question, top_k)
-        
-        prompt = f"""Based on the following information, answer the question concisely and accurately.
-
-Context:
-{context}
-```
-            
-Question: {question}
-
-Answer:"""
-        
-        output = self.client.query(prompt, "")
+    def query(self, question, top_k=None, budget=None):
+        """Answer question using vector similarity (top_k defaults to the budget's)"""
+        budget = budget or question_budget(question)
+        user_prompt, system_prompt = self.build_prompt(question, top_k or budget['top_k'])
+        output = self.client.query(user_prompt, system_prompt, budget['num_predict'], timeout=budget['timeout'])
         return self.formatter.format(output, question)
+    
+    def query_stream(self, question, top_k=None, budget=None):
+        """Like query(), but yields answer text as it is generated"""
+        budget = budget or question_budget(question)
+        user_prompt, system_prompt = self.build_prompt(question, top_k or budget['top_k'])
+        deltas = self.client.query_stream(user_prompt, system_prompt, budget['num_predict'], timeout=budget['timeout'])
+        yield from self.formatter.format_stream(deltas, question)
+    
+    def build_prompt(self, question, top_k=5):
+        """Returns (user_prompt, system_prompt)"""
+        context = self.retrieve_context(question, top_k)
+        user_prompt = f"Context:\n{context}\n\nQuestion: {question}\n\nAnswer:"
+        return user_prompt, VECTOR_SYSTEM_PROMPT
+    
+    def evidence(self, question, budget=None):
+        """Retrieved chunks only, for degraded (no generation) answers"""
+        budget = budget or question_budget(question)
+        return self.retrieve_context(question, budget['top_k'])
 
 
 class DatabaseKGRAG:
@@ -556,8 +653,9 @@ class DatabaseKGRAG:
     
     def __init__(self, document_id: str):
         self.document_id = document_id
-        self.doc_id_int = KGRepository.get_document_id(document_id)
-        self.client = DeepSeekClient()
+        meta = get_document_meta(document_id)
+        self.doc_id_int = meta['id'] if meta else None
+        self.client = get_shared_client()
         self.formatter = AnswerFormatter()
         print(f"DatabaseKGRAG initialized for document: {document_id} (ID: {self.doc_id_int})")
     
@@ -588,7 +686,7 @@ class DatabaseKGRAG:
         
         return list(set(entity_candidates))
     
-    def retrieve_kg_context(self, question: str) -> str:
+    def retrieve_kg_context(self, question: str, max_entities: int = 5, max_facts: int = None) -> str:
         """Retrieve KG context for a question"""
         if not self.doc_id_int:
             return ""
@@ -599,28 +697,51 @@ class DatabaseKGRAG:
         # Get KG context
         context = KGRepository.get_kg_context_for_question(
             self.doc_id_int, 
-            search_terms
+            search_terms,
+            max_entities=max_entities,
+            max_facts=max_facts
         )
         
         return context
     
-    def query(self, question: str) -> str:
-        """Answer question using KG context only"""
-        kg_context = self.retrieve_kg_context(question)
+    NO_CONTEXT_ANSWER = "No relevant information found in Knowledge Graph."
+    
+    def build_prompt(self, question: str, budget: dict):
+        """(user_prompt, system_prompt), or None if the KG has nothing relevant"""
+        kg_context = self.retrieve_kg_context(question, budget['kg_entities'], budget['kg_facts'])
         
         if not kg_context:
-            return "No relevant information found in Knowledge Graph."
+            return None
         
-        prompt = f"""Based on the Knowledge Graph relationships below, answer the question.
-
-{kg_context}
-
-Question: {question}
-
-Answer based ONLY on the facts shown above. Be specific and cite the relationships."""
+        return f"{kg_context}\n\nQuestion: {question}\n\nAnswer:", DB_KG_SYSTEM_PROMPT
+    
+    def evidence(self, question: str, budget: dict = None) -> str:
+        """KG facts only, for degraded (no generation) answers"""
+        budget = budget or question_budget(question)
+        return self.retrieve_kg_context(question, budget['kg_entities'], budget['kg_facts'])
+    
+    def query(self, question: str, budget: dict = None) -> str:
+        """Answer question using KG context only"""
+        budget = budget or question_budget(question)
+        prompts = self.build_prompt(question, budget)
+        if prompts is None:
+            return self.NO_CONTEXT_ANSWER
         
-        output = self.client.query(prompt, "")
+        user_prompt, system_prompt = prompts
+        output = self.client.query(user_prompt, system_prompt, budget['num_predict'], timeout=budget['timeout'])
         return self.formatter.format(output, question)
+    
+    def query_stream(self, question: str, budget: dict = None):
+        """Like query(), but yields answer text as it is generated"""
+        budget = budget or question_budget(question)
+        prompts = self.build_prompt(question, budget)
+        if prompts is None:
+            yield self.NO_CONTEXT_ANSWER
+            return
+        
+        user_prompt, system_prompt = prompts
+        deltas = self.client.query_stream(user_prompt, system_prompt, budget['num_predict'], timeout=budget['timeout'])
+        yield from self.formatter.format_stream(deltas, question)
 
 
 class HybridDatabaseRAG:
@@ -629,24 +750,59 @@ class HybridDatabaseRAG:
     Uses BOTH vector similarity search AND knowledge graph traversal.
     """
     
-    def __init__(self, document_id: str, doc_folder: str = None):
+    def __init__(self, document_id: str, doc_folder: str = None, vector_rag: VectorRAG = None):
         self.document_id = document_id
-        self.vector_rag = VectorRAG(doc_folder, document_id)
+        self.vector_rag = vector_rag or VectorRAG(doc_folder, document_id)
         self.kg_rag = DatabaseKGRAG(document_id)
-        self.client = DeepSeekClient()
+        self.client = get_shared_client()
         self.formatter = AnswerFormatter()
         print(f"HybridDatabaseRAG initialized for: {document_id}")
     
-    def query(self, question: str, top_k: int = 5) -> str:
+    NO_CONTEXT_ANSWER = "No relevant information found."
+    
+    def query(self, question: str, top_k: int = None, budget: dict = None) -> str:
         """
         Answer question using BOTH vector search and KG traversal.
         Combines both contexts for comprehensive answers.
         """
+        budget = budget or question_budget(question)
+        prompts = self.build_prompt(question, budget, top_k)
+        if prompts is None:
+            return self.NO_CONTEXT_ANSWER
+        
+        user_prompt, system_prompt = prompts
+        output = self.client.query(user_prompt, system_prompt, budget['num_predict'], timeout=budget['timeout'])
+        return self.formatter.format(output, question)
+    
+    def query_stream(self, question: str, top_k: int = None, budget: dict = None):
+        """Like query(), but yields answer text as it is generated"""
+        budget = budget or question_budget(question)
+        prompts = self.build_prompt(question, budget, top_k)
+        if prompts is None:
+            yield self.NO_CONTEXT_ANSWER
+            return
+        
+        user_prompt, system_prompt = prompts
+        deltas = self.client.query_stream(user_prompt, system_prompt, budget['num_predict'], timeout=budget['timeout'])
+        yield from self.formatter.format_stream(deltas, question)
+    
+    def build_prompt(self, question: str, budget: dict, top_k: int = None):
+        """(user_prompt, system_prompt) with both contexts, or None if neither source has any"""
+        combined_context = self.evidence(question, budget, top_k)
+        if not combined_context:
+            return None
+        
+        return f"{combined_context}\n\nQuestion: {question}\n\nAnswer:", DB_HYBRID_SYSTEM_PROMPT
+    
+    def evidence(self, question: str, budget: dict = None, top_k: int = None) -> str:
+        """KG facts and document chunks, also used alone for degraded (no generation) answers"""
+        budget = budget or question_budget(question)
+        
         # Get vector context (semantic similarity)
-        vector_context = self.vector_rag.retrieve_context(question, top_k)
+        vector_context = self.vector_rag.retrieve_context(question, top_k or budget['top_k'])
         
         # Get KG context (structured relationships)
-        kg_context = self.kg_rag.retrieve_kg_context(question)
+        kg_context = self.kg_rag.retrieve_kg_context(question, budget['kg_entities'], budget['kg_facts'])
         
         # Combine contexts
         combined_context = ""
@@ -657,20 +813,7 @@ class HybridDatabaseRAG:
         if vector_context:
             combined_context += f"FROM DOCUMENT TEXT:\n{vector_context}"
         
-        if not combined_context.strip():
-            return "No relevant information found."
-        
-        prompt = f"""Answer the question using the information below. 
-Use BOTH the Knowledge Graph facts AND the document text for a complete answer.
-
-{combined_context}
-
-Question: {question}
-
-Answer:"""
-        
-        output = self.client.query(prompt, "")
-        return self.formatter.format(output, question)
+        return combined_context.strip()
 
 @app.route('/')
 def index():
@@ -684,20 +827,24 @@ def simple():
 def list_documents():
     """Get all documents from database with KG availability status."""
     try:
-        documents = DocumentRepository.get_all()
-        
-        # Add has_kg field to each document
-        for doc in documents:
-            doc['has_kg'] = check_kg_availability(doc['document_id'])
+        # One aggregated query, cached until a document changes
+        documents, etag = get_document_meta_cache().listing()
         
-        return jsonify({'documents': documents})
+        # Polling clients revalidate with If-None-Match; unchanged -> 304, no body
+        if request.if_none_match.contains(etag):
+            response = Response(status=304)
+        else:
+            response = jsonify({'documents': documents})
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
     except Exception as e:
         print(f"Error listing documents: {e}")
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/upload', methods=['POST'])
 def upload_and_process():
-    """Upload and process PDF document - saves to database"""
+    """Upload a PDF and queue it for background processing; returns 202 with a job id"""
     if 'file' not in request.files:
         return jsonify({'error': 'No file provided'}), 400
     
@@ -711,7 +858,8 @@ def upload_and_process():
     
     try:
         filename = secure_filename(file.filename)
-        filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
+        # Unique per upload: a later upload with the same name must not replace a queued job's input
+        filepath = os.path.join(app.config['UPLOAD_FOLDER'], f"{uuid.uuid4().hex[:16]}_{filename}")
         file.save(filepath)
         
         print(f"File uploaded: {filename}")
@@ -729,98 +877,32 @@ def upload_and_process():
                 'existing_document': duplicate
             }), 409
         
-        # Generate document ID
-        document_id = generate_document_id(filename)
+        # Same file already being processed: point the client at that job
+        ingestion = get_ingestion_manager()
+        active = ingestion.find_active(file_hash)
+        if active:
+            os.remove(filepath)
+            return jsonify({
+                'error': 'Duplicate file',
+                'message': f'This document is already being processed as "{active["document_id"]}"',
+                'job': active
+            }), 409
+        
+        # Extraction, embedding and inserts run on the ingestion workers; the document ID
+        # is picked and reserved atomically with creating the job
+        job = ingestion.submit(filename, filepath, file_hash,
+                               lambda reserved_ids: generate_document_id(filename, reserved_ids))
+        document_id = job['document_id']
         doc_folder = os.path.join(app.config['DOCUMENTS_FOLDER'], document_id)
         os.makedirs(doc_folder, exist_ok=True)
         
-        print(f"Processing document: {document_id}")
-        
-        # Extract pages
-        pages = extract_pages(filepath)
-        
-        # Detect chapters and build chunks
-        from utils.text_utils import detect_chapters, build_chunks
-        chapters = detect_chapters(pages)
-        chunks = build_chunks(pages, chapters)
-        
-        print(f"Extracted {len(chunks)} chunks from {len(pages)} pages")
-        
-        # Generate embeddings
-        from utils.embedding_utils import get_embedding_model
-        model = get_embedding_model()
-        chunk_texts = [c['text'] for c in chunks]
-        embeddings_array = model.encode(chunk_texts, convert_to_numpy=True, show_progress_bar=True)
-        
-        print(f"Generated embeddings for {len(embeddings_array)} chunks")
-        
-        # Create document in database
-        doc_data = {
-            'document_id': document_id,
-            'filename': filename,
-            'display_name': os.path.splitext(filename)[0].replace('_', ' ').title(),
-            'file_hash': file_hash,
-            'file_path': filepath,
-            'total_pages': len(pages),
-            'total_chunks': len(chunks),
-            'doc_metadata': {
-                'total_chapters': len(chapters),
-                'upload_date': datetime.now().isoformat()
-            }
-        }
-        
-        doc_result = DocumentRepository.create(doc_data)
-        doc_db_id = doc_result['id']
-        
-        print(f"Created document in database: ID={doc_db_id}")
-        
-        # Prepare chunks for bulk insert
-        chunks_data = []
-        for idx, chunk in enumerate(chunks):
-            chunks_data.append({
-                'document_id': doc_db_id,
-                'chunk_index': idx,
-                'text': chunk['text'],
-                'page_number': chunk.get('page_number'),
-                'word_count': len(chunk['text'].split()),
-                'chunk_metadata': {
-                    'page_numbers': chunk.get('page_numbers', []),
-                    'chapter': chunk.get('chapter', '')
-                }
-            })
-        
-        # Bulk insert chunks
-        chunk_ids = ChunkRepository.create_many(chunks_data)
-        print(f"Inserted {len(chunk_ids)} chunks")
-        
-        # Prepare embeddings for bulk insert
-        embeddings_data = []
-        for chunk_id, embedding in zip(chunk_ids, embeddings_array):
-            embeddings_data.append({
-                'chunk_id': chunk_id,
-                'embedding': embedding.tolist(),
-                'model_name': 'all-MiniLM-L6-v2'
-            })
-        
-        # Bulk insert embeddings
-        emb_count = EmbeddingRepository.create_many(embeddings_data)
-        print(f"Inserted {emb_count} embeddings")
-        
-        # Update document with final counts
-        DocumentRepository.update(document_id, {
-            'total_chunks': len(chunks),
-            'processed_at': datetime.now()
-        })
-        
-        print(f"Document processed successfully: {document_id}")
-        
-        # Return document metadata
-        final_doc = DocumentRepository.get_by_id(document_id)
-        
         return jsonify({
-            'document': final_doc,
-            'message': f'Successfully processed {filename} ({len(chunks)} chunks, {len(pages)} pages)'
-        })
+            'job_id': job['job_id'],
+            'document_id': document_id,
+            'status_url': f"/api/jobs/{job['job_id']}",
+            'job': job,
+            'message': f'Processing {filename} in the background'
+        }), 202
     
     except Exception as e:
         import traceback
@@ -830,20 +912,108 @@ def upload_and_process():
             'traceback': traceback.format_exc()
         }), 500
 
-# Initialize global RAG instances - now track which document they're for
-rag_instances = {
-    'kg_rag': None,
-    'vector_rag': None,
-    'hybrid_rag': None,
-    'current_document_id': None  # Track which document the RAG is initialized for
-}
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """Ingestion job status: stage, progress, per-stage timings and, when done, the document"""
+    job = get_ingestion_manager().get(job_id)
+    if job is None:
+        return jsonify({'error': 'Unknown job'}), 404
+    
+    if job['status'] == 'done':
+        job['document'] = DocumentRepository.get_by_id(job['document_id'])
+    return jsonify({'job': job})
+
+@app.route('/api/search', methods=['POST'])
+def search_chunks():
+    """Semantic chunk search within one document, or across all documents if none given"""
+    data = request.get_json(silent=True) or {}
+    question = str(data.get('question') or '').strip()
+    document_id = str(data.get('document_id') or '').strip() or None
+    
+    if not question:
+        return jsonify({'error': 'No question provided'}), 400
+    
+    try:
+        top_k = int(data.get('top_k', DEFAULT_TOP_K))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'top_k must be an integer'}), 400
+    if top_k < 1:
+        return jsonify({'error': 'top_k must be at least 1'}), 400
+    
+    try:
+        from utils.embedding_utils import encode_query
+        question_embedding = encode_query(question)
+        
+        if document_id is None:
+            # Corpus-wide through the IVF index
+            results = EmbeddingRepository.search_similar(question_embedding, None, top_k)
+        else:
+            if get_document_meta(document_id) is None:
+                return jsonify({'error': f"Document '{document_id}' not found"}), 404
+            # The registry's VectorRAG, as in /api/ask, so its resident index counts against the budget
+            doc_folder = os.path.join(app.config['DOCUMENTS_FOLDER'], document_id)
+            vector_rag = get_rag_registry().get(document_id, 'vector', lambda: VectorRAG(doc_folder, document_id))
+            results = vector_rag.search(question_embedding, top_k)
+        return jsonify({'results': results, 'scope': document_id or 'corpus'})
+    except Exception as e:
+        print(f"Error searching chunks: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/metrics', methods=['GET'])
+def get_metrics():
+    """Runtime cache counters"""
+    from utils.query_cache import get_query_cache
+    from utils.http_pool import get_http_pool
+    from utils.llm_cache import get_llm_cache
+    from utils.single_flight import get_single_flight
+    from utils.llm_scheduler import get_llm_scheduler
+    metrics = {
+        'query_embedding_cache': get_query_cache().stats(),
+        'llm_http': get_http_pool().stats(),
+        'llm_cache': get_llm_cache().stats(),
+        'llm_single_flight': get_single_flight().stats(),
+        'llm_scheduler': get_llm_scheduler().stats(),
+        'ask_admission': get_admission_controller().stats(),
+        'rag_registry': get_rag_registry().stats(),
+        'document_meta': get_document_meta_cache().stats(),
+        'ingestion': get_ingestion_manager().stats()
+    }
+    from utils.llm_cassette import get_cassette
+    if get_cassette() is not None:
+        metrics['llm_cassette'] = get_cassette().stats()
+    if USE_ENCODING_SERVICE:
+        from utils.encoding_service import get_encoding_service
+        metrics['encoding_service'] = get_encoding_service().stats()
+    return jsonify(metrics)
+
+def load_json_kg_rag(document_id: str, doc_folder: str) -> KnowledgeGraphRAG:
+    """Build KnowledgeGraphRAG from the legacy JSON knowledge graph files"""
+    # Try DATA_DIR first (legacy), then DOCUMENTS_FOLDER
+    kg_path = os.path.join(DATA_DIR, 'documents', document_id, 'knowledge_graph', 'knowledge_graph.json')
+    kg_folder = os.path.join(DATA_DIR, 'documents', document_id, 'knowledge_graph')
+    if not os.path.exists(kg_path):
+        kg_path = os.path.join(doc_folder, 'knowledge_graph', 'knowledge_graph.json')
+        kg_folder = os.path.join(doc_folder, 'knowledge_graph')
+    
+    # Load entity map
+    entities_path = os.path.join(kg_folder, 'entities_enriched.json')
+    with open(entities_path, 'r') as f:
+        entities = json.load(f)
+        entity_map = {e['name'].lower(): e for e in entities}
+    
+    graph_store = GraphStore.load(kg_path)
+    return KnowledgeGraphRAG(graph_store, entity_map)
 
 @app.route('/api/ask', methods=['POST'])
 def ask_question():
-    data = request.json
-    question = data.get('question', '').strip()
-    document_id = data.get('document_id', '').strip()
-    rag_mode = data.get('rag_mode', 'auto').strip().lower()  # explicit 'kg', 'vector' or 'auto'/'hybrid'
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({'error': 'Request body must be a JSON object'}), 400
+    question = str(data.get('question') or '').strip()
+    document_id = str(data.get('document_id') or '').strip()
+    rag_mode = str(data.get('rag_mode') or 'auto').strip().lower()  # explicit 'kg', 'vector' or 'auto'/'hybrid'
+    no_cache = bool(data.get('no_cache'))  # skip the LLM response cache for this request
+    priority = str(data.get('priority') or INTERACTIVE).strip().lower()  # scheduler class, e.g. 'evaluation' for eval scripts
     
     print(f"\n{'='*50}\n🔔 BACKEND RECEIVED QUESTION: {question}\n📄 DOCUMENT ID: {document_id}\n🔧 RAG MODE: {rag_mode.upper()}\n{'='*50}\n", flush=True)
     
@@ -853,30 +1023,47 @@ def ask_question():
     if not document_id:
         return jsonify({'error': 'No document selected'}), 400
     
+    if priority not in PRIORITIES:
+        return jsonify({'error': f"Unknown priority '{priority}'"}), 400
+    
+    # Bounded admission: shed load with a fast 429 instead of queueing threads on the LLM
+    admission = get_admission_controller()
+    ticket = admission.acquire()
+    if ticket is None:
+        retry_after = admission.retry_after()
+        print(f"🚦 Shed question (server busy, retry after {retry_after}s)", flush=True)
+        busy = {"type": "busy", "msg": "Server is busy answering other questions. Please retry shortly.", "retry_after": retry_after}
+        return Response(json.dumps(busy) + "\n", status=429, mimetype='application/x-ndjson',
+                        headers={'Retry-After': str(retry_after)})
+    
     def generate():
-        global rag_instances
         nonlocal rag_mode  # Allow reassignment of rag_mode for fallback
         
         try:
             doc_folder = os.path.join(app.config['DOCUMENTS_FOLDER'], document_id)
+            # Shared per-document instances, built once and never mutated per request
+            registry = get_rag_registry()
             
-            # CRITICAL FIX: Check if document changed - if so, reset all RAG instances
-            if rag_instances['current_document_id'] != document_id:
-                print(f"🔄 Document changed: {rag_instances['current_document_id']} -> {document_id}", flush=True)
-                rag_instances['kg_rag'] = None
-                rag_instances['vector_rag'] = None
-                rag_instances['hybrid_rag'] = None
-                rag_instances['current_document_id'] = document_id
+            # Check KG availability first so a KG-mode fallback still gets a VectorRAG
+            kg_available = check_kg_availability(document_id)
+            db_kg_available = check_database_kg_available(document_id)
+            
+            if rag_mode in ['kg', 'auto', 'hybrid'] and not kg_available:
+                # Graceful fallback: KG not available, switch to vector mode
+                print(f"⚠️ KG not available for {document_id}, falling back to Vector mode", flush=True)
+                yield json.dumps({"type": "warning", "msg": "Knowledge Graph not available for this document. Using Vector search instead."}) + "\n"
+                rag_mode = 'vector'
             
             # Initialize Vector RAG for current document
+            vector_rag = None
             if rag_mode in ['vector', 'auto', 'hybrid']:
                 yield json.dumps({"type": "status", "msg": f"Loading data for {document_id}..."}) + "\n"
                 
                 # DEBUG: Check what document_id we received
                 print(f"🔍 DEBUG: Looking up document_id = '{document_id}'", flush=True)
                 
-                # Check if document exists in database
-                doc = DocumentRepository.get_by_id(document_id)
+                # Check if document exists in database (cached metadata, no query when warm)
+                doc = get_document_meta(document_id)
                 
                 # DEBUG: Log the result
                 print(f"📊 DEBUG: Document lookup result = {doc}", flush=True)
@@ -895,79 +1082,51 @@ def ask_question():
                 
                 print(f"✅ Found document: {doc['display_name']} ({doc['total_chunks']} chunks)", flush=True)
                 
-                # Create or reuse VectorRAG instance
-                if rag_instances['vector_rag'] is None:
-                    rag_instances['vector_rag'] = VectorRAG(doc_folder, document_id)
-                    print(f"✅ Initialized VectorRAG for: {document_id}", flush=True)
-
-            # Initialize KG RAG if needed (only if not already initialized for this document)
-            kg_available = check_kg_availability(document_id)
-            db_kg_available = check_database_kg_available(document_id)
-            original_rag_mode = rag_mode  # Remember original mode for logging
+                vector_rag = registry.get(document_id, 'vector', lambda: VectorRAG(doc_folder, document_id))
             
-            if rag_mode in ['kg', 'auto', 'hybrid'] and not kg_available:
-                # Graceful fallback: KG not available, switch to vector mode
-                print(f"⚠️ KG not available for {document_id}, falling back to Vector mode", flush=True)
-                yield json.dumps({"type": "warning", "msg": "Knowledge Graph not available for this document. Using Vector search instead."}) + "\n"
-                rag_mode = 'vector'
+            if rag_mode == 'vector':
+                rag = vector_rag
             
             # PRIORITY: Use Database KG if available (new HybridDatabaseRAG)
-            if db_kg_available and rag_mode in ['kg', 'auto', 'hybrid']:
+            elif db_kg_available:
                 yield json.dumps({"type": "status", "msg": "Loading Knowledge Graph from database..."}) + "\n"
                 
-                if rag_instances.get('db_hybrid_rag') is None:
-                    rag_instances['db_hybrid_rag'] = HybridDatabaseRAG(document_id, doc_folder)
-                    print(f"✅ Initialized HybridDatabaseRAG for: {document_id}", flush=True)
-                
-                # Use db_hybrid_rag for hybrid/auto modes
-                if rag_mode in ['auto', 'hybrid']:
-                    rag_instances['hybrid_rag'] = rag_instances['db_hybrid_rag']
-                
-                # For kg-only mode, create DatabaseKGRAG instance
-                if rag_mode == 'kg' and rag_instances.get('kg_rag') is None:
-                    rag_instances['kg_rag'] = DatabaseKGRAG(document_id)
+                if rag_mode == 'kg':
+                    rag = registry.get(document_id, 'db_kg', lambda: DatabaseKGRAG(document_id))
+                else:
+                    # 'auto' or 'hybrid', sharing this document's VectorRAG
+                    rag = registry.get(document_id, 'db_hybrid',
+                                       lambda: HybridDatabaseRAG(document_id, doc_folder, vector_rag))
             
             # FALLBACK: Legacy JSON-based KG
-            elif rag_instances['kg_rag'] is None and rag_mode in ['kg', 'auto', 'hybrid'] and kg_available and not db_kg_available:
-                 yield json.dumps({"type": "status", "msg": "Initializing Knowledge Graph (JSON)..."}) + "\n"
-                 
-                 # Try DATA_DIR first (legacy), then DOCUMENTS_FOLDER
-                 kg_path = os.path.join(DATA_DIR, 'documents', document_id, 'knowledge_graph', 'knowledge_graph.json')
-                 kg_folder = os.path.join(DATA_DIR, 'documents', document_id, 'knowledge_graph')
-                 if not os.path.exists(kg_path):
-                     kg_path = os.path.join(doc_folder, 'knowledge_graph', 'knowledge_graph.json')
-                     kg_folder = os.path.join(doc_folder, 'knowledge_graph')
-                 
-                 # Load entity map
-                 entities_path = os.path.join(kg_folder, 'entities_enriched.json')
-                 with open(entities_path, 'r') as f:
-                    entities = json.load(f)
-                    entity_map = {e['name'].lower(): e for e in entities}
-                 
-                 graph_store = GraphStore.load(kg_path)
-                 rag_instances['kg_rag'] = KnowledgeGraphRAG(graph_store, entity_map)
-                 print(f"✅ Initialized KnowledgeGraphRAG (JSON) for: {document_id}", flush=True)
-                 
-                 # Initialize legacy Hybrid RAG
-                 if rag_instances['hybrid_rag'] is None and rag_mode in ['auto', 'hybrid']:
-                     if rag_instances['kg_rag'] is not None and rag_instances['vector_rag'] is not None:
-                         rag_instances['hybrid_rag'] = HybridRAG(rag_instances['kg_rag'], rag_instances['vector_rag'])
-                         print(f"✅ Initialized HybridRAG (Legacy) for: {document_id}", flush=True)
-
-            
-            # Execute Query
-            yield json.dumps({"type": "status", "msg": f"Analyzing query (Mode: {rag_mode})..."}) + "\n"
-            
-            answer = ""
-            if rag_mode == 'vector':
-                answer = rag_instances['vector_rag'].query(question)
-            elif rag_mode == 'kg':
-                answer = rag_instances['kg_rag'].query(question)
             else:
-                # 'auto' or 'hybrid'
-                answer = rag_instances['hybrid_rag'].query(question)
+                yield json.dumps({"type": "status", "msg": "Loading Knowledge Graph (JSON)..."}) + "\n"
                 
-            yield json.dumps({"type": "token", "content": answer}) + "\n"
+                kg_rag = registry.get(document_id, 'json_kg', lambda: load_json_kg_rag(document_id, doc_folder))
+                if rag_mode == 'kg':
+                    rag = kg_rag
+                else:
+                    rag = registry.get(document_id, 'json_hybrid', lambda: HybridRAG(kg_rag, vector_rag))
+            
+            # Execute Query - classify once; the class sets num_predict, timeout and context size
+            budget = question_budget(question)
+            print(f"📏 Complexity: {budget['complexity']} (num_predict={budget['num_predict']}, timeout={budget['timeout']}s)", flush=True)
+            yield json.dumps({"type": "status", "msg": f"Analyzing query (Mode: {rag_mode}, {budget['complexity']})..."}) + "\n"
+            
+            # Degraded mode: LLM queue too deep - answer with the retrieved evidence, no generation
+            # (interactive only; evaluation runs need real answers)
+            if priority == INTERACTIVE and admission.should_degrade():
+                print("🪫 LLM overloaded, returning evidence only", flush=True)
+                yield json.dumps({"type": "warning", "msg": "The answer model is busy. Showing the most relevant evidence without a generated summary."}) + "\n"
+                evidence = rag.evidence(question, budget=budget) or NO_EVIDENCE_ANSWER
+                yield json.dumps({"type": "token", "content": f"**Relevant evidence (no generated answer):**\n\n{evidence}"}) + "\n"
+                yield json.dumps({"type": "done", "degraded": True}) + "\n"
+                return
+            
+            # Forward each token delta as soon as the model produces it
+            with llm_priority(priority), (bypass_llm_cache() if no_cache else nullcontext()):
+                for delta in rag.query_stream(question, budget=budget):
+                    yield json.dumps({"type": "token", "content": delta}) + "\n"
             yield json.dumps({"type": "done"}) + "\n"
 
         except Exception as e:
@@ -975,9 +1134,22 @@ def ask_question():
             traceback.print_exc()
             yield json.dumps({"type": "error", "msg": str(e)}) + "\n"
 
-    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+    response = Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+    # Frees the slot when the stream ends or the client disconnects (even before the first chunk)
+    response.call_on_close(ticket.release)
+    return response
+
+def warm_up_llm():
+    """Load the model and prefill the most common system prompt before the first question"""
+    try:
+        get_shared_client().warm_up(VECTOR_SYSTEM_PROMPT)
+    except Exception as e:
+        print(f"⚠️  LLM warm-up failed: {e}")
 
 if __name__ == '__main__':
     print("Server starting (Hybrid RAG Mode)...")
+    if LLM_WARMUP_ON_STARTUP:
+        # Background thread so the server accepts requests while the model loads
+        threading.Thread(target=warm_up_llm, daemon=True).start()
     # Disable debug/reloader to prevent mutex lock issues on Apple Silicon
     app.run(debug=False, host='0.0.0.0', port=5000, threaded=True, use_reloader=False)
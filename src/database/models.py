@@ -1,11 +1,14 @@
 """
 SQLAlchemy ORM models for database tables
 """
-from sqlalchemy import Column, Integer, String, Text, TIMESTAMP, ForeignKey
+from sqlalchemy import Column, Integer, String, Text, TIMESTAMP, ForeignKey, LargeBinary
 from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.ext.declarative import declarative_base
+from pgvector.sqlalchemy import Vector
 from datetime import datetime
 
+from utils.config import EMBEDDING_DIM, VECTOR_SEARCH_BACKEND
+
 Base = declarative_base()
 
 class Document(Base):
@@ -98,8 +101,18 @@ class Embedding(Base):
     id = Column(Integer, primary_key=True)
     chunk_id = Column(Integer, ForeignKey('chunks.id', ondelete='CASCADE'), nullable=False)
     
-    # Store as JSONB array (384 floats)
-    embedding = Column(JSONB, nullable=False)
+    # Store as JSONB array (384 floats) - legacy format
+    embedding = Column(JSONB)
+    
+    # Or as raw little-endian bytes ('float16' / 'float32'), see utils.embedding_codec
+    embedding_blob = Column(LargeBinary)
+    embedding_dtype = Column(String(10))
+    
+    # Native pgvector copy, searched through the HNSW index. Mapped only for the pgvector
+    # backend, so databases without the column (scripts/migrate_embeddings.py adds it)
+    # work with the others
+    if VECTOR_SEARCH_BACKEND == 'pgvector':
+        embedding_vector = Column(Vector(EMBEDDING_DIM))
     
     model_name = Column(String(100), default='all-MiniLM-L6-v2')
     created_at = Column(TIMESTAMP, default=datetime.now)
@@ -42,3 +42,12 @@ class ChunkRepository:
             return db.query(Chunk).join(Document).filter(
                 Document.document_id == document_id
             ).count()
+    
+    @staticmethod
+    def get_by_ids(chunk_ids):
+        """Get chunks by primary key, keyed by chunk id"""
+        if not chunk_ids:
+            return {}
+        with get_db() as db:
+            chunks = db.query(Chunk).filter(Chunk.id.in_(list(chunk_ids))).all()
+            return {c.id: c.to_dict() for c in chunks}
@@ -1,8 +1,10 @@
 """
 Repository for Document operations
 """
+from sqlalchemy import func, text
 from database.connection import get_db
 from database.models import Document
+from database.kg_models import KGEntity
 
 class DocumentRepository:
     
@@ -24,6 +26,24 @@ class DocumentRepository:
             docs = db.query(Document).order_by(Document.created_at.desc()).all()
             return [doc.to_dict() for doc in docs]
     
+    @staticmethod
+    def get_all_with_kg_counts():
+        """Get all documents with their kg_entities count (one query, no per-document lookups)"""
+        with get_db() as db:
+            counts = (db.query(KGEntity.document_id, func.count(KGEntity.id).label('kg_entity_count'))
+                      .group_by(KGEntity.document_id)
+                      .subquery())
+            rows = (db.query(Document, func.coalesce(counts.c.kg_entity_count, 0))
+                    .outerjoin(counts, counts.c.document_id == Document.id)
+                    .order_by(Document.created_at.desc())
+                    .all())
+            documents = []
+            for doc, kg_entity_count in rows:
+                result = doc.to_dict()
+                result['kg_entity_count'] = kg_entity_count
+                documents.append(result)
+            return documents
+    
     @staticmethod
     def get_by_id(document_id):
         """Get document by document_id"""
@@ -35,6 +55,24 @@ class DocumentRepository:
                 return result
             return None
     
+    @staticmethod
+    def get_metadata(document_id):
+        """
+        Ids, chunk count, KG counts and embedding model in one round trip
+        (what /api/ask needs before retrieval), or None if not found
+        """
+        with get_db() as db:
+            row = db.execute(text("""
+                SELECT d.id, d.document_id, d.display_name, d.total_chunks,
+                       (SELECT COUNT(*) FROM kg_entities k WHERE k.document_id = d.id) AS kg_entities,
+                       (SELECT COUNT(*) FROM claims c WHERE c.document_id = d.id) AS kg_claims,
+                       (SELECT e.model_name FROM embeddings e JOIN chunks ch ON e.chunk_id = ch.id
+                         WHERE ch.document_id = d.id LIMIT 1) AS embedding_model
+                FROM documents d
+                WHERE d.document_id = :doc_id
+            """), {"doc_id": document_id}).mappings().first()
+            return dict(row) if row else None
+    
     @staticmethod
     def get_by_hash(file_hash):
         """Check if document with hash exists"""
@@ -1,18 +1,94 @@
 """
-Repository for Embedding operations (using JSONB instead of pgvector)
+Repository for Embedding operations (JSONB or binary storage with a native pgvector copy)
 """
+from sqlalchemy import text
+from sqlalchemy.exc import DBAPIError
 from database.connection import get_db  
 from database.models import Embedding
+from utils.config import EMBEDDING_MODEL_NAME, EMBEDDING_STORAGE_FORMAT, PGVECTOR_EF_SEARCH, PGVECTOR_ITERATIVE_SCAN
+from utils.embedding_codec import is_binary_format, encode_embedding, decode_embedding, decode_matrix
 import numpy as np
-import json
+
+
+def to_vector_literal(embedding):
+    """Format a vector as a pgvector text literal: '[0.1,0.2,...]'"""
+    return '[' + ','.join(f'{float(x):.7g}' for x in embedding) + ']'
+
 
 class EmbeddingRepository:
     
+    # Set once pgvector has rejected hnsw.iterative_scan (logged the first time only)
+    _iterative_scan_unsupported = False
+    
+    @staticmethod
+    def _with_vector(data):
+        """Fill the pgvector column from the JSONB embedding if not given (dropped when it is not mapped)"""
+        if not hasattr(Embedding, 'embedding_vector'):
+            return {key: value for key, value in data.items() if key != 'embedding_vector'}
+        if 'embedding_vector' not in data and data.get('embedding') is not None:
+            data = dict(data, embedding_vector=data['embedding'])
+        return data
+    
+    @staticmethod
+    def build_rows(chunk_ids, embeddings_array, model_name=EMBEDDING_MODEL_NAME,
+                   storage_format=EMBEDDING_STORAGE_FORMAT):
+        """
+        Prepare embedding rows for create_many in the configured storage format
+        
+        Args:
+            chunk_ids: chunk ids, aligned with embeddings_array
+            embeddings_array: (n, dim) numpy array
+            model_name: embedding model name
+            storage_format: 'jsonb', 'float16' or 'float32'
+        
+        Returns:
+            List of dicts ready for Embedding(**data)
+        """
+        rows = []
+        for chunk_id, embedding in zip(chunk_ids, embeddings_array):
+            row = {
+                'chunk_id': chunk_id,
+                'embedding_vector': embedding,
+                'model_name': model_name
+            }
+            if is_binary_format(storage_format):
+                row['embedding_blob'] = encode_embedding(embedding, storage_format)
+                row['embedding_dtype'] = storage_format
+            else:
+                row['embedding'] = embedding.tolist()
+            rows.append(row)
+        return rows
+    
+    @staticmethod
+    def schema_problems():
+        """
+        Ways the embeddings table is older than the configured storage format and
+        search backend (empty list if none); scripts/migrate_embeddings.py fixes them
+        """
+        with get_db() as db:
+            rows = db.execute(text("""
+                SELECT column_name, is_nullable FROM information_schema.columns
+                WHERE table_name = 'embeddings'
+            """)).fetchall()
+        if not rows:
+            return []  # No table yet: database/schema.sql creates the current one
+        
+        nullable = {name: flag == 'YES' for name, flag in rows}
+        problems = []
+        if 'embedding_blob' not in nullable or 'embedding_dtype' not in nullable:
+            problems.append("embeddings.embedding_blob / embedding_dtype do not exist")
+        if is_binary_format(EMBEDDING_STORAGE_FORMAT) and not nullable.get('embedding', True):
+            problems.append(f"embeddings.embedding is NOT NULL, but EMBEDDING_STORAGE_FORMAT = "
+                            f"'{EMBEDDING_STORAGE_FORMAT}' stores rows without it")
+        if hasattr(Embedding, 'embedding_vector') and 'embedding_vector' not in nullable:
+            problems.append("embeddings.embedding_vector does not exist (VECTOR_SEARCH_BACKEND = 'pgvector')")
+        return problems
+    
     @staticmethod
     def create(embedding_data):
         """Create a new embedding"""
         with get_db() as db:
-            emb = Embedding(**embedding_data)
+            emb = Embedding(**EmbeddingRepository._with_vector(embedding_data))
             db.add(emb)
             db.flush()
             return emb.id
@@ -21,59 +97,217 @@ class EmbeddingRepository:
     def create_many(embeddings_data):
         """Bulk insert embeddings"""
         with get_db() as db:
-            embeddings = [Embedding(**data) for data in embeddings_data]
+            embeddings = [Embedding(**EmbeddingRepository._with_vector(data)) for data in embeddings_data]
             db.bulk_save_objects(embeddings)
             db.flush()
             return len(embeddings)
     
     @staticmethod
-    def search_similar(query_embedding, document_id, top_k=5):
+    def get_document_embeddings(document_id):
+        """
+        Load every embedding of a document in chunk order
+        
+        Args:
+            document_id: document_id to load
+        
+        Returns:
+            Tuple of (chunk_ids list, (n, dim) float32 numpy array)
+        """
+        with get_db() as db:
+            # Only fetch (and parse) JSONB for rows without a binary copy
+            rows = db.execute(text("""
+                SELECT e.chunk_id, e.embedding_blob, e.embedding_dtype,
+                       CASE WHEN e.embedding_blob IS NULL THEN e.embedding END
+                FROM embeddings e
+                JOIN chunks c ON c.id = e.chunk_id
+                JOIN documents d ON d.id = c.document_id
+                WHERE d.document_id = :doc_id
+                ORDER BY c.chunk_index
+            """), {"doc_id": document_id}).fetchall()
+        
+        return [r[0] for r in rows], EmbeddingRepository._decode_rows(rows)
+    
+    @staticmethod
+    def get_embedded_chunk_ids(document_id):
+        """
+        documents.total_chunks and the ids of the document's chunks that have an embedding
+        
+        Returns:
+            Tuple of (total_chunks or None if the document does not exist, chunk_ids list)
+        """
+        with get_db() as db:
+            total_chunks = db.execute(
+                text("SELECT total_chunks FROM documents WHERE document_id = :doc_id"),
+                {"doc_id": document_id}
+            ).scalar()
+            if total_chunks is None:
+                return None, []
+            chunk_ids = db.execute(text("""
+                SELECT e.chunk_id
+                FROM embeddings e
+                JOIN chunks c ON c.id = e.chunk_id
+                JOIN documents d ON d.id = c.document_id
+                WHERE d.document_id = :doc_id
+            """), {"doc_id": document_id}).scalars().all()
+        
+        return total_chunks, list(chunk_ids)
+    
+    @staticmethod
+    def get_embeddings_by_chunk_ids(chunk_ids):
+        """
+        Load full-precision embeddings for specific chunks
+        
+        Args:
+            chunk_ids: chunk ids to load
+        
+        Returns:
+            Tuple of (chunk_ids list as found, (n, dim) float32 numpy array)
+        """
+        if not len(chunk_ids):
+            return [], np.zeros((0, 0), dtype=np.float32)
+        
+        with get_db() as db:
+            rows = db.execute(text("""
+                SELECT e.chunk_id, e.embedding_blob, e.embedding_dtype,
+                       CASE WHEN e.embedding_blob IS NULL THEN e.embedding END
+                FROM embeddings e
+                WHERE e.chunk_id = ANY(:chunk_ids)
+            """), {"chunk_ids": [int(c) for c in chunk_ids]}).fetchall()
+        
+        return [r[0] for r in rows], EmbeddingRepository._decode_rows(rows)
+    
+    @staticmethod
+    def _decode_rows(rows):
+        """Decode (chunk_id, blob, dtype, json) rows into a float32 matrix"""
+        if not rows:
+            return np.zeros((0, 0), dtype=np.float32)
+        
+        # Fast path: every row in the same binary format -> one buffer view
+        formats = {r[2] for r in rows}
+        if len(formats) == 1 and all(r[1] is not None for r in rows):
+            matrix = decode_matrix([r[1] for r in rows], formats.pop())
+            return matrix.astype(np.float32)
+        
+        vectors = [
+            decode_embedding(r[1], r[2]) if r[1] is not None else r[3]
+            for r in rows
+        ]
+        return np.asarray(vectors, dtype=np.float32)
+    
+    @staticmethod
+    def search_similar(query_embedding, document_id=None, top_k=5):
         """
         Find similar chunks using cosine similarity
         
+        Args:
+            query_embedding: numpy array or list of floats (384 dims)
+            document_id: document_id to search within, or None to search
+                every document through the corpus IVF index
+            top_k: number of results to return
+        
+        Returns:
+            List of dicts with chunk info and similarity scores
+            (corpus-wide results also carry their document_id)
+        """
+        if document_id is None:
+            from utils.ivf_index import search_corpus
+            return search_corpus(query_embedding, top_k)
+        
+        # Exact scan over the document's stored vectors. get_document_embeddings
+        # decodes binary (float16/float32) rows and legacy JSONB rows alike; the
+        # SQL cosine_similarity() over the JSONB column saw NULL for binary rows.
+        from utils.vector_index import normalize_rows, top_k_indices
+        from database.repositories.chunk_repo import ChunkRepository
+        
+        chunk_ids, matrix = EmbeddingRepository.get_document_embeddings(document_id)
+        if not chunk_ids:
+            return []
+        
+        scores = normalize_rows(matrix) @ normalize_rows(query_embedding)
+        hits = [(chunk_ids[i], float(scores[i])) for i in top_k_indices(scores, top_k)]
+        chunks = ChunkRepository.get_by_ids([chunk_id for chunk_id, _ in hits])
+        
+        results = []
+        for chunk_id, score in hits:
+            chunk = chunks.get(chunk_id)
+            if not chunk:
+                continue
+            results.append({
+                'chunk_id': chunk_id,
+                'text': chunk['text'],
+                'page_number': chunk['page_number'],
+                'metadata': chunk['metadata'],
+                'similarity': score
+            })
+        return results
+    
+    @staticmethod
+    def search_similar_pgvector(query_embedding, document_id, top_k=5, ef_search=PGVECTOR_EF_SEARCH):
+        """
+        Find similar chunks with the pgvector <=> operator (HNSW index)
+        
         Args:
             query_embedding: numpy array or list of floats (384 dims)
             document_id: document_id to search within
             top_k: number of results to return
+            ef_search: HNSW candidate list size for this query
         
         Returns:
             List of dicts with chunk info and similarity scores
         """
+        query_vector = to_vector_literal(query_embedding)
+        
+        query = text("""
+            SELECT 
+                c.id as chunk_id,
+                c.text,
+                c.page_number,
+                c.chunk_metadata as metadata,
+                1 - (e.embedding_vector <=> CAST(:query AS vector)) as similarity
+            FROM embeddings e
+            JOIN chunks c ON c.id = e.chunk_id
+            JOIN documents d ON d.id = c.document_id
+            WHERE d.document_id = :doc_id
+            AND e.embedding_vector IS NOT NULL
+            ORDER BY e.embedding_vector <=> CAST(:query AS vector)
+            LIMIT :top_k
+        """)
+        params = {"query": query_vector, "doc_id": document_id, "top_k": top_k}
+        
         with get_db() as db:
-            # Convert numpy array to list
-            if isinstance(query_embedding, np.ndarray):
-                query_embedding = query_embedding.tolist()
+            # Settings are scoped to this transaction. The HNSW index covers every
+            # document and the document filter runs on its candidates, so one
+            # ef_search-sized list can hold fewer than top_k rows of this document.
+            # pgvector >= 0.8 keeps scanning until LIMIT is met (iterative_scan);
+            # older versions reject the setting (savepoint keeps the transaction usable).
+            db.execute(text("SELECT set_config('hnsw.ef_search', :ef, true)"),
+                       {"ef": str(max(ef_search, top_k))})
+            try:
+                with db.begin_nested():
+                    db.execute(text("SELECT set_config('hnsw.iterative_scan', :mode, true)"),
+                               {"mode": PGVECTOR_ITERATIVE_SCAN})
+            except DBAPIError as e:
+                if not EmbeddingRepository._iterative_scan_unsupported:
+                    EmbeddingRepository._iterative_scan_unsupported = True
+                    print(f"⚠️ hnsw.iterative_scan not available, short results fall back to an exact scan: {e.orig}")
             
-            # Convert to JSONB string
-            query_json = json.dumps(query_embedding)
-            
-            # Use raw connection to avoid SQLAlchemy parsing issues
-            raw_conn = db.connection().connection  # Get the underlying psycopg2 connection
-            cursor = raw_conn.cursor()
-            
-            query = """
-                SELECT 
-                    c.id as chunk_id,
-                    c.text,
-                    c.page_number,
-                    c.chunk_metadata as metadata,
-                    cosine_similarity(e.embedding, %s::jsonb) as similarity
-                FROM embeddings e
-                JOIN chunks c ON c.id = e.chunk_id
-                JOIN documents d ON d.id = c.document_id
-                WHERE d.document_id = %s
-                ORDER BY cosine_similarity(e.embedding, %s::jsonb) DESC
-                LIMIT %s
-            """
+            rows = db.execute(query, params).fetchall()
             
-            cursor.execute(query, (query_json, document_id, query_json, top_k))
-            results = cursor.fetchall()
-            cursor.close()
+            # Fewer rows than the document has (old pgvector, or the scan hit its tuple
+            # limit): exact scan. Documents smaller than top_k are not short.
+            if len(rows) < top_k:
+                available = db.execute(
+                    text("SELECT total_chunks FROM documents WHERE document_id = :doc_id"),
+                    {"doc_id": document_id}
+                ).scalar() or 0
+                if len(rows) < min(top_k, available):
+                    db.execute(text("SELECT set_config('enable_indexscan', 'off', true)"))
+                    rows = db.execute(query, params).fetchall()
             
             return [{
                 'chunk_id': r[0],
                 'text': r[1],
                 'page_number': r[2],
                 'metadata': r[3],
-                'similarity': float(r[4]) if r[4] else 0.0
-            } for r in results]
+                'similarity': float(r[4]) if r[4] is not None else 0.0
+            } for r in rows]
@@ -218,18 +218,19 @@ class KGRepository:
         return current_entities
     
     @staticmethod
-    def get_kg_context_for_question(doc_id: int, search_terms: List[str], max_hops: int = 2) -> str:
+    def get_kg_context_for_question(doc_id: int, search_terms: List[str], max_hops: int = 2,
+                                    max_entities: int = 5, max_facts: int = None) -> str:
         """
         Build KG context for a question by:
-        1. Finding entities matching search terms
-        2. Getting their relationships
+        1. Finding entities matching search terms (up to max_entities)
+        2. Getting their relationships (up to max_facts in total)
         3. Formatting as text context
         """
         context_parts = []
         seen_facts = set()
         
         # Find matching entities
-        entities = KGRepository.search_entities(doc_id, search_terms, limit=5)
+        entities = KGRepository.search_entities(doc_id, search_terms, limit=max_entities)
         
         for entity in entities:
             entity_id = entity["id"]
@@ -250,6 +251,8 @@ class KGRepository:
                     source = claim.get("source_name", "?")
                     fact = f"  ← {source} --[{claim['predicate']}]--> {entity_name}"
                 
+                if max_facts is not None and len(seen_facts) >= max_facts:
+                    break
                 if fact not in seen_facts:
                     context_parts.append(fact)
                     seen_facts.add(fact)
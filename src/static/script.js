@@ -296,7 +296,14 @@ async function uploadDocument() {
         const data = await response.json();
 
         if (response.ok) {
-            console.log('✅ Document uploaded successfully:', data);
+            // Processing runs in the background; follow the job until it finishes
+            console.log('📥 Upload queued as job:', data.job_id);
+            const job = await waitForJob(data.job_id, (status) => {
+                const percent = Math.round(status.progress * 100);
+                if (progressText) progressText.textContent = `Processing (${status.stage || status.status})... ${percent}%`;
+                if (progressFill) progressFill.style.width = `${Math.max(percent, 5)}%`;
+            });
+            console.log('✅ Document processed successfully:', job);
 
             if (progressFill) progressFill.style.width = '100%';
             if (progressText) progressText.textContent = 'Processing complete!';
@@ -307,8 +314,8 @@ async function uploadDocument() {
             await loadDocuments();
 
             // Select the new document
-            if (data.document) {
-                currentDocumentId = data.document.document_id;
+            if (job.document) {
+                currentDocumentId = job.document.document_id;
                 const select = document.getElementById('documentSelect');
                 if (select) {
                     select.value = currentDocumentId;
@@ -351,6 +358,28 @@ async function uploadDocument() {
     }
 }
 
+/**
+ * Poll an ingestion job until it is done; rejects if it fails
+ */
+async function waitForJob(jobId, onProgress, intervalMs = 1500) {
+    while (true) {
+        const response = await fetch(`/api/jobs/${jobId}`);
+        const data = await response.json();
+        if (!response.ok) {
+            throw new Error(data.error || 'Could not read job status');
+        }
+
+        const job = data.job;
+        if (onProgress) onProgress(job);
+        if (job.status === 'done') return job;
+        if (job.status === 'failed') {
+            throw new Error(job.error || 'Processing failed');
+        }
+
+        await new Promise(resolve => setTimeout(resolve, intervalMs));
+    }
+}
+
 /**
  * Reset upload UI to initial state
  */
@@ -544,6 +573,15 @@ async function sendMessage() {
 
         console.log('📡 Response status:', response.status);
 
+        if (response.status === 429) {
+            // Admission control shed the question - show the server's busy message
+            const busy = await response.json().catch(() => ({}));
+            const msg = busy.msg || 'Server is busy. Please retry shortly.';
+            updateAssistantMessage(assistantMsg, `<span style="color: #f59e0b;">${msg}</span>`);
+            showNotification(msg, 'warning');
+            return;
+        }
+
         if (!response.ok) {
             throw new Error(`HTTP ${response.status}: ${response.statusText}`);
         }
@@ -0,0 +1,149 @@
+"""
+Admission control for /api/ask.
+
+Flask (threaded=True) accepts any number of concurrent requests and each
+one holds a thread for a whole generation. AdmissionController bounds
+that: up to max_active requests are processed at once, up to max_queue
+more wait (for at most queue_timeout seconds), and anything beyond is
+shed immediately so the caller can answer 429 instead of piling up.
+
+The degraded-mode decision (evidence-only answers when the LLM queue is
+too deep) lives here too, so all load-shedding counters are in one place.
+Its queue-depth threshold is bounded by the admission limits: only the
+admitted questions beyond the LLM_MAX_CONCURRENT generation slots can wait
+for the LLM, so a deeper threshold could never trigger.
+"""
+
+import threading
+import time
+from typing import Dict, Optional
+
+from utils.config import (
+    ASK_MAX_ACTIVE,
+    ASK_MAX_QUEUE,
+    ASK_QUEUE_TIMEOUT,
+    DEGRADED_MODE_ENABLED,
+    DEGRADED_QUEUE_DEPTH,
+    DEGRADED_PREDICTED_WAIT,
+    LLM_MAX_CONCURRENT,
+)
+from utils.llm_scheduler import get_llm_scheduler, INTERACTIVE
+
+
+class Ticket:
+    """An admitted request; release() is idempotent"""
+
+    def __init__(self, controller: 'AdmissionController'):
+        self._controller = controller
+        self._released = False
+
+    def release(self):
+        if not self._released:
+            self._released = True
+            self._controller._release()
+
+
+class AdmissionController:
+    """Bounded active set + bounded wait queue with fast rejection"""
+
+    def __init__(self, max_active: int = ASK_MAX_ACTIVE, max_queue: int = ASK_MAX_QUEUE,
+                 queue_timeout: float = ASK_QUEUE_TIMEOUT,
+                 degrade_queue_depth: Optional[int] = DEGRADED_QUEUE_DEPTH,
+                 llm_max_concurrent: int = LLM_MAX_CONCURRENT):
+        self.max_active = max(1, max_active)
+        self.max_queue = max(0, max_queue)
+        self.queue_timeout = queue_timeout
+        self.degrade_queue_depth = self._degrade_depth(degrade_queue_depth, llm_max_concurrent)
+
+        self._cond = threading.Condition()
+        self.active = 0
+        self.queued = 0
+        self.admitted = 0
+        self.shed_queue_full = 0
+        self.shed_timeout = 0
+        self.degraded = 0
+
+    def _degrade_depth(self, configured: Optional[int], llm_max_concurrent: int) -> int:
+        """Queue-depth threshold for degraded mode, clamped to what admission lets wait"""
+        reachable = max(1, self.max_active - max(1, llm_max_concurrent))
+        if configured is None:
+            return reachable
+        if configured > reachable:
+            print(f"⚠️ DEGRADED_QUEUE_DEPTH={configured} can never be reached with ASK_MAX_ACTIVE={self.max_active} "
+                  f"and LLM_MAX_CONCURRENT={llm_max_concurrent}; using {reachable}")
+            return reachable
+        return max(1, configured)
+
+    def acquire(self) -> Optional[Ticket]:
+        """Ticket once admitted, or None if the queue is full or the wait timed out"""
+        with self._cond:
+            if self.active >= self.max_active:
+                if self.queued >= self.max_queue:
+                    self.shed_queue_full += 1
+                    return None
+
+                self.queued += 1
+                deadline = time.monotonic() + self.queue_timeout
+                try:
+                    while self.active >= self.max_active:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            self.shed_timeout += 1
+                            return None
+                        self._cond.wait(remaining)
+                finally:
+                    self.queued -= 1
+
+            self.active += 1
+            self.admitted += 1
+        return Ticket(self)
+
+    def _release(self):
+        with self._cond:
+            self.active -= 1
+            self._cond.notify()
+
+    def retry_after(self) -> int:
+        """Seconds a shed client should wait before retrying"""
+        return max(1, int(get_llm_scheduler().predicted_wait(INTERACTIVE)) or int(self.queue_timeout))
+
+    def should_degrade(self) -> bool:
+        """True when the LLM queue is deep enough that answers should skip generation"""
+        if not DEGRADED_MODE_ENABLED:
+            return False
+        scheduler = get_llm_scheduler()
+        degrade = (scheduler.queue_depth(INTERACTIVE) >= self.degrade_queue_depth
+                   or scheduler.predicted_wait(INTERACTIVE) >= DEGRADED_PREDICTED_WAIT)
+        if degrade:
+            with self._cond:
+                self.degraded += 1
+        return degrade
+
+    def stats(self) -> Dict:
+        with self._cond:
+            return {
+                'max_active': self.max_active,
+                'max_queue': self.max_queue,
+                'active': self.active,
+                'queued': self.queued,
+                'admitted': self.admitted,
+                'shed_queue_full': self.shed_queue_full,
+                'shed_timeout': self.shed_timeout,
+                'degraded': self.degraded,
+                'degrade_queue_depth': self.degrade_queue_depth,
+            }
+
+
+# Global controller instance
+_controller = None
+_controller_lock = threading.Lock()
+
+
+def get_admission_controller() -> AdmissionController:
+    """Get the shared /api/ask admission controller"""
+    global _controller
+    if _controller is None:
+        with _controller_lock:
+            if _controller is None:
+                _controller = AdmissionController()
+    return _controller
@@ -3,7 +3,7 @@ Answer Formatter - Convert structured KG data to natural language
 """
 
 import json
-from typing import Any, Dict
+from typing import Any, Dict, Iterator
 
 
 class AnswerFormatter:
@@ -20,6 +20,17 @@ class AnswerFormatter:
         else:
             return str(raw_output)
     
+    def format_stream(self, deltas: Iterator[str], question: str) -> Iterator[str]:
+        """
+        Streaming counterpart of format() for free-text generations.
+        
+        format() leaves plain strings untouched (only structured dict/list
+        outputs are rewritten), so text deltas pass straight through.
+        """
+        for delta in deltas:
+            if delta:
+                yield delta
+    
     def _format_dict(self, data: Dict, question: str) -> str:
         """Convert dictionary to natural language based on question context"""
         
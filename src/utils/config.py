@@ -2,9 +2,23 @@
 Configuration file for IPO Q&A system.
 """
 
+import os
+
 # Embedding Model
 # EMBEDDING_MODEL_NAME = "BAAI/bge-large-en-v1.5"  # High accuracy (1024 dim) - Too slow for local CPU
 EMBEDDING_MODEL_NAME = "all-MiniLM-L6-v2"      # Fast (384 dim) - Best for local CPU
+EMBEDDING_DIM = 384
+EMBEDDING_MAX_SEQ_LENGTH = 256  # Tokens per text (model default); longer chunks are truncated
+EMBEDDING_BACKEND = "torch"  # 'torch' (SentenceTransformer), 'onnx' or 'onnx-int8' (ONNX Runtime, no torch import)
+EMBEDDING_STORAGE_FORMAT = "float16"  # 'float16' / 'float32' (raw bytea) or 'jsonb' (legacy array)
+
+# Query encoding service (micro-batches concurrent requests on one worker thread)
+USE_ENCODING_SERVICE = True
+ENCODING_BATCH_MAX_SIZE = 32  # Max queries per forward pass
+ENCODING_BATCH_MAX_WAIT_MS = 5  # How long the worker waits to fill a batch
+ENCODING_BULK_SLICE = 64  # Ingestion texts per worker job (queries interleave between slices)
+EMBEDDING_BATCH_SIZE = 32  # Ingestion batch size; chunks are length-sorted first so batches pad little
+EMBEDDING_TORCH_THREADS = 1  # Intra-op threads for the worker (torch or ONNX Runtime); raise to the core count on Linux servers
 
 # Chunking parameters
 MIN_CHUNK_WORDS = 150
@@ -35,6 +49,31 @@ IPO_SECTION_KEYWORDS = [
 # Search parameters
 DEFAULT_TOP_K = 5
 
+# Per-question budgets by complexity class (text_utils.detect_question_complexity)
+#   num_predict: max generated tokens; timeout: LLM read timeout (s)
+#   top_k: vector chunks in context; kg_entities / kg_facts: KG context caps
+COMPLEXITY_BUDGETS = {
+    'simple':   {'num_predict': 512,  'timeout': 120, 'top_k': 3, 'kg_entities': 3, 'kg_facts': 30},
+    'moderate': {'num_predict': 1536, 'timeout': 180, 'top_k': 5, 'kg_entities': 5, 'kg_facts': 80},
+    'complex':  {'num_predict': 4096, 'timeout': 300, 'top_k': 8, 'kg_entities': 8, 'kg_facts': 150},
+}
+VECTOR_SEARCH_BACKEND = "memory"  # 'memory' (resident matrices), 'pgvector' (HNSW) or 'jsonb' (exact scan of stored vectors, any storage format)
+PGVECTOR_EF_SEARCH = 40  # HNSW candidate list size; higher = better recall, slower search
+PGVECTOR_ITERATIVE_SCAN = "strict_order"  # pgvector >= 0.8: keep scanning HNSW until top_k rows pass the document filter
+VECTOR_INDEX_QUANTIZATION = None  # None (float32 matrix) or 'int8' (4x smaller, re-ranked from storage)
+INT8_RERANK_CANDIDATES = 200  # Candidates re-scored with full-precision vectors in int8 mode
+QUERY_EMBEDDING_CACHE_SIZE = 1024  # Question embeddings kept in the in-memory LRU
+QUERY_EMBEDDING_CACHE_DISK = False  # Also persist them to QUERY_EMBEDDING_CACHE_FILE (SQLite)
+
+# Corpus-wide IVF index (search across all documents)
+IVF_NLIST = 0  # Number of k-means lists; 0 = auto (~sqrt of corpus size)
+IVF_NPROBE = 8  # Lists scanned per query; higher = better recall, slower search
+IVF_RETRAIN_GROWTH = 2.0  # Retrain centroids once the corpus grows past this factor
+
+# Memory-mapped per-document embedding store (shared page cache across processes)
+USE_EMBEDDING_STORE = True
+EMBEDDING_STORE_VERSION = 1
+
 # Chapter routing keywords
 CHAPTER_ROUTING_RULES = {
     "RISK": ["risk", "risks", "threat", "uncertainty", "challenge", "concern"],
@@ -49,15 +88,21 @@ DATA_DIR = "data"
 # DeepSeek R1 config for Knowledge Graph Extraction
 # Using local Llama 3 for fast, reliable extraction
 DEEPSEEK_API_KEY = ""  # Not needed for local model
-DEEPSEEK_BASE_URL = "http://localhost:11434"  # Local Ollama
+# Env overrides point the client at another server, e.g. scripts/mock_ollama_server.py
+DEEPSEEK_BASE_URL = os.getenv("DEEPSEEK_BASE_URL", os.getenv("OLLAMA_BASE_URL", "http://localhost:11434"))  # Local Ollama
 DEEPSEEK_MODEL = "llama3:latest"  # Fast and reliable for structured extraction
 DEEPSEEK_TEMPERATURE = 0.1  # Low temperature for extraction accuracy
 USE_LOCAL_DEEPSEEK = True  # Use local model instead of API
+KG_MAX_CONCURRENT = 3  # Extraction prompts in flight at once (batch_extract); match OLLAMA_NUM_PARALLEL
+KG_PROMPT_RETRIES = 1  # Extra attempts for a failed extraction prompt
 CHAPTERS_FILE = f"{DATA_DIR}/chapters.json"
 CHUNKS_FILE = f"{DATA_DIR}/chunks.json"
 EMBEDDINGS_FILE = f"{DATA_DIR}/embeddings.npy"
 EMBEDDING_META_FILE = f"{DATA_DIR}/embedding_meta.json"
 DOCUMENTS_INDEX = f"{DATA_DIR}/documents.json"
+IVF_INDEX_DIR = f"{DATA_DIR}/index"
+QUERY_EMBEDDING_CACHE_FILE = f"{DATA_DIR}/cache/query_embeddings.sqlite"
+ONNX_MODEL_DIR = f"{DATA_DIR}/models/{EMBEDDING_MODEL_NAME.split('/')[-1]}-onnx"
 
 # App config
 UPLOAD_FOLDER = "uploads"
@@ -66,7 +111,69 @@ MAX_CONTENT_LENGTH = 50 * 1024 * 1024  # 50MB
 ALLOWED_EXTENSIONS = {'pdf'}
 
 # Ollama config
-OLLAMA_BASE_URL = "http://localhost:11434"
+OLLAMA_BASE_URL = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
 LLM_TEMPERATURE = 0.1
 LLM_NUM_PREDICT = 1024
 LLM_TOP_P = 0.9
+
+# LLM HTTP client (shared keep-alive session)
+LLM_POOL_SIZE = 8  # Max open connections to Ollama; callers beyond this wait for a free one
+LLM_REQUEST_TIMEOUT = 300  # Default read timeout per call (seconds)
+LLM_CONNECT_TIMEOUT = 5
+LLM_MAX_RETRIES = 3  # Retries on connection errors and 5xx responses
+LLM_BACKOFF_BASE = 0.5  # Seconds; full-jitter exponential backoff
+LLM_BACKOFF_MAX = 8.0
+
+# Model residency: how long Ollama keeps the model loaded after a request
+# (duration string, or -1 = forever); warm-up loads it when the server starts
+LLM_KEEP_ALIVE = "30m"
+LLM_WARMUP_ON_STARTUP = True
+
+# /api/ask admission control and degraded (evidence-only) answers
+ASK_MAX_ACTIVE = 8  # Questions processed at once
+ASK_MAX_QUEUE = 16  # Questions waiting for admission; beyond this they get 429 immediately
+ASK_QUEUE_TIMEOUT = 10  # Seconds a question may wait for admission before 429
+DEGRADED_MODE_ENABLED = True  # Return retrieved evidence without generation when the LLM is overloaded
+# ...when this many interactive LLM calls are waiting. None = ASK_MAX_ACTIVE - LLM_MAX_CONCURRENT,
+# the most that can wait once the admitted questions saturate the LLM; larger values are clamped to it
+DEGRADED_QUEUE_DEPTH = None
+DEGRADED_PREDICTED_WAIT = 30  # ...or the predicted LLM queue wait exceeds this (seconds)
+
+# LLM record/replay cassette (utils.llm_cassette): 'off', 'record' or 'replay'
+LLM_CASSETTE_MODE = os.getenv("LLM_CASSETTE_MODE", "off")
+LLM_CASSETTE_FILE = os.getenv("LLM_CASSETTE_FILE", f"{DATA_DIR}/cassettes/llm_calls.jsonl")
+LLM_CASSETTE_DELAY_SCALE = float(os.getenv("LLM_CASSETTE_DELAY_SCALE", "0"))  # 0 = instant, 1 = recorded timings
+
+# LLM scheduler (priority admission: interactive > evaluation > extraction)
+LLM_MAX_CONCURRENT = 4  # Generations running at once; match OLLAMA_NUM_PARALLEL
+LLM_INTERACTIVE_RESERVED = 1  # Slots batch classes may not take, kept free for /api/ask
+# Slot table shared by the server and batch scripts so the limits hold across processes;
+# "" = account slots per process only (batch scripts then cannot be preempted)
+LLM_SCHEDULER_SHARED_FILE = os.getenv("LLM_SCHEDULER_SHARED_FILE", f"{DATA_DIR}/cache/llm_slots.sqlite")
+LLM_SCHEDULER_POLL_INTERVAL = 0.05  # First re-check for slots freed by other processes (seconds)
+LLM_SCHEDULER_POLL_MAX_INTERVAL = 0.25  # Re-check interval doubles up to this while a call keeps waiting
+
+# Background ingestion for /api/upload (utils.ingestion); job state and stage outputs
+# are checkpointed under INGEST_JOBS_DIR so unfinished jobs resume after a restart
+INGEST_JOBS_DIR = f"{DATA_DIR}/jobs"
+INGEST_MAX_WORKERS = 1  # Documents processed at once (embedding is the heavy stage)
+INGEST_EMBED_SLICE = 512  # Chunks encoded per progress update
+
+# Document metadata cache for /api/ask (utils.document_meta); scripts that change a
+# document touch the marker file so running servers drop their cached entries
+DOCUMENT_META_MARKER = f"{DATA_DIR}/cache/document_meta.stamp"
+DOCUMENT_META_TTL = 300  # Seconds; safety net for changes made outside the app and scripts; 0 = never
+
+# Per-document RAG instances kept for /api/ask (utils.rag_registry), least recently used evicted
+RAG_REGISTRY_MAX_DOCUMENTS = 8
+RAG_REGISTRY_MAX_INDEX_MB = 2048  # Evict documents while their resident vector indexes exceed this; 0 = no limit
+
+# LLM response cache (content-addressed, SQLite)
+LLM_CACHE_ENABLED = True
+# Scheduler classes whose calls use the cache. Extraction only by default: cached
+# /api/ask answers would turn repeated evaluation runs into cache-hit benchmarks
+LLM_CACHE_PRIORITIES = ("extraction",)
+LLM_CACHE_FILE = f"{DATA_DIR}/cache/llm_responses.sqlite"
+LLM_CACHE_TTL = 30 * 24 * 3600  # Seconds before an entry expires; 0 = never
+LLM_CACHE_MAX_ENTRIES = 50000  # Least recently used entries beyond this are evicted
+LLM_SINGLE_FLIGHT = True  # Concurrent identical prompts share one in-flight generation
@@ -5,32 +5,111 @@ Supports DeepSeek R1 reasoning model with fallback to local models
 
 import requests
 import json
-from typing import Dict, List, Optional
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, Dict, Iterator, List, Optional
 from utils.config import (
     DEEPSEEK_API_KEY,
     DEEPSEEK_BASE_URL,
     DEEPSEEK_MODEL,
     DEEPSEEK_TEMPERATURE,
     OLLAMA_BASE_URL,
-    USE_LOCAL_DEEPSEEK
+    USE_LOCAL_DEEPSEEK,
+    LLM_REQUEST_TIMEOUT,
+    LLM_CACHE_ENABLED,
+    LLM_CACHE_PRIORITIES,
+    LLM_KEEP_ALIVE,
+    KG_MAX_CONCURRENT,
+    KG_PROMPT_RETRIES,
 )
+from utils.http_pool import get_http_pool
+from utils.llm_cache import get_llm_cache, make_cache_key, cache_bypassed
+from utils.single_flight import get_single_flight
+from utils.llm_scheduler import get_llm_scheduler, llm_priority, current_priority, EXTRACTION
+from utils.llm_cassette import get_cassette
+
+
+def strip_think_stream(deltas: Iterator[str]) -> Iterator[str]:
+    """
+    Remove <think>...</think> sections from a stream of text deltas.
+    
+    Tags may be split across deltas, so a trailing partial tag is held
+    back until the next delta arrives.
+    """
+    in_think = False
+    buffer = ''
+    
+    for delta in deltas:
+        buffer += delta
+        while buffer:
+            tag = '</think>' if in_think else '<think>'
+            pos = buffer.find(tag)
+            if pos >= 0:
+                if not in_think and pos:
+                    yield buffer[:pos]
+                buffer = buffer[pos + len(tag):]
+                in_think = not in_think
+                continue
+            
+            # Hold back a suffix that could be the start of the tag
+            keep = 0
+            for size in range(min(len(tag) - 1, len(buffer)), 0, -1):
+                if tag.startswith(buffer[-size:]):
+                    keep = size
+                    break
+            if not in_think and len(buffer) > keep:
+                yield buffer[:len(buffer) - keep]
+            buffer = buffer[len(buffer) - keep:]
+            break
+    
+    if buffer and not in_think:
+        yield buffer
 
 
 class DeepSeekClient:
     """Client for DeepSeek API with local model support"""
     
-    def __init__(self, use_local_fallback=True):
+    def __init__(self, use_local_fallback=True, use_cache: bool = LLM_CACHE_ENABLED):
         self.api_key = DEEPSEEK_API_KEY
         self.base_url = DEEPSEEK_BASE_URL
         self.model = DEEPSEEK_MODEL
         self.temperature = DEEPSEEK_TEMPERATURE
         self.use_local = USE_LOCAL_DEEPSEEK or use_local_fallback
+        # Shared keep-alive session (bounded pool, retry/backoff on connection errors and 5xx)
+        self.http = get_http_pool()
+        # Record/replay cassette (see utils.llm_cassette), None unless LLM_CASSETTE_MODE is set
+        self.cassette = get_cassette()
+        # Persistent response cache (see utils.llm_cache) for LLM_CACHE_PRIORITIES calls;
+        # False or bypass_llm_cache() skips it.
+        # Off under a cassette so recordings hold real generations and replays skip the cache
+        self.use_cache = use_cache and self.cassette is None
+    
+    @staticmethod
+    def _fingerprint(endpoint: str, payload: Dict) -> str:
+        """Hash of everything that determines the generated text"""
+        # stream and keep_alive only change the transport, not the generated text
+        return make_cache_key(endpoint=endpoint, **{k: v for k, v in payload.items() if k not in ('stream', 'keep_alive')})
+    
+    def _cache_key(self, endpoint: str, payload: Dict) -> Optional[str]:
+        """Cache key for a request payload, or None when caching is off for this call"""
+        if not self.use_cache or cache_bypassed() or current_priority() not in LLM_CACHE_PRIORITIES:
+            return None
+        return self._fingerprint(endpoint, payload)
+    
+    def _cache_get(self, key: Optional[str]) -> Optional[str]:
+        return get_llm_cache().get(key) if key else None
+    
+    def _cache_put(self, key: Optional[str], content: str):
+        if key:
+            get_llm_cache().put(key, content, self.model)
         
     def extract_with_reasoning(
         self, 
         prompt: str, 
         system_prompt: str = None,
-        max_tokens: int = 4096
+        max_tokens: int = 4096,
+        timeout: float = LLM_REQUEST_TIMEOUT
     ) -> Dict:
         """
         Call DeepSeek model (local or API) with reasoning mode enabled
@@ -39,36 +118,168 @@ class DeepSeekClient:
             prompt: User prompt for extraction
             system_prompt: System instructions
             max_tokens: Maximum tokens to generate
+            timeout: Read timeout in seconds for this call
             
         Returns:
             Dict with 'reasoning' and 'output' keys
         """
         # Use local model if configured
         if self.use_local:
-            return self._call_local_model(prompt, system_prompt, max_tokens)
+            return self._call_local_model(prompt, system_prompt, max_tokens, timeout=timeout)
         
         try:
             return self._call_deepseek(prompt, system_prompt, max_tokens)
         except Exception as e:
             print(f"DeepSeek API failed: {e}. Falling back to local model...")
-            return self._call_local_model(prompt, system_prompt, max_tokens, json_mode=True)
+            return self._call_local_model(prompt, system_prompt, max_tokens, json_mode=True, timeout=timeout)
 
     def query(
         self, 
         prompt: str, 
         system_prompt: str = None,
-        max_tokens: int = 4096
+        max_tokens: int = 4096,
+        timeout: float = LLM_REQUEST_TIMEOUT
     ) -> str:
         """
         General query method for text generation (non-JSON)
         """
         if self.use_local:
-            result = self._call_local_model(prompt, system_prompt, max_tokens, json_mode=False)
+            result = self._call_local_model(prompt, system_prompt, max_tokens, json_mode=False, timeout=timeout)
             return result.get('output', '')
         
         # Fallback to API if implemented, or just use local
         return self._call_deepseek(prompt, system_prompt, max_tokens, json_mode=False).get('output', '')
     
+    def query_stream(
+        self,
+        prompt: str,
+        system_prompt: str = None,
+        max_tokens: int = 4096,
+        timeout: float = LLM_REQUEST_TIMEOUT
+    ) -> Iterator[str]:
+        """
+        Streaming variant of query(): yields text deltas as the model produces them
+        
+        <think>...</think> reasoning is dropped, as in the non-streaming path.
+        """
+        if not self.use_local:
+            # API path has no streaming support yet - emit the full answer at once
+            yield self.query(prompt, system_prompt, max_tokens, timeout)
+            return
+        
+        yield from strip_think_stream(self._stream_local_model(prompt, system_prompt, max_tokens, timeout))
+    
+    def _chat_payload(self, prompt: str, system_prompt: str, max_tokens: int, stream: bool) -> Dict:
+        """
+        Ollama /api/chat request with the system message first
+        
+        Callers keep static instructions in system_prompt and put retrieved
+        context and the question in prompt, so consecutive requests share a
+        token prefix the backend can reuse; keep_alive keeps the model loaded.
+        """
+        messages = []
+        if system_prompt:
+            messages.append({"role": "system", "content": system_prompt})
+        messages.append({"role": "user", "content": prompt})
+        
+        return {
+            "model": self.model,
+            "messages": messages,
+            "stream": stream,
+            "keep_alive": LLM_KEEP_ALIVE,
+            "options": {
+                "temperature": self.temperature,
+                "num_predict": max_tokens
+            }
+        }
+    
+    @staticmethod
+    def _log_timings(result: Dict):
+        """Report a cold model load from Ollama's final response timings (nanoseconds)"""
+        load_seconds = result.get('load_duration', 0) / 1e9
+        if load_seconds >= 1:
+            print(f"🧊 Model cold load took {load_seconds:.1f}s (keep_alive={LLM_KEEP_ALIVE})")
+    
+    def warm_up(self, system_prompt: str = None) -> float:
+        """
+        Load the model into memory ahead of the first request
+        
+        With a system_prompt, also prefills it (one generated token) so the
+        shared prefix is cached. Returns the elapsed time in seconds.
+        """
+        url = f"{self.base_url}/api/chat"
+        if system_prompt:
+            payload = self._chat_payload("Reply OK.", system_prompt, 1, stream=False)
+        else:
+            # Empty message list only loads the model
+            payload = {"model": self.model, "messages": [], "stream": False, "keep_alive": LLM_KEEP_ALIVE}
+        
+        start = time.perf_counter()
+        response = self.http.post(url, json=payload, timeout=LLM_REQUEST_TIMEOUT)
+        response.raise_for_status()
+        elapsed = time.perf_counter() - start
+        
+        load_seconds = response.json().get('load_duration', 0) / 1e9
+        print(f"🔥 Warmed up {self.model} in {elapsed:.1f}s (load {load_seconds:.1f}s, keep_alive={LLM_KEEP_ALIVE})")
+        return elapsed
+    
+    def _stream_local_model(self, prompt: str, system_prompt: str, max_tokens: int,
+                            timeout: float = LLM_REQUEST_TIMEOUT) -> Iterator[str]:
+        """Call local model via Ollama /api/chat with stream=True, yielding response deltas"""
+        url = f"{self.base_url}/api/chat"
+        payload = self._chat_payload(prompt, system_prompt, max_tokens, stream=True)
+        fingerprint = self._fingerprint('chat', payload)
+        
+        if self.cassette and self.cassette.replaying:
+            yield from self.cassette.replay_stream(fingerprint)
+            return
+        
+        cache_key = self._cache_key('chat', payload)
+        cached = self._cache_get(cache_key)
+        if cached is not None:
+            yield cached
+            return
+        
+        # Identical questions asked concurrently share one generation
+        yield from get_single_flight().stream(
+            fingerprint,
+            lambda: self._stream_generate(url, payload, timeout, cache_key, fingerprint)
+        )
+    
+    def _stream_generate(self, url: str, payload: Dict, timeout: float, cache_key: Optional[str],
+                         fingerprint: str) -> Iterator[str]:
+        """Read an Ollama /api/chat stream, caching (and recording) the text once complete"""
+        print(f"Using local model (streaming): {self.model}")
+        
+        # Read timeout bounds the gap between streamed lines; the slot is held until the stream ends
+        parts = []
+        with get_llm_scheduler().slot():
+            start = time.perf_counter()
+            ttft = None
+            with self.http.post(url, json=payload, stream=True, timeout=timeout) as response:
+                response.raise_for_status()
+                for line in response.iter_lines():
+                    if not line:
+                        continue
+                    chunk = json.loads(line)
+                    if chunk.get('error'):
+                        raise RuntimeError(f"Ollama error: {chunk['error']}")
+                    delta = chunk.get('message', {}).get('content')
+                    if delta:
+                        if ttft is None:
+                            ttft = time.perf_counter() - start
+                        parts.append(delta)
+                        yield delta
+                    if chunk.get('done'):
+                        self._log_timings(chunk)
+                        # Only complete generations are cached
+                        content = ''.join(parts)
+                        self._cache_put(cache_key, content)
+                        if self.cassette and self.cassette.recording:
+                            duration = time.perf_counter() - start
+                            self.cassette.record(fingerprint, 'chat', payload, content, ttft or duration, duration)
+                        break
+    
     def _call_deepseek(self, prompt: str, system_prompt: str, max_tokens: int, json_mode: bool = True) -> Dict:
         """Call DeepSeek API"""
         url = f"{self.base_url}/v1/chat/completions"
@@ -93,11 +304,19 @@ class DeepSeekClient:
         if json_mode:
             payload["response_format"] = {"type": "json_object"}
         
-        response = requests.post(url, headers=headers, json=payload, timeout=60)
-        response.raise_for_status()
+        def generate() -> str:
+            response = self.http.post(url, headers=headers, json=payload, timeout=60)
+            response.raise_for_status()
+            
+            result = response.json()
+            content = result['choices'][0]['message']['content']
+            self._cache_put(cache_key, content)
+            return content
         
-        result = response.json()
-        content = result['choices'][0]['message']['content']
+        cache_key = self._cache_key('chat/completions', payload)
+        content = self._cache_get(cache_key)
+        if content is None:
+            content = get_single_flight().do(self._fingerprint('chat/completions', payload), generate)
         
         # Parse JSON response
         try:
@@ -116,39 +335,52 @@ class DeepSeekClient:
                 'output': content
             }
     
-    def _call_local_model(self, prompt: str, system_prompt: str, max_tokens: int, json_mode: bool = True) -> Dict:
-        """Call local DeepSeek model via Ollama"""
-        url = f"{self.base_url}/api/generate"
-        
-        full_prompt = f"{system_prompt}\n\n{prompt}" if system_prompt else prompt
-        
-        payload = {
-            "model": self.model,  # Use configured DeepSeek model
-            "prompt": full_prompt,
-            "stream": False,
-            "options": {
-                "temperature": self.temperature,
-                "num_predict": max_tokens
-            }
-        }
+    def _call_local_model(self, prompt: str, system_prompt: str, max_tokens: int, json_mode: bool = True,
+                          timeout: float = LLM_REQUEST_TIMEOUT) -> Dict:
+        """Call local DeepSeek model via Ollama /api/chat"""
+        url = f"{self.base_url}/api/chat"
+        payload = self._chat_payload(prompt, system_prompt, max_tokens, stream=False)
         
         if json_mode:
              payload["format"] = "json"
         
-        print(f"Using local model: {self.model}")
-        
-        try:
-            response = requests.post(url, json=payload, timeout=300)  # 5 minutes timeout for R1
-            response.raise_for_status()
-        except requests.exceptions.Timeout:
-            print("⚠️  Model timeout - DeepSeek R1 is thinking too long. Trying simpler extraction...")
-            # Try again with lower max_tokens
-            payload['options']['num_predict'] = 2048
-            response = requests.post(url, json=payload, timeout=180)
-            response.raise_for_status()
+        def generate() -> str:
+            print(f"Using local model: {self.model}")
+            
+            # Waits for a backend slot according to the caller's llm_priority()
+            with get_llm_scheduler().slot():
+                start = time.perf_counter()
+                try:
+                    response = self.http.post(url, json=payload, timeout=timeout)  # 5 minutes by default for R1
+                    response.raise_for_status()
+                except requests.exceptions.Timeout:
+                    print("⚠️  Model timeout - DeepSeek R1 is thinking too long. Trying simpler extraction...")
+                    # Try again with lower max_tokens
+                    payload['options']['num_predict'] = min(2048, max_tokens)
+                    response = self.http.post(url, json=payload, timeout=timeout * 0.6)
+                    response.raise_for_status()
+                duration = time.perf_counter() - start
+            
+            result = response.json()
+            self._log_timings(result)
+            content = result.get('message', {}).get('content', '')
+            self._cache_put(cache_key, content)
+            if self.cassette and self.cassette.recording:
+                # No first-token time without streaming; model load + prefill is the closest
+                ttft = (result.get('load_duration', 0) + result.get('prompt_eval_duration', 0)) / 1e9
+                self.cassette.record(fingerprint, 'chat', payload, content, min(ttft, duration), duration)
+            return content
         
-        result = response.json()
-        content = result.get('response', '')
+        # Keyed on the original request, so a timeout fallback answer is reused next time too
+        cache_key = self._cache_key('chat', payload)
+        fingerprint = self._fingerprint('chat', payload)
+        if self.cassette and self.cassette.replaying:
+            content = self.cassette.replay(fingerprint)
+        else:
+            content = self._cache_get(cache_key)
+        if content is None:
+            # Concurrent identical prompts wait for one generation
+            content = get_single_flight().do(fingerprint, generate)
         
         # Extract reasoning from <think> tags if present
         reasoning = ''
@@ -197,27 +429,66 @@ class DeepSeekClient:
         self,
         prompts: List[str],
         system_prompt: str = None,
-        max_concurrent: int = 3
+        max_concurrent: int = KG_MAX_CONCURRENT,
+        max_tokens: int = 4096,
+        timeout: float = LLM_REQUEST_TIMEOUT,
+        max_retries: int = KG_PROMPT_RETRIES,
+        progress_callback: Callable[[int, int], None] = None,
+        json_mode: bool = True,
+        priority: str = EXTRACTION
     ) -> List[Dict]:
         """
-        Process multiple extraction prompts in batches
+        Process multiple extraction prompts concurrently
+        
+        Keeps up to max_concurrent requests in flight on a thread pool
+        (sharing the pooled HTTP session). A prompt that still fails after
+        max_retries gets an {'output': {} or '', 'error': ...} entry instead
+        of aborting the batch.
         
         Args:
             prompts: List of extraction prompts
             system_prompt: Shared system prompt
             max_concurrent: Maximum concurrent requests
+            max_tokens: Maximum tokens to generate per prompt
+            timeout: Read timeout per request (seconds)
+            max_retries: Extra attempts per prompt after a failure
+            progress_callback: Called as progress_callback(completed, total)
+            json_mode: Parse JSON output (extract_with_reasoning); False returns
+                raw text from query() as {'output': text}
+            priority: Scheduler class for these calls (see utils.llm_scheduler);
+                extraction yields the backend to interactive questions
             
         Returns:
-            List of extraction results
+            List of extraction results, in prompt order
         """
-        results = []
+        total = len(prompts)
+        results: List[Optional[Dict]] = [None] * total
+        if not total:
+            return []
+        
+        def run(prompt: str) -> Dict:
+            for attempt in range(max_retries + 1):
+                try:
+                    # Worker threads do not inherit the caller's context, so set the priority here
+                    with llm_priority(priority):
+                        if json_mode:
+                            return self.extract_with_reasoning(prompt, system_prompt, max_tokens, timeout=timeout)
+                        return {'output': self.query(prompt, system_prompt, max_tokens, timeout=timeout)}
+                except Exception as e:
+                    if attempt == max_retries:
+                        return {'reasoning': '', 'output': {} if json_mode else '', 'error': str(e)}
+                    delay = self.http.backoff(attempt)
+                    print(f"\n⚠️  Prompt failed ({e}), retrying in {delay:.1f}s...")
+                    time.sleep(delay)
         
-        # Simple sequential processing for now
-        # Can add concurrent.futures for parallelization later
-        for i, prompt in enumerate(prompts):
-            print(f"Processing chunk {i+1}/{len(prompts)}...")
-            result = self.extract_with_reasoning(prompt, system_prompt)
-            results.append(result)
+        completed = 0
+        with ThreadPoolExecutor(max_workers=max(1, max_concurrent)) as executor:
+            futures = {executor.submit(run, prompt): i for i, prompt in enumerate(prompts)}
+            for future in as_completed(futures):
+                results[futures[future]] = future.result()
+                completed += 1
+                if progress_callback:
+                    progress_callback(completed, total)
         
         return results
 
@@ -233,14 +504,29 @@ class DeepSeekClient:
         }
         
         try:
-            response = requests.post(url, json=payload, timeout=30)
+            response = self.http.post(url, json=payload, timeout=30)
             if response.status_code == 404:
                 # Fallback to llama3 if nomic-embed-text not found
                 payload["model"] = self.model
-                response = requests.post(url, json=payload, timeout=30)
+                response = self.http.post(url, json=payload, timeout=30)
                 
             response.raise_for_status()
             return response.json()["embedding"]
         except Exception as e:
             print(f"Embedding failed: {e}")
             return []
+
+
+# Shared client instance
+_shared_client = None
+_shared_client_lock = threading.Lock()
+
+
+def get_shared_client() -> DeepSeekClient:
+    """Get the process-wide client used by the RAG classes"""
+    global _shared_client
+    if _shared_client is None:
+        with _shared_client_lock:
+            if _shared_client is None:
+                _shared_client = DeepSeekClient()
+    return _shared_client
@@ -0,0 +1,178 @@
+"""
+Cached per-document metadata for the /api/ask hot path.
+
+Before retrieval, every question used to look up the document row, resolve
+the integer id (twice) and count kg_entities (twice): five or more round
+trips. DocumentMetaCache answers all of that from memory after one
+aggregated query per document:
+
+    {'id', 'document_id', 'display_name', 'total_chunks', 'kg_entities',
+     'kg_claims', 'embedding_model', 'has_db_kg', 'has_json_kg', 'has_kg'}
+
+Invalidation is explicit. Anything that changes a document (upload, KG
+builds) calls invalidate_document_meta(), which drops the local entry and
+touches DOCUMENT_META_MARKER. Every cache checks the marker's mtime (one
+stat, no query) and clears itself when it moved, so scripts running in
+another process reach the server too. DOCUMENT_META_TTL bounds staleness
+for changes made any other way.
+
+The /api/documents listing is cached the same way, with an ETag derived
+from its content, so polling clients revalidate without any query.
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from utils.config import DATA_DIR, DOCUMENTS_FOLDER, DOCUMENT_META_MARKER, DOCUMENT_META_TTL
+
+
+def json_kg_path(document_id: str) -> Optional[str]:
+    """Legacy file-based knowledge graph of a document, if one exists"""
+    for base in (os.path.join(DATA_DIR, 'documents'), DOCUMENTS_FOLDER):
+        path = os.path.join(base, document_id, 'knowledge_graph', 'knowledge_graph.json')
+        if os.path.exists(path):
+            return path
+    return None
+
+
+class DocumentMetaCache:
+    """In-process document metadata, cleared when the shared marker file changes"""
+
+    def __init__(self, marker_path: str = DOCUMENT_META_MARKER, ttl: float = DOCUMENT_META_TTL):
+        self.marker_path = marker_path
+        self.ttl = ttl
+
+        self._lock = threading.Lock()
+        self._entries: Dict[str, tuple] = {}  # document_id -> (loaded_at, meta)
+        self._listing = None  # (loaded_at, documents, etag)
+        self._marker_seen = self._marker_mtime()
+        self._generation = 0  # bumped on every invalidation
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def _marker_mtime(self) -> int:
+        try:
+            return os.stat(self.marker_path).st_mtime_ns
+        except FileNotFoundError:
+            return 0
+
+    def _check_marker(self):
+        mtime = self._marker_mtime()
+        if mtime != self._marker_seen:
+            with self._lock:
+                self._marker_seen = mtime
+                self._generation += 1
+                self._entries.clear()
+                self._listing = None
+                self.invalidations += 1
+
+    def get(self, document_id: str) -> Optional[Dict]:
+        """Metadata for a document (None if it is not in the database)"""
+        self._check_marker()
+        with self._lock:
+            entry = self._entries.get(document_id)
+            if entry is not None and self._fresh(entry[0]):
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+            generation = self._generation
+
+        meta = self._load(document_id)
+        # Not-found documents are not cached: the upload creating them may be in progress.
+        # Neither is a load that raced with an invalidation.
+        if meta is not None:
+            with self._lock:
+                if generation == self._generation:
+                    self._entries[document_id] = (time.monotonic(), meta)
+        return meta
+
+    @staticmethod
+    def _load(document_id: str) -> Optional[Dict]:
+        from database.repositories import DocumentRepository
+        meta = DocumentRepository.get_metadata(document_id)
+        if meta is None:
+            return None
+        meta['has_db_kg'] = bool(meta['kg_entities'])
+        meta['has_json_kg'] = json_kg_path(document_id) is not None
+        meta['has_kg'] = meta['has_db_kg'] or meta['has_json_kg']
+        return meta
+
+    def _fresh(self, loaded_at: float) -> bool:
+        return not self.ttl or time.monotonic() - loaded_at < self.ttl
+
+    def listing(self) -> Tuple[List[Dict], str]:
+        """All documents (newest first) with kg_entity_count / has_kg, and an ETag for the list"""
+        self._check_marker()
+        with self._lock:
+            if self._listing is not None and self._fresh(self._listing[0]):
+                self.hits += 1
+                return self._listing[1], self._listing[2]
+            self.misses += 1
+            generation = self._generation
+
+        from database.repositories import DocumentRepository
+        documents = DocumentRepository.get_all_with_kg_counts()
+        for doc in documents:
+            # Files are only checked for documents without a database KG
+            doc['has_kg'] = doc['kg_entity_count'] > 0 or json_kg_path(doc['document_id']) is not None
+        body = json.dumps(documents, sort_keys=True, default=str).encode('utf-8')
+        etag = hashlib.sha256(body).hexdigest()[:32]
+
+        with self._lock:
+            if generation == self._generation:
+                self._listing = (time.monotonic(), documents, etag)
+        return documents, etag
+
+    def invalidate(self, document_id: str = None):
+        """Drop a document's entry (or all) here and, via the marker, in other processes"""
+        with self._lock:
+            self._generation += 1
+            self._listing = None
+            if document_id is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(document_id, None)
+
+        os.makedirs(os.path.dirname(self.marker_path) or '.', exist_ok=True)
+        with open(self.marker_path, 'w') as f:
+            f.write(f"{document_id or '*'} {time.time()}\n")
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'invalidations': self.invalidations,
+                'ttl_s': self.ttl,
+            }
+
+
+# Global cache instance
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_document_meta_cache() -> DocumentMetaCache:
+    """Get the shared document metadata cache"""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = DocumentMetaCache()
+    return _cache
+
+
+def get_document_meta(document_id: str) -> Optional[Dict]:
+    """Cached metadata for a document (see DocumentMetaCache)"""
+    return get_document_meta_cache().get(document_id)
+
+
+def invalidate_document_meta(document_id: str = None):
+    """Call after changing a document's rows, chunks or knowledge graph"""
+    get_document_meta_cache().invalidate(document_id)
@@ -0,0 +1,55 @@
+"""
+Binary embedding codec for compact bytea storage.
+
+Embeddings are stored as raw little-endian float16/float32 bytes
+(768 / 1536 bytes for 384 dims) instead of a JSONB array of numbers, and
+decoded with np.frombuffer without parsing.
+"""
+
+import numpy as np
+from typing import List, Optional
+
+# Storage format name -> little-endian numpy dtype
+BINARY_FORMATS = {
+    'float16': np.dtype('<f2'),
+    'float32': np.dtype('<f4'),
+}
+
+
+def is_binary_format(storage_format: str) -> bool:
+    """True for formats stored as bytea, False for legacy JSONB"""
+    return storage_format in BINARY_FORMATS
+
+
+def encode_embedding(embedding, storage_format: str) -> bytes:
+    """
+    Encode one embedding as raw little-endian bytes.
+
+    Args:
+        embedding: numpy array or list of floats
+        storage_format: 'float16' or 'float32'
+
+    Returns:
+        Bytes suitable for a bytea column
+    """
+    return np.asarray(embedding, dtype=BINARY_FORMATS[storage_format]).tobytes()
+
+
+def decode_embedding(blob, storage_format: str) -> np.ndarray:
+    """Decode one embedding (zero-copy view over the buffer)"""
+    return np.frombuffer(blob, dtype=BINARY_FORMATS[storage_format])
+
+
+def decode_matrix(blobs: List, storage_format: str, dim: Optional[int] = None) -> np.ndarray:
+    """
+    Decode many equally-sized embeddings into one (n, dim) matrix.
+
+    The blobs are joined into a single buffer and viewed in place, so
+    there is no per-row parsing or allocation.
+    """
+    dtype = BINARY_FORMATS[storage_format]
+    if not blobs:
+        return np.zeros((0, dim or 0), dtype=dtype)
+
+    buffer = b''.join(blobs)
+    return np.frombuffer(buffer, dtype=dtype).reshape(len(blobs), -1)
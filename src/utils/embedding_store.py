@@ -0,0 +1,142 @@
+"""
+Memory-mapped on-disk embedding store shared across worker processes.
+
+Each document's L2-normalized float32 matrix is written to
+DOCUMENTS_FOLDER/<document_id>/embedding_store/v<N>/embeddings.npy next to
+a small manifest (embedding_meta.json) with the chunk ids, model name and
+store version. Bumping EMBEDDING_STORE_VERSION moves to a fresh folder, so
+old layouts are never misread.
+
+Readers open the matrix with mmap_mode='r', so every server process shares
+the same page cache instead of holding its own copy, and the search index
+can be opened without a database round trip.
+"""
+
+import json
+import os
+import numpy as np
+from datetime import datetime
+from typing import Optional, Tuple
+
+from utils.config import (
+    DOCUMENTS_FOLDER,
+    EMBEDDING_MODEL_NAME,
+    EMBEDDING_STORE_VERSION,
+    EMBEDDINGS_FILE,
+    EMBEDDING_META_FILE,
+)
+
+EMBEDDINGS_FILENAME = os.path.basename(EMBEDDINGS_FILE)
+META_FILENAME = os.path.basename(EMBEDDING_META_FILE)
+
+
+class EmbeddingStore:
+    """Versioned per-document .npy store under DOCUMENTS_FOLDER"""
+
+    def __init__(self, root: str = DOCUMENTS_FOLDER, model_name: str = EMBEDDING_MODEL_NAME):
+        self.root = root
+        self.model_name = model_name
+
+    def _paths(self, document_id: str) -> Tuple[str, str]:
+        folder = os.path.join(self.root, document_id, 'embedding_store', f"v{EMBEDDING_STORE_VERSION}")
+        return os.path.join(folder, EMBEDDINGS_FILENAME), os.path.join(folder, META_FILENAME)
+
+    def write(self, document_id: str, chunk_ids, matrix: np.ndarray) -> str:
+        """
+        Write a document's normalized matrix and manifest.
+
+        Both files are written to temp names and renamed, so readers in
+        other processes never see a half-written store. The manifest is
+        renamed last and is what marks the store as valid.
+
+        Args:
+            document_id: Document identifier
+            chunk_ids: Chunk ids aligned with the matrix rows
+            matrix: (n, dim) L2-normalized float32 matrix
+
+        Returns:
+            Path of the .npy file
+        """
+        npy_path, meta_path = self._paths(document_id)
+        os.makedirs(os.path.dirname(npy_path), exist_ok=True)
+
+        matrix = np.ascontiguousarray(matrix, dtype=np.float32)
+
+        tmp_npy = npy_path + ".tmp"
+        with open(tmp_npy, 'wb') as f:
+            np.save(f, matrix)
+
+        manifest = {
+            'version': EMBEDDING_STORE_VERSION,
+            'model_name': self.model_name,
+            'dtype': 'float32',
+            'normalized': True,
+            'count': int(matrix.shape[0]),
+            'dim': int(matrix.shape[1]) if matrix.ndim == 2 else 0,
+            'chunk_ids': [int(c) for c in chunk_ids],
+            'created_at': datetime.now().isoformat()
+        }
+        tmp_meta = meta_path + ".tmp"
+        with open(tmp_meta, 'w') as f:
+            json.dump(manifest, f)
+
+        os.replace(tmp_npy, npy_path)
+        os.replace(tmp_meta, meta_path)
+        return npy_path
+
+    def read_manifest(self, document_id: str) -> Optional[dict]:
+        """Manifest for a document, or None if missing / stale"""
+        npy_path, meta_path = self._paths(document_id)
+        if not (os.path.exists(meta_path) and os.path.exists(npy_path)):
+            return None
+
+        try:
+            with open(meta_path, 'r') as f:
+                manifest = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return None
+
+        if manifest.get('version') != EMBEDDING_STORE_VERSION or manifest.get('model_name') != self.model_name:
+            return None
+        return manifest
+
+    def open(self, document_id: str) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        """
+        Open a document's matrix read-only via mmap.
+
+        Returns:
+            Tuple of (chunk_ids array, memory-mapped matrix), or None if
+            the document has no valid store
+        """
+        manifest = self.read_manifest(document_id)
+        if manifest is None:
+            return None
+
+        npy_path, _ = self._paths(document_id)
+        matrix = np.load(npy_path, mmap_mode='r')
+        chunk_ids = np.asarray(manifest['chunk_ids'], dtype=np.int64)
+
+        if matrix.shape[0] != len(chunk_ids):
+            print(f"⚠️ Embedding store for {document_id} is inconsistent, ignoring")
+            return None
+
+        return chunk_ids, matrix
+
+    def delete(self, document_id: str):
+        """Remove a document's store (manifest first)"""
+        npy_path, meta_path = self._paths(document_id)
+        for path in (meta_path, npy_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+
+# Global store instance
+_store = None
+
+
+def get_embedding_store() -> EmbeddingStore:
+    """Get the shared embedding store (cached)"""
+    global _store
+    if _store is None:
+        _store = EmbeddingStore()
+    return _store
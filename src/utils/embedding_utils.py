@@ -1,35 +1,94 @@
 """
 Embedding utilities for generating and searching vector embeddings.
+
+The model backend is chosen by EMBEDDING_BACKEND: 'torch' loads the
+SentenceTransformer, 'onnx' / 'onnx-int8' load utils.onnx_encoder, which
+exposes the same encode() and never imports torch.
 """
 
-from sentence_transformers import SentenceTransformer
 import numpy as np
 from typing import List, Dict, Tuple
-from utils.config import EMBEDDING_MODEL_NAME, DEFAULT_TOP_K
+import time
+from utils.config import (
+    EMBEDDING_MODEL_NAME,
+    EMBEDDING_BACKEND,
+    EMBEDDING_BATCH_SIZE,
+    DEFAULT_TOP_K,
+    USE_ENCODING_SERVICE,
+)
 
 
 # Global model cache
 _model = None
 
 
-def get_embedding_model() -> SentenceTransformer:
+def get_embedding_model():
     """
     Get or load the embedding model (cached).
     
     Returns:
-        SentenceTransformer model
+        SentenceTransformer, or OnnxSentenceEncoder for the ONNX backends
     """
     global _model
     
     if _model is None:
-        print(f"Loading embedding model: {EMBEDDING_MODEL_NAME}")
-        # Force CPU to avoid mutex lock issues on Apple Silicon
-        _model = SentenceTransformer(EMBEDDING_MODEL_NAME, device='cpu')
-        print("Model loaded successfully (CPU mode)")
+        print(f"Loading embedding model: {EMBEDDING_MODEL_NAME} ({EMBEDDING_BACKEND})")
+        if EMBEDDING_BACKEND in ('onnx', 'onnx-int8'):
+            from utils.onnx_encoder import OnnxSentenceEncoder
+            _model = OnnxSentenceEncoder(quantized=EMBEDDING_BACKEND == 'onnx-int8')
+            print(f"Model loaded successfully (ONNX Runtime: {_model.model_path})")
+        else:
+            from sentence_transformers import SentenceTransformer
+            # Force CPU to avoid mutex lock issues on Apple Silicon
+            _model = SentenceTransformer(EMBEDDING_MODEL_NAME, device='cpu')
+            print("Model loaded successfully (CPU mode)")
     
     return _model
 
 
+def encode_texts_bucketed(texts: List[str], batch_size: int = EMBEDDING_BATCH_SIZE,
+                          show_progress_bar: bool = False) -> np.ndarray:
+    """
+    Encode many texts (ingestion) in length-sorted batches.
+    
+    Texts are sorted longest-first by character length, the same proxy
+    SentenceTransformer uses, then rows are put back in input order.
+    SentenceTransformer only sorts within one encode() call; sorting the
+    whole input first also keeps lengths similar within each bulk slice
+    of the encoding service (and for the ONNX encoder, which does not
+    sort). Prints texts/sec.
+    
+    Args:
+        texts: Texts to encode, e.g. chunk texts in document order
+        batch_size: Texts per forward pass
+        show_progress_bar: Show a progress bar (direct model path only)
+        
+    Returns:
+        (len(texts), dim) embeddings in input order
+    """
+    if not texts:
+        return np.empty((0, 0), dtype=np.float32)
+    
+    start = time.perf_counter()
+    order = np.argsort([-len(text) for text in texts], kind='stable')
+    sorted_texts = [texts[i] for i in order]
+    
+    if USE_ENCODING_SERVICE:
+        from utils.encoding_service import get_encoding_service
+        sorted_embeddings = get_encoding_service().encode_batch(sorted_texts, batch_size=batch_size)
+    else:
+        sorted_embeddings = get_embedding_model().encode(sorted_texts, batch_size=batch_size,
+                                                         convert_to_numpy=True, show_progress_bar=show_progress_bar)
+    
+    embeddings = np.empty_like(sorted_embeddings)
+    embeddings[order] = sorted_embeddings
+    
+    elapsed = max(time.perf_counter() - start, 1e-9)
+    print(f"Encoded {len(texts)} texts in {elapsed:.1f}s: {len(texts) / elapsed:.1f} texts/sec")
+    
+    return embeddings
+
+
 def encode_chunks(chunks: List[Dict]) -> Tuple[np.ndarray, Dict[str, int]]:
     """
     Encode chunks into embeddings.
@@ -42,15 +101,13 @@ def encode_chunks(chunks: List[Dict]) -> Tuple[np.ndarray, Dict[str, int]]:
     """
     print("\\n=== Generating Embeddings ===")
     
-    model = get_embedding_model()
-    
     # Extract texts
     texts = [chunk["text"] for chunk in chunks]
     
     print(f"Encoding {len(texts)} chunks...")
     
-    # Generate embeddings
-    embeddings = model.encode(texts, show_progress_bar=True, convert_to_numpy=True)
+    # Generate embeddings (length-bucketed batches)
+    embeddings = encode_texts_bucketed(texts, show_progress_bar=True)
     
     # Create index mapping
     index_to_chunk_id = {str(i): chunks[i]["chunk_id"] for i in range(len(chunks))}
@@ -60,6 +117,33 @@ def encode_chunks(chunks: List[Dict]) -> Tuple[np.ndarray, Dict[str, int]]:
     return embeddings, index_to_chunk_id
 
 
+def encode_query(question: str) -> np.ndarray:
+    """
+    Encode a single question, going through the query embedding cache.
+    
+    Args:
+        question: User's question
+        
+    Returns:
+        Read-only float32 embedding vector
+    """
+    from utils.query_cache import get_query_cache
+    
+    cache = get_query_cache()
+    key = cache.make_key(question)
+    
+    embedding = cache.get(key)
+    if embedding is None:
+        if USE_ENCODING_SERVICE:
+            from utils.encoding_service import get_encoding_service
+            embedding = get_encoding_service().encode(question)
+        else:
+            embedding = get_embedding_model().encode([question], convert_to_numpy=True)[0]
+        embedding = cache.put(key, embedding)
+    
+    return embedding
+
+
 def cosine_similarity(a: np.ndarray, b: np.ndarray) -> np.ndarray:
     """
     Compute cosine similarity between vectors.
@@ -102,9 +186,8 @@ def search_similar_chunks(
     """
     print(f"\\n=== Searching for Top {top_k} Similar Chunks ===")
     
-    # Encode question
-    model = get_embedding_model()
-    question_embedding = model.encode([question], convert_to_numpy=True)[0]
+    # Encode question (cached)
+    question_embedding = encode_query(question)
     
     # Compute similarities
     similarities = cosine_similarity(question_embedding, embeddings)
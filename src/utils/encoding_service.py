@@ -0,0 +1,195 @@
+"""
+In-process micro-batching service for the embedding model.
+
+Flask threads post texts to a queue and wait on a Future. A single worker
+thread collects query requests for up to ENCODING_BATCH_MAX_WAIT_MS or
+ENCODING_BATCH_MAX_SIZE items, runs one batched encode, and resolves each
+Future with its own row.
+
+The worker is the only thread that touches the model, so concurrent
+requests never run forward passes in parallel (the reason torch was pinned
+to one thread); that thread can instead use EMBEDDING_TORCH_THREADS
+intra-op threads for each batch.
+
+Bulk (ingestion) encodes go through the same worker in slices of
+ENCODING_BULK_SLICE texts. The queue is ordered by priority: every pending
+query is taken before the next slice, so a query arriving during an upload
+waits for at most the slice being encoded, not the rest of the document.
+"""
+
+import itertools
+import queue
+import threading
+import time
+import numpy as np
+from concurrent.futures import Future
+from typing import Dict, List
+
+from utils.config import (
+    ENCODING_BATCH_MAX_SIZE,
+    ENCODING_BATCH_MAX_WAIT_MS,
+    ENCODING_BULK_SLICE,
+)
+
+
+# Queue priorities, lowest first
+QUERY_PRIORITY = 0
+BULK_PRIORITY = 1
+
+
+class _Job:
+    __slots__ = ('texts', 'future', 'bulk', 'kwargs')
+
+    def __init__(self, texts: List[str], bulk: bool = False, kwargs: Dict = None):
+        self.texts = texts
+        self.future = Future()
+        self.bulk = bulk
+        self.kwargs = kwargs or {}
+
+
+class EncodingService:
+    """Single-worker dynamic batcher in front of the embedding model"""
+
+    def __init__(self, max_batch_size: int = ENCODING_BATCH_MAX_SIZE,
+                 max_wait_ms: float = ENCODING_BATCH_MAX_WAIT_MS,
+                 bulk_slice: int = ENCODING_BULK_SLICE):
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.bulk_slice = bulk_slice
+        # (priority, sequence, job): queries first, FIFO within a priority
+        self._queue: "queue.PriorityQueue" = queue.PriorityQueue()
+        self._sequence = itertools.count()
+        self._deferred: List[_Job] = []
+        self._stats_lock = threading.Lock()
+        self.batches = 0
+        self.query_batches = 0
+        self.queries = 0
+        self.bulk_texts = 0
+        self.max_batch_seen = 0
+
+        self._worker = threading.Thread(target=self._run, name='encoding-service', daemon=True)
+        self._worker.start()
+
+    def encode(self, text: str, timeout: float = None) -> np.ndarray:
+        """Encode one query text (batched with concurrent callers)"""
+        job = _Job([text])
+        self._put(job)
+        return job.future.result(timeout)
+
+    def encode_batch(self, texts: List[str], **encode_kwargs) -> np.ndarray:
+        """
+        Encode many texts (e.g. document chunks) on the worker thread.
+
+        Texts are submitted in slices so waiting queries interleave.
+
+        Returns:
+            (len(texts), dim) embeddings in input order
+        """
+        if not texts:
+            return np.empty((0, 0), dtype=np.float32)
+
+        jobs = []
+        for start in range(0, len(texts), self.bulk_slice):
+            job = _Job(texts[start:start + self.bulk_slice], bulk=True, kwargs=encode_kwargs)
+            self._put(job)
+            jobs.append(job)
+
+        return np.vstack([job.future.result() for job in jobs])
+
+    def _put(self, job: _Job):
+        priority = BULK_PRIORITY if job.bulk else QUERY_PRIORITY
+        self._queue.put((priority, next(self._sequence), job))
+
+    def _next_job(self) -> _Job:
+        """Next job to run: any queued query first, then bulk work in submission order"""
+        if not self._deferred:
+            return self._queue.get()[2]
+        try:
+            job = self._queue.get_nowait()[2]
+        except queue.Empty:
+            return self._deferred.pop(0)
+        if job.bulk:
+            # Bulk jobs set aside by _collect() were submitted earlier
+            self._deferred.append(job)
+            return self._deferred.pop(0)
+        return job
+
+    def _collect(self, first: _Job) -> List[_Job]:
+        """Gather queued query jobs until the batch is full or max_wait passes"""
+        batch = [first]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                job = self._queue.get(timeout=remaining)[2]
+            except queue.Empty:
+                break
+            if job.bulk:
+                self._deferred.append(job)
+            else:
+                batch.append(job)
+        return batch
+
+    def _run(self):
+        from utils.embedding_utils import get_embedding_model
+
+        while True:
+            job = self._next_job()
+            jobs = [job] if job.bulk else self._collect(job)
+
+            try:
+                model = get_embedding_model()
+                if job.bulk:
+                    embeddings = model.encode(job.texts, convert_to_numpy=True, **job.kwargs)
+                    job.future.set_result(embeddings)
+                else:
+                    # Identical questions in one batch are encoded once
+                    unique = list(dict.fromkeys(j.texts[0] for j in jobs))
+                    embeddings = model.encode(unique, batch_size=len(unique), convert_to_numpy=True)
+                    rows = dict(zip(unique, embeddings))
+                    for j in jobs:
+                        j.future.set_result(rows[j.texts[0]])
+            except Exception as e:
+                for j in jobs:
+                    if not j.future.done():
+                        j.future.set_exception(e)
+                continue
+
+            with self._stats_lock:
+                self.batches += 1
+                if job.bulk:
+                    self.bulk_texts += len(job.texts)
+                else:
+                    self.query_batches += 1
+                    self.queries += len(jobs)
+                    self.max_batch_seen = max(self.max_batch_seen, len(jobs))
+
+    def stats(self) -> Dict:
+        with self._stats_lock:
+            return {
+                'batches': self.batches,
+                'queries': self.queries,
+                'bulk_texts': self.bulk_texts,
+                'avg_query_batch': round(self.queries / self.query_batches, 2) if self.query_batches else 0.0,
+                'max_query_batch': self.max_batch_seen,
+                'queue_depth': self._queue.qsize(),
+                'max_batch_size': self.max_batch_size,
+                'max_wait_ms': self.max_wait * 1000
+            }
+
+
+# Global service instance
+_service = None
+_service_lock = threading.Lock()
+
+
+def get_encoding_service() -> EncodingService:
+    """Get the shared encoding service (starts the worker on first use)"""
+    global _service
+    if _service is None:
+        with _service_lock:
+            if _service is None:
+                _service = EncodingService()
+    return _service
@@ -0,0 +1,151 @@
+"""
+Pooled keep-alive HTTP session for LLM calls.
+
+All DeepSeekClient instances post through one requests.Session whose
+connection pool is capped at LLM_POOL_SIZE, so Ollama sees reused TCP
+connections instead of a new one per call. Connection errors and 5xx
+responses are retried with full-jitter exponential backoff; timeouts are
+not retried here (callers decide, e.g. with a smaller num_predict).
+"""
+
+import random
+import threading
+import time
+import requests
+from collections import deque
+from requests.adapters import HTTPAdapter
+from typing import Dict, Tuple, Union
+
+from utils.config import (
+    LLM_POOL_SIZE,
+    LLM_MAX_RETRIES,
+    LLM_BACKOFF_BASE,
+    LLM_BACKOFF_MAX,
+    LLM_CONNECT_TIMEOUT,
+)
+
+RETRY_STATUS = {500, 502, 503, 504}
+
+Timeout = Union[float, Tuple[float, float]]
+
+
+class HttpPool:
+    """Shared session with bounded pool, retry/backoff and latency stats"""
+
+    # Latency samples kept for percentiles
+    LATENCY_WINDOW = 500
+
+    def __init__(self, pool_size: int = LLM_POOL_SIZE, max_retries: int = LLM_MAX_RETRIES,
+                 backoff_base: float = LLM_BACKOFF_BASE, backoff_max: float = LLM_BACKOFF_MAX):
+        self.pool_size = pool_size
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+
+        self.session = requests.Session()
+        # pool_block: callers wait for a free connection instead of opening extra ones
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size, pool_block=True)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+        self._lock = threading.Lock()
+        self._latencies = deque(maxlen=self.LATENCY_WINDOW)
+        self.requests = 0
+        self.retries = 0
+        self.failures = 0
+        self.in_flight = 0
+
+    def backoff(self, attempt: int) -> float:
+        """Full-jitter exponential backoff delay for a retry attempt (0-based)"""
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    def post(self, url: str, timeout: Timeout, stream: bool = False, **kwargs) -> requests.Response:
+        """
+        POST with retries on connection errors and 5xx responses.
+
+        Args:
+            url: Target URL
+            timeout: Read timeout in seconds, or a (connect, read) tuple
+            stream: Return before the body is read (latency then covers headers only)
+            **kwargs: Passed to requests (json, headers, ...)
+
+        Returns:
+            Response with a non-5xx status (raise_for_status is left to the caller)
+        """
+        if not isinstance(timeout, tuple):
+            timeout = (LLM_CONNECT_TIMEOUT, timeout)
+
+        with self._lock:
+            self.requests += 1
+            self.in_flight += 1
+
+        start = time.perf_counter()
+        try:
+            for attempt in range(self.max_retries + 1):
+                try:
+                    response = self.session.post(url, timeout=timeout, stream=stream, **kwargs)
+                except requests.exceptions.ConnectionError:
+                    if attempt == self.max_retries:
+                        raise
+                else:
+                    if response.status_code not in RETRY_STATUS or attempt == self.max_retries:
+                        return response
+                    response.close()
+
+                delay = self.backoff(attempt)
+                print(f"⚠️  LLM request failed (attempt {attempt + 1}), retrying in {delay:.2f}s...")
+                with self._lock:
+                    self.retries += 1
+                time.sleep(delay)
+        except Exception:
+            with self._lock:
+                self.failures += 1
+            raise
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+                self._latencies.append(time.perf_counter() - start)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            latencies = sorted(self._latencies)
+            in_flight = self.in_flight
+            counts = {
+                'requests': self.requests,
+                'retries': self.retries,
+                'failures': self.failures,
+            }
+
+        def percentile(p):
+            if not latencies:
+                return 0.0
+            return round(latencies[min(len(latencies) - 1, int(p * len(latencies)))] * 1000, 1)
+
+        pools = self.session.get_adapter('http://').poolmanager.pools
+        return {
+            **counts,
+            'in_flight': in_flight,
+            'pool_size': self.pool_size,
+            'open_pools': len(pools),
+            'latency_ms': {
+                'p50': percentile(0.50),
+                'p95': percentile(0.95),
+                'max': round(latencies[-1] * 1000, 1) if latencies else 0.0,
+                'samples': len(latencies)
+            }
+        }
+
+
+# Global pool instance
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_http_pool() -> HttpPool:
+    """Get the shared HTTP pool"""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = HttpPool()
+    return _pool
@@ -0,0 +1,508 @@
+"""
+Background ingestion jobs for /api/upload.
+
+Processing a PDF (page extraction, chunking, embedding, database inserts)
+takes minutes for a large offer document, far longer than an HTTP request
+should be held open. /api/upload now only saves the file and submits a job;
+a small worker pool runs the pipeline and /api/jobs/<id> reports progress.
+
+A job runs four stages in order:
+
+    extract  pages, chapters and chunks      -> <job dir>/chunks.json
+    embed    chunk embeddings                -> <job dir>/embeddings.npy
+    store    document, chunk and embedding rows (a partial attempt of
+             the same job is deleted and redone) -> <job dir>/chunk_ids.npy
+    index    embedding store, IVF index, cache invalidation, processed_at
+
+Job state is written to <INGEST_JOBS_DIR>/<job_id>/job.json after every
+change, and each stage saves its output before it is marked done. Jobs
+that were queued or running when the server stopped are resubmitted by
+resume_pending() and continue from the first unfinished stage.
+
+Document ids are reserved when the job is created, with an exclusive-create
+file under <INGEST_JOBS_DIR>/_document_ids, and the document row records
+the job that created it. A job only ever replaces or deletes its own rows;
+a failed job removes them so the upload can be retried. Every job is
+claimed by the process running it (<job dir>/owner.pid); with several
+server processes, each unfinished job is resumed by exactly one of them,
+and lookups read other processes' jobs from their job.json.
+"""
+
+import json
+import os
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Callable, Dict, Optional
+
+import numpy as np
+
+from utils.config import (
+    INGEST_JOBS_DIR,
+    INGEST_MAX_WORKERS,
+    INGEST_EMBED_SLICE,
+    EMBEDDING_MODEL_NAME,
+    USE_EMBEDDING_STORE,
+)
+
+STAGES = ('extract', 'embed', 'store', 'index')
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+
+def _now() -> str:
+    return datetime.now().isoformat(timespec='seconds')
+
+
+# Stages: each reads the previous stage's output from the job dir and saves
+# its own there; progress(fraction) reports progress within the stage
+
+def _extract(job: Dict, work_dir: str, progress: Callable[[float], None]) -> Dict:
+    from utils.pdf_utils import extract_pages
+    from utils.text_utils import detect_chapters, build_chunks
+
+    pages = extract_pages(job['filepath'])
+    progress(0.5)
+    chapters = detect_chapters(pages)
+    chunks = build_chunks(pages, chapters)
+    print(f"Extracted {len(chunks)} chunks from {len(pages)} pages")
+
+    with open(os.path.join(work_dir, 'chunks.json'), 'w') as f:
+        json.dump({'total_pages': len(pages), 'total_chapters': len(chapters), 'chunks': chunks}, f)
+    return {'total_pages': len(pages), 'total_chunks': len(chunks)}
+
+
+def _load_chunks(work_dir: str) -> Dict:
+    with open(os.path.join(work_dir, 'chunks.json'), 'r') as f:
+        return json.load(f)
+
+
+def _embed(job: Dict, work_dir: str, progress: Callable[[float], None]) -> Dict:
+    # Length-bucketed; on the encoding worker, interleaved with live queries
+    from utils.embedding_utils import encode_texts_bucketed
+
+    texts = [c['text'] for c in _load_chunks(work_dir)['chunks']]
+    parts = []
+    for start in range(0, len(texts), INGEST_EMBED_SLICE):
+        parts.append(encode_texts_bucketed(texts[start:start + INGEST_EMBED_SLICE]))
+        progress(min(1.0, (start + INGEST_EMBED_SLICE) / len(texts)))
+    embeddings = np.vstack(parts) if parts else np.empty((0, 0), dtype=np.float32)
+    print(f"Generated embeddings for {len(embeddings)} chunks")
+
+    np.save(os.path.join(work_dir, 'embeddings.npy'), embeddings)
+    return {'embedded_chunks': len(embeddings)}
+
+
+def _created_by(document: Dict, job: Dict) -> bool:
+    return (document.get('metadata') or {}).get('ingest_job_id') == job['job_id']
+
+
+def _discard_document(job: Dict):
+    """Delete the rows of a failed job's document, if this job created them"""
+    from database.repositories import DocumentRepository
+    from utils.rag_registry import get_rag_registry
+    from utils.document_meta import invalidate_document_meta
+
+    document_id = job['document_id']
+    existing = DocumentRepository.get_by_id(document_id)
+    if not existing or not _created_by(existing, job):
+        return
+    print(f"Removing rows of failed ingestion: {document_id}")
+    DocumentRepository.delete(document_id)
+    if USE_EMBEDDING_STORE:
+        from utils.embedding_store import get_embedding_store
+        get_embedding_store().delete(document_id)
+    from utils.vector_index import invalidate_document_index
+    invalidate_document_index(document_id)
+    get_rag_registry().invalidate(document_id)
+    invalidate_document_meta(document_id)
+
+
+def _store(job: Dict, work_dir: str, progress: Callable[[float], None]) -> Dict:
+    from database.repositories import DocumentRepository, ChunkRepository, EmbeddingRepository
+
+    document_id = job['document_id']
+    extracted = _load_chunks(work_dir)
+    chunks = extracted['chunks']
+    embeddings = np.load(os.path.join(work_dir, 'embeddings.npy'))
+
+    # An interrupted earlier attempt of this job may have left some rows behind (cascade delete);
+    # rows created by anything else are never touched
+    existing = DocumentRepository.get_by_id(document_id)
+    if existing:
+        if not _created_by(existing, job):
+            raise RuntimeError(f"Document id '{document_id}' already belongs to another document")
+        print(f"Removing partial rows from an earlier attempt: {document_id}")
+        DocumentRepository.delete(document_id)
+
+    doc_result = DocumentRepository.create({
+        'document_id': document_id,
+        'filename': job['filename'],
+        'display_name': os.path.splitext(job['filename'])[0].replace('_', ' ').title(),
+        'file_hash': job['file_hash'],
+        'file_path': job['filepath'],
+        'total_pages': extracted['total_pages'],
+        'total_chunks': len(chunks),
+        'doc_metadata': {
+            'total_chapters': extracted['total_chapters'],
+            'upload_date': job['created_at'],
+            'ingest_job_id': job['job_id']
+        }
+    })
+    doc_db_id = doc_result['id']
+    print(f"Created document in database: ID={doc_db_id}")
+    progress(0.1)
+
+    chunks_data = []
+    for idx, chunk in enumerate(chunks):
+        chunks_data.append({
+            'document_id': doc_db_id,
+            'chunk_index': idx,
+            'text': chunk['text'],
+            'page_number': chunk.get('page_number'),
+            'word_count': len(chunk['text'].split()),
+            'chunk_metadata': {
+                'page_numbers': chunk.get('page_numbers', []),
+                'chapter': chunk.get('chapter', '')
+            }
+        })
+
+    chunk_ids = ChunkRepository.create_many(chunks_data)
+    print(f"Inserted {len(chunk_ids)} chunks")
+    progress(0.5)
+
+    # Storage format from config
+    embeddings_data = EmbeddingRepository.build_rows(chunk_ids, embeddings, EMBEDDING_MODEL_NAME)
+    emb_count = EmbeddingRepository.create_many(embeddings_data)
+    print(f"Inserted {emb_count} embeddings")
+
+    np.save(os.path.join(work_dir, 'chunk_ids.npy'), np.asarray(chunk_ids, dtype=np.int64))
+    return {'doc_db_id': doc_db_id, 'stored_chunks': len(chunk_ids), 'stored_embeddings': emb_count}
+
+
+def _index(job: Dict, work_dir: str, progress: Callable[[float], None]) -> Dict:
+    from database.repositories import DocumentRepository
+    from utils.rag_registry import get_rag_registry
+    from utils.document_meta import invalidate_document_meta
+
+    document_id = job['document_id']
+    chunk_ids = np.load(os.path.join(work_dir, 'chunk_ids.npy')).tolist()
+    embeddings = np.load(os.path.join(work_dir, 'embeddings.npy'))
+
+    # Write the memory-mapped embedding store and drop any stale resident index
+    if USE_EMBEDDING_STORE:
+        from utils.embedding_store import get_embedding_store
+        from utils.vector_index import normalize_rows, invalidate_document_index
+        get_embedding_store().write(document_id, chunk_ids, normalize_rows(embeddings))
+        invalidate_document_index(document_id)
+    progress(0.3)
+
+    # Add the new vectors to the corpus-wide IVF index (replaces the document's entries)
+    try:
+        from utils.ivf_index import update_corpus_index
+        update_corpus_index(document_id, chunk_ids, embeddings)
+    except Exception as e:
+        print(f"⚠️ Could not update IVF index: {e}")
+    progress(0.8)
+
+    DocumentRepository.update(document_id, {
+        'total_chunks': len(chunk_ids),
+        'processed_at': datetime.now()
+    })
+    get_rag_registry().invalidate(document_id)
+    invalidate_document_meta(document_id)
+    return {}
+
+
+_STAGE_FUNCS = {'extract': _extract, 'embed': _embed, 'store': _store, 'index': _index}
+
+# Stage outputs removed once the job is done (job.json is kept)
+_WORK_FILES = ('chunks.json', 'embeddings.npy', 'chunk_ids.npy')
+
+OWNER_FILE = 'owner.pid'
+# Under jobs_dir: one file per document id held by an unfinished job
+RESERVATIONS_DIR = '_document_ids'
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class IngestionManager:
+    """Persistent ingestion jobs run by a bounded worker pool"""
+
+    def __init__(self, jobs_dir: str = INGEST_JOBS_DIR, max_workers: int = INGEST_MAX_WORKERS):
+        self.jobs_dir = jobs_dir
+        self.max_workers = max(1, max_workers)
+        os.makedirs(jobs_dir, exist_ok=True)
+
+        self.reservations_dir = os.path.join(jobs_dir, RESERVATIONS_DIR)
+        os.makedirs(self.reservations_dir, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='ingest')
+        # Jobs run by this process; jobs of other processes are read from their job.json
+        self._jobs: Dict[str, Dict] = {}
+
+    def _read_job(self, job_id: str) -> Optional[Dict]:
+        path = os.path.join(self.jobs_dir, job_id, 'job.json')
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, 'r') as f:
+                return json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            print(f"⚠️ Skipping unreadable ingestion job {job_id}: {e}")
+            return None
+
+    def _all_jobs(self) -> Dict[str, Dict]:
+        """Every job in jobs_dir, whichever process runs it; caller holds the lock"""
+        jobs = {}
+        for job_id in os.listdir(self.jobs_dir):
+            if job_id in self._jobs:
+                jobs[job_id] = self._jobs[job_id]
+            else:
+                job = self._read_job(job_id)
+                if job is not None:
+                    jobs[job_id] = job
+        return jobs
+
+    def _work_dir(self, job_id: str) -> str:
+        return os.path.join(self.jobs_dir, job_id)
+
+    def _save(self, job: Dict):
+        """Atomically persist a job; caller holds the lock"""
+        job['updated_at'] = _now()
+        path = os.path.join(self._work_dir(job['job_id']), 'job.json')
+        tmp = path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(job, f, indent=2)
+        os.replace(tmp, path)
+
+    def _claim(self, job_id: str) -> bool:
+        """Make this process the job's runner, unless another live process already is"""
+        path = os.path.join(self._work_dir(job_id), OWNER_FILE)
+        for _ in range(2):
+            try:
+                fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            except FileExistsError:
+                try:
+                    with open(path, 'r') as f:
+                        owner = int(f.read().strip() or 0)
+                except (OSError, ValueError):
+                    owner = 0
+                if owner == os.getpid():
+                    return True
+                if owner and _pid_alive(owner):
+                    return False
+                # Left by a process that is gone: take it over
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                continue
+            with os.fdopen(fd, 'w') as f:
+                f.write(str(os.getpid()))
+            return True
+        return False
+
+    def _reserve(self, document_id: str, job_id: str) -> bool:
+        """Take a document id for a job (exclusive create, so it holds across processes)"""
+        try:
+            fd = os.open(os.path.join(self.reservations_dir, document_id), os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            return False
+        with os.fdopen(fd, 'w') as f:
+            f.write(job_id)
+        return True
+
+    def _release(self, document_id: str, job_id: str):
+        """Drop a job's id reservation once the document row holds the id (or the job failed)"""
+        path = os.path.join(self.reservations_dir, document_id)
+        try:
+            with open(path, 'r') as f:
+                owner = f.read().strip()
+            if owner == job_id:
+                os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def _reserved_document_ids(self) -> set:
+        """Document ids reserved by unfinished jobs of any process (not yet in the database)"""
+        return set(os.listdir(self.reservations_dir))
+
+    def submit(self, filename: str, filepath: str, file_hash: str,
+               make_document_id: Callable[[set], str]) -> Dict:
+        """
+        Create a job for an uploaded file and queue it; returns the job.
+
+        make_document_id(reserved_ids) picks the document id from the ids
+        reserved by unfinished jobs. The pick is then reserved with an
+        exclusive-create file in jobs_dir, retrying if another upload (in
+        any process) took it first, so no two jobs get the same id.
+        """
+        job_id = uuid.uuid4().hex[:16]
+        os.makedirs(self._work_dir(job_id), exist_ok=True)
+        self._claim(job_id)
+        with self._lock:
+            reserved = self._reserved_document_ids()
+            while True:
+                document_id = make_document_id(reserved)
+                if self._reserve(document_id, job_id):
+                    break
+                reserved.add(document_id)
+            job = {
+                'job_id': job_id,
+                'document_id': document_id,
+                'filename': filename,
+                'filepath': filepath,
+                'file_hash': file_hash,
+                'status': QUEUED,
+                'stage': None,
+                'progress': 0.0,
+                'stages': {stage: {'status': 'pending', 'seconds': None} for stage in STAGES},
+                'result': {},
+                'error': None,
+                'created_at': _now(),
+                'finished_at': None,
+            }
+            self._jobs[job_id] = job
+            self._save(job)
+        self._executor.submit(self._run, job_id)
+        print(f"📥 Queued ingestion job {job_id} for {document_id}")
+        return self.get(job_id)
+
+    def resume_pending(self) -> int:
+        """Requeue jobs interrupted by a restart (unless another live process runs them); returns how many"""
+        with self._lock:
+            unfinished = [job_id for job_id, job in self._all_jobs().items()
+                          if job['status'] in (QUEUED, RUNNING) and job_id not in self._jobs]
+        pending = []
+        for job_id in unfinished:
+            if not self._claim(job_id):
+                continue
+            # Re-read after claiming: the previous runner may have finished it meanwhile
+            job = self._read_job(job_id)
+            if job is not None and job['status'] in (QUEUED, RUNNING):
+                pending.append(job_id)
+                with self._lock:
+                    job['status'] = QUEUED
+                    self._jobs[job_id] = job
+                    self._save(job)
+        for job_id in pending:
+            self._executor.submit(self._run, job_id)
+        if pending:
+            print(f"📥 Resuming {len(pending)} ingestion job(s)")
+        return len(pending)
+
+    def _run(self, job_id: str):
+        with self._lock:
+            job = self._jobs[job_id]
+            job['status'] = RUNNING
+            self._save(job)
+            snapshot = json.loads(json.dumps(job))
+        work_dir = self._work_dir(job_id)
+
+        try:
+            for i, stage in enumerate(STAGES):
+                if snapshot['stages'][stage]['status'] == DONE:
+                    continue
+
+                def progress(fraction: float, i=i):
+                    with self._lock:
+                        job['progress'] = round((i + max(0.0, min(1.0, fraction))) / len(STAGES), 3)
+                        self._save(job)
+
+                with self._lock:
+                    job['stage'] = stage
+                    job['stages'][stage]['status'] = RUNNING
+                    self._save(job)
+
+                print(f"⚙️ Ingestion {job_id} [{job['document_id']}]: {stage}")
+                start = time.perf_counter()
+                result = _STAGE_FUNCS[stage](snapshot, work_dir, progress)
+
+                with self._lock:
+                    job['stages'][stage] = {'status': DONE, 'seconds': round(time.perf_counter() - start, 2)}
+                    job['result'].update(result)
+                    job['progress'] = round((i + 1) / len(STAGES), 3)
+                    self._save(job)
+
+            with self._lock:
+                job['status'] = DONE
+                job['stage'] = None
+                job['finished_at'] = _now()
+                self._save(job)
+            self._release(job['document_id'], job_id)
+            for name in _WORK_FILES:
+                path = os.path.join(work_dir, name)
+                if os.path.exists(path):
+                    os.remove(path)
+            print(f"✅ Ingestion {job_id} done: {job['document_id']}")
+
+        except Exception as e:
+            traceback.print_exc()
+            with self._lock:
+                job['status'] = FAILED
+                job['error'] = str(e)
+                if job['stage']:
+                    job['stages'][job['stage']]['status'] = FAILED
+                job['finished_at'] = _now()
+                self._save(job)
+            try:
+                _discard_document(snapshot)
+            except Exception as cleanup_error:
+                print(f"⚠️ Could not remove partial rows of {job['document_id']}: {cleanup_error}")
+            self._release(job['document_id'], job_id)
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        """Copy of a job's state, also for jobs run by another process (None if unknown)"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None:
+                return json.loads(json.dumps(job))
+        if os.path.basename(job_id) != job_id or job_id == RESERVATIONS_DIR:
+            return None
+        return self._read_job(job_id)
+
+    def find_active(self, file_hash: str) -> Optional[Dict]:
+        """Unfinished job (of any process) for the same file, if any"""
+        with self._lock:
+            for job in self._all_jobs().values():
+                if job['file_hash'] == file_hash and job['status'] in (QUEUED, RUNNING):
+                    return json.loads(json.dumps(job))
+        return None
+
+    def stats(self) -> Dict:
+        with self._lock:
+            counts = {status: 0 for status in (QUEUED, RUNNING, DONE, FAILED)}
+            for job in self._all_jobs().values():
+                counts[job['status']] += 1
+        return {'max_workers': self.max_workers, **counts}
+
+
+# Global manager instance
+_manager = None
+_manager_lock = threading.Lock()
+
+
+def get_ingestion_manager() -> IngestionManager:
+    """Get the shared ingestion job manager"""
+    global _manager
+    if _manager is None:
+        with _manager_lock:
+            if _manager is None:
+                _manager = IngestionManager()
+    return _manager
@@ -0,0 +1,438 @@
+"""
+Inverted-file (IVF) approximate index for corpus-wide vector search.
+
+All chunk embeddings across documents are clustered with spherical
+k-means into `nlist` lists. A query is compared with the centroids first
+and only the `nprobe` closest lists are scanned exactly, so search cost
+grows with nprobe/nlist of the corpus instead of all of it.
+
+The index is persisted under IVF_INDEX_DIR and updated incrementally when
+a document is (re)ingested; the centroids are retrained once the corpus
+has grown well past the size they were trained on.
+
+Each save writes a new version directory (one .npy per array plus
+meta.json) and then publishes it by replacing the CURRENT pointer file, a
+single rename, so readers never pair new metadata with old arrays. Arrays
+are opened with mmap_mode='r', so every process shares the page cache
+copy of the vectors instead of holding a private one.
+
+Writers (a build, or a document update's load-modify-save) hold an
+exclusive flock on IVF_INDEX_DIR/LOCK, so two processes ingesting at once
+each add their document to the other's version instead of replacing it.
+"""
+
+import fcntl
+import json
+import os
+import shutil
+import threading
+import time
+import numpy as np
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from utils.config import (
+    EMBEDDING_MODEL_NAME,
+    DEFAULT_TOP_K,
+    IVF_INDEX_DIR,
+    IVF_NLIST,
+    IVF_NPROBE,
+    IVF_RETRAIN_GROWTH,
+)
+from utils.vector_index import normalize_rows, top_k_indices, load_document_matrix
+from database.repositories import DocumentRepository, ChunkRepository
+
+INDEX_VERSION = 2
+CURRENT_FILE = "CURRENT"  # name of the published version directory
+META_FILE = "meta.json"
+ARRAYS = ('centroids', 'vectors', 'chunk_ids', 'doc_codes', 'assignments')
+KEEP_VERSIONS = 2  # published versions kept on disk (older ones are removed)
+LOCK_FILE = "LOCK"  # flock held by writers across processes
+LOAD_ATTEMPTS = 3  # load() re-reads CURRENT when the version it named was removed meanwhile
+
+# Rows per block when assigning vectors to centroids
+ASSIGN_BLOCK_ROWS = 8192
+
+
+def auto_nlist(num_vectors: int) -> int:
+    """Roughly sqrt(N) lists, at least 1 and at most N"""
+    return int(max(1, min(num_vectors, round(np.sqrt(num_vectors)))))
+
+
+def assign_to_centroids(vectors: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    """Index of the nearest (max cosine) centroid for every vector"""
+    assignments = np.empty(len(vectors), dtype=np.int32)
+    for start in range(0, len(vectors), ASSIGN_BLOCK_ROWS):
+        block = vectors[start:start + ASSIGN_BLOCK_ROWS]
+        assignments[start:start + len(block)] = np.argmax(block @ centroids.T, axis=1)
+    return assignments
+
+
+def train_kmeans(vectors: np.ndarray, nlist: int, iterations: int = 20,
+                 sample_per_list: int = 256, seed: int = 0) -> np.ndarray:
+    """
+    Spherical k-means on normalized vectors.
+
+    Trains on at most nlist * sample_per_list rows. Empty clusters are
+    re-seeded from random training rows.
+
+    Returns:
+        (nlist, dim) normalized float32 centroids
+    """
+    rng = np.random.default_rng(seed)
+
+    if len(vectors) > nlist * sample_per_list:
+        sample = vectors[rng.choice(len(vectors), nlist * sample_per_list, replace=False)]
+    else:
+        sample = vectors
+
+    centroids = sample[rng.choice(len(sample), nlist, replace=False)].copy()
+
+    for _ in range(iterations):
+        assignments = assign_to_centroids(sample, centroids)
+
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignments, sample)
+        counts = np.bincount(assignments, minlength=nlist)
+
+        empty = counts == 0
+        if empty.any():
+            sums[empty] = sample[rng.choice(len(sample), int(empty.sum()))]
+
+        centroids = normalize_rows(sums)
+
+    return centroids
+
+
+class IVFIndex:
+    """Immutable IVF index over the whole corpus; updates return a new index"""
+
+    def __init__(self, centroids: np.ndarray, vectors: np.ndarray, chunk_ids: np.ndarray,
+                 doc_codes: np.ndarray, documents: List[str], assignments: np.ndarray,
+                 trained_size: int, model_name: str = EMBEDDING_MODEL_NAME):
+        self.centroids = centroids
+        self.vectors = vectors
+        self.chunk_ids = chunk_ids
+        self.doc_codes = doc_codes          # row -> position in self.documents
+        self.documents = documents
+        self.assignments = assignments
+        self.trained_size = trained_size
+        self.model_name = model_name
+
+        # Inverted lists: rows grouped by centroid
+        self._order = np.argsort(assignments, kind='stable').astype(np.int64)
+        self._offsets = np.searchsorted(assignments[self._order], np.arange(len(centroids) + 1))
+
+    @property
+    def nlist(self) -> int:
+        return len(self.centroids)
+
+    def __len__(self):
+        return len(self.chunk_ids)
+
+    # ------------------------------------------
+    # Building
+    # ------------------------------------------
+
+    @classmethod
+    def build(cls, document_vectors: Dict[str, Tuple[List[int], np.ndarray]],
+              nlist: int = IVF_NLIST) -> "IVFIndex":
+        """
+        Train centroids and assign every vector.
+
+        Args:
+            document_vectors: document_id -> (chunk_ids, embeddings matrix)
+            nlist: number of lists (0 = auto, ~sqrt of corpus size)
+        """
+        documents, chunk_ids, doc_codes, matrices = [], [], [], []
+        for document_id, (ids, matrix) in sorted(document_vectors.items()):
+            if not len(ids):
+                continue
+            documents.append(document_id)
+            chunk_ids.append(np.asarray(ids, dtype=np.int64))
+            doc_codes.append(np.full(len(ids), len(documents) - 1, dtype=np.int32))
+            matrices.append(normalize_rows(matrix))
+
+        if not matrices:
+            raise ValueError("No embeddings to index")
+
+        vectors = np.ascontiguousarray(np.vstack(matrices))
+        nlist = min(nlist or auto_nlist(len(vectors)), len(vectors))
+
+        print(f"Training IVF index: {len(vectors)} vectors, {len(documents)} documents, nlist={nlist}")
+        centroids = train_kmeans(vectors, nlist)
+
+        return cls(
+            centroids=centroids,
+            vectors=vectors,
+            chunk_ids=np.concatenate(chunk_ids),
+            doc_codes=np.concatenate(doc_codes),
+            documents=documents,
+            assignments=assign_to_centroids(vectors, centroids),
+            trained_size=len(vectors)
+        )
+
+    @classmethod
+    def build_from_database(cls, nlist: int = IVF_NLIST) -> "IVFIndex":
+        """Build over every document in the database (via the embedding store)"""
+        document_vectors = {}
+        for doc in DocumentRepository.get_all():
+            document_vectors[doc['document_id']] = load_document_matrix(doc['document_id'])
+        return cls.build(document_vectors, nlist)
+
+    def without_document(self, document_id: str) -> "IVFIndex":
+        """New index with a document's rows removed (centroids kept)"""
+        if document_id not in self.documents:
+            return self
+
+        code = self.documents.index(document_id)
+        keep = self.doc_codes != code
+        doc_codes = self.doc_codes[keep]
+        doc_codes = np.where(doc_codes > code, doc_codes - 1, doc_codes).astype(np.int32)
+
+        return IVFIndex(
+            centroids=self.centroids,
+            vectors=self.vectors[keep],
+            chunk_ids=self.chunk_ids[keep],
+            doc_codes=doc_codes,
+            documents=[d for d in self.documents if d != document_id],
+            assignments=self.assignments[keep],
+            trained_size=self.trained_size,
+            model_name=self.model_name
+        )
+
+    def with_document(self, document_id: str, chunk_ids, matrix: np.ndarray) -> "IVFIndex":
+        """
+        New index with a document's vectors (re)assigned to the existing
+        centroids. Retrains once the corpus outgrows IVF_RETRAIN_GROWTH x
+        the size the centroids were trained on.
+        """
+        base = self.without_document(document_id)
+        if not len(chunk_ids):
+            return base
+
+        matrix = normalize_rows(matrix)
+
+        if len(base) + len(matrix) > IVF_RETRAIN_GROWTH * self.trained_size:
+            document_vectors = {
+                doc: (base.chunk_ids[base.doc_codes == code], base.vectors[base.doc_codes == code])
+                for code, doc in enumerate(base.documents)
+            }
+            document_vectors[document_id] = (chunk_ids, matrix)
+            return IVFIndex.build(document_vectors, IVF_NLIST)
+
+        return IVFIndex(
+            centroids=base.centroids,
+            vectors=np.vstack([base.vectors, matrix]),
+            chunk_ids=np.concatenate([base.chunk_ids, np.asarray(chunk_ids, dtype=np.int64)]),
+            doc_codes=np.concatenate([base.doc_codes, np.full(len(matrix), len(base.documents), dtype=np.int32)]),
+            documents=base.documents + [document_id],
+            assignments=np.concatenate([base.assignments, assign_to_centroids(matrix, base.centroids)]),
+            trained_size=base.trained_size,
+            model_name=base.model_name
+        )
+
+    # ------------------------------------------
+    # Search
+    # ------------------------------------------
+
+    def search(self, query_embedding, top_k: int = DEFAULT_TOP_K,
+               nprobe: int = IVF_NPROBE) -> List[Tuple[int, float, str]]:
+        """
+        Approximate top-k over the corpus.
+
+        Returns:
+            List of (chunk_id, similarity, document_id) tuples, best first
+        """
+        if len(self) == 0:
+            return []
+
+        query = normalize_rows(query_embedding)
+        probe = top_k_indices(self.centroids @ query, max(1, nprobe))
+
+        rows = np.concatenate([self._order[self._offsets[c]:self._offsets[c + 1]] for c in probe])
+        if not len(rows):
+            return []
+
+        scores = self.vectors[rows] @ query
+        best = top_k_indices(scores, top_k)
+
+        return [
+            (int(self.chunk_ids[rows[i]]), float(scores[i]), self.documents[self.doc_codes[rows[i]]])
+            for i in best
+        ]
+
+    # ------------------------------------------
+    # Persistence
+    # ------------------------------------------
+
+    def save(self, index_dir: str = IVF_INDEX_DIR):
+        """Write a new version directory and publish it atomically (pointer file rename)"""
+        os.makedirs(index_dir, exist_ok=True)
+
+        version = f"v{time.time_ns()}"
+        tmp_dir = os.path.join(index_dir, version + ".tmp")
+        os.makedirs(tmp_dir)
+        for name in ARRAYS:
+            np.save(os.path.join(tmp_dir, name + ".npy"), np.ascontiguousarray(getattr(self, name)))
+        meta = {
+            'version': INDEX_VERSION,
+            'model_name': self.model_name,
+            'nlist': self.nlist,
+            'trained_size': self.trained_size,
+            'total_vectors': len(self),
+            'documents': self.documents,
+            'updated_at': datetime.now().isoformat()
+        }
+        with open(os.path.join(tmp_dir, META_FILE), 'w') as f:
+            json.dump(meta, f, indent=2)
+        os.rename(tmp_dir, os.path.join(index_dir, version))
+
+        pointer_tmp = os.path.join(index_dir, CURRENT_FILE + ".tmp")
+        with open(pointer_tmp, 'w') as f:
+            f.write(version)
+        os.replace(pointer_tmp, os.path.join(index_dir, CURRENT_FILE))
+
+        # Processes still mapping an old version keep their mapping after removal
+        versions = sorted(d for d in os.listdir(index_dir)
+                          if d.startswith('v') and os.path.isdir(os.path.join(index_dir, d)))
+        for old in versions[:-KEEP_VERSIONS]:
+            shutil.rmtree(os.path.join(index_dir, old), ignore_errors=True)
+
+    @classmethod
+    def load(cls, index_dir: str = IVF_INDEX_DIR) -> Optional["IVFIndex"]:
+        """
+        Memory-map the published index, or None if missing / incompatible.
+
+        A save in another process removes versions older than KEEP_VERSIONS,
+        possibly the one CURRENT named when we read it; the load then starts
+        over from the new CURRENT.
+        """
+        for _ in range(LOAD_ATTEMPTS):
+            try:
+                with open(os.path.join(index_dir, CURRENT_FILE), 'r') as f:
+                    version_dir = os.path.join(index_dir, f.read().strip())
+            except OSError:
+                return None
+
+            try:
+                with open(os.path.join(version_dir, META_FILE), 'r') as f:
+                    meta = json.load(f)
+                if meta.get('version') != INDEX_VERSION or meta.get('model_name') != EMBEDDING_MODEL_NAME:
+                    print(f"Ignoring stale IVF index (version {meta.get('version')}, model {meta.get('model_name')})")
+                    return None
+                arrays = {name: np.load(os.path.join(version_dir, name + ".npy"), mmap_mode='r') for name in ARRAYS}
+            except (OSError, ValueError):
+                continue  # version removed (or replaced) while opening it
+
+            return cls(
+                documents=meta['documents'],
+                trained_size=meta['trained_size'],
+                model_name=meta['model_name'],
+                **arrays
+            )
+        return None
+
+
+# Global corpus index, reloaded when another process publishes a new version
+_corpus_index: Optional[IVFIndex] = None
+_corpus_mtime: Optional[tuple] = None
+_lock = threading.Lock()
+
+
+def _index_mtime() -> Optional[tuple]:
+    """Identity of the CURRENT pointer (a publish replaces it with a new file)"""
+    try:
+        st = os.stat(os.path.join(IVF_INDEX_DIR, CURRENT_FILE))
+        return st.st_ino, st.st_mtime_ns
+    except OSError:
+        return None
+
+
+@contextmanager
+def _writer_lock(index_dir: str = IVF_INDEX_DIR):
+    """Exclusive across processes; taken after the in-process _lock"""
+    os.makedirs(index_dir, exist_ok=True)
+    with open(os.path.join(index_dir, LOCK_FILE), 'a') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def get_corpus_index() -> IVFIndex:
+    """Get the corpus index: in memory, from disk, or built from the database"""
+    global _corpus_index, _corpus_mtime
+
+    mtime = _index_mtime()
+    if _corpus_index is not None and mtime == _corpus_mtime:
+        return _corpus_index
+
+    with _lock:
+        mtime = _index_mtime()
+        if _corpus_index is None or mtime != _corpus_mtime:
+            index = IVFIndex.load()
+            if index is None:
+                with _writer_lock():
+                    # Another process may have built it while we waited
+                    if IVFIndex.load() is None:
+                        IVFIndex.build_from_database().save()
+                # Serve from the mapped files, not the private build arrays
+                index = IVFIndex.load()
+            _corpus_index = index
+            _corpus_mtime = _index_mtime()
+
+    return _corpus_index
+
+
+def update_corpus_index(document_id: str, chunk_ids, embeddings: np.ndarray):
+    """
+    Add (or replace) a document in the persisted corpus index.
+
+    Does nothing if no index has been built yet; the first corpus search
+    builds it from the database, including this document.
+    """
+    global _corpus_index, _corpus_mtime
+
+    with _lock, _writer_lock():
+        # Under the writer lock the published version is the latest: no other process can
+        # save between this load and our save
+        index = _corpus_index if _corpus_index is not None and _index_mtime() == _corpus_mtime else IVFIndex.load()
+        if index is None:
+            return
+
+        index = index.with_document(document_id, chunk_ids, embeddings)
+        index.save()
+        _corpus_mtime = _index_mtime()
+        _corpus_index = IVFIndex.load()
+
+    print(f"IVF index updated with {document_id}: {len(index)} vectors, nlist={index.nlist}")
+
+
+def search_corpus(query_embedding, top_k: int = DEFAULT_TOP_K, nprobe: int = IVF_NPROBE) -> List[Dict]:
+    """
+    Search every document through the IVF index.
+
+    Returns the same result dicts as EmbeddingRepository.search_similar,
+    plus the document_id of each chunk.
+    """
+    hits = get_corpus_index().search(query_embedding, top_k, nprobe)
+    chunks = ChunkRepository.get_by_ids([chunk_id for chunk_id, _, _ in hits])
+
+    results = []
+    for chunk_id, score, document_id in hits:
+        chunk = chunks.get(chunk_id)
+        if not chunk:
+            continue
+        results.append({
+            'chunk_id': chunk_id,
+            'document_id': document_id,
+            'text': chunk['text'],
+            'page_number': chunk['page_number'],
+            'metadata': chunk['metadata'],
+            'similarity': score
+        })
+
+    return results
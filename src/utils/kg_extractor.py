@@ -7,6 +7,8 @@ import json
 import os
 from typing import List, Dict, Tuple
 from utils.deepseek_client import DeepSeekClient
+from utils.llm_scheduler import llm_priority, EXTRACTION
+from utils.config import KG_MAX_CONCURRENT
 
 
 class KnowledgeGraphExtractor:
@@ -71,19 +73,18 @@ Be comprehensive but precise. If unsure about an entity type or relationship, sk
         return prompt
     
     def _build_extraction_prompt(self, chunk_text: str, examples: bool = True) -> str:
-        """Build extraction prompt for a specific chunk"""
+        """Build extraction prompt for a specific chunk (static examples first, chunk text last)"""
         
-        prompt = f"""Extract all entities and relationships from the following IPO document text:
-
-TEXT:
-{chunk_text}
-
-"""
+        prompt = "Extract all entities and relationships from IPO document text.\n"
         
         if examples:
             prompt += self._get_few_shot_examples()
         
-        prompt += "\nNow extract from the above TEXT and output JSON:"
+        prompt += f"""
+TEXT:
+{chunk_text}
+
+Now extract from the above TEXT and output JSON:"""
         
         return prompt
     
@@ -174,12 +175,17 @@ OUTPUT:
         """
         extraction_prompt = self._build_extraction_prompt(chunk_text)
         
-        result = self.client.extract_with_reasoning(
-            prompt=extraction_prompt,
-            system_prompt=self.system_prompt,
-            max_tokens=4096
-        )
+        with llm_priority(EXTRACTION):
+            result = self.client.extract_with_reasoning(
+                prompt=extraction_prompt,
+                system_prompt=self.system_prompt,
+                max_tokens=4096
+            )
         
+        return self._parse_result(result)
+    
+    def _parse_result(self, result: Dict) -> Dict:
+        """Normalize an extract_with_reasoning result into entities/relationships"""
         # Parse output
         try:
             if isinstance(result['output'], str):
@@ -207,35 +213,46 @@ OUTPUT:
         self, 
         chunks: List[Dict],
         max_chunks: int = None,
-        show_progress: bool = True
+        show_progress: bool = True,
+        max_concurrent: int = KG_MAX_CONCURRENT
     ) -> List[Dict]:
         """
-        Extract from multiple chunks with progress tracking
+        Extract from multiple chunks concurrently with progress tracking
         
         Args:
             chunks: List of chunk dicts with 'text' field
             max_chunks: Limit number of chunks to process (for testing)
             show_progress: Print progress updates
+            max_concurrent: Extraction requests in flight at once
             
         Returns:
-            List of extraction results
+            List of extraction results, in chunk order
         """
         if max_chunks:
             chunks = chunks[:max_chunks]
         
-        results = []
-        total = len(chunks)
+        # Skip empty chunks but keep their original index for chunk_id fallback
+        indexed = [(i, chunk) for i, chunk in enumerate(chunks) if chunk.get('text', '').strip()]
+        prompts = [self._build_extraction_prompt(chunk['text']) for _, chunk in indexed]
         
-        for i, chunk in enumerate(chunks):
+        def progress(done, total):
             if show_progress:
-                print(f"\rExtracting from chunk {i+1}/{total}...", end='', flush=True)
-            
+                print(f"\rExtracting from chunk {done}/{total}...", end='', flush=True)
+        
+        raw_results = self.client.batch_extract(
+            prompts,
+            system_prompt=self.system_prompt,
+            max_concurrent=max_concurrent,
+            progress_callback=progress
+        )
+        
+        results = []
+        for (i, chunk), result in zip(indexed, raw_results):
             try:
-                chunk_text = chunk.get('text', '')
-                if not chunk_text.strip():
-                    continue
+                if result.get('error'):
+                    raise RuntimeError(result['error'])
                 
-                extracted = self.extract_from_chunk(chunk_text)
+                extracted = self._parse_result(result)
                 extracted['chunk_id'] = chunk.get('chunk_id', i)
                 extracted['chapter_name'] = chunk.get('chapter_name', '')
                 results.append(extracted)
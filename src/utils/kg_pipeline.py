@@ -9,6 +9,8 @@ from typing import List, Dict, Optional, Any
 from datetime import datetime
 
 from utils.deepseek_client import DeepSeekClient
+from utils.llm_scheduler import llm_priority, EXTRACTION
+from utils.config import KG_MAX_CONCURRENT, LLM_CACHE_ENABLED
 from utils.kg_prompts import (
     DEFINITIONS_PROMPT,
     ENTITY_ATTRIBUTE_PROMPT,
@@ -21,8 +23,8 @@ from utils.kg_prompts import (
 class KGPipeline:
     """Production-grade Knowledge Graph extraction pipeline"""
     
-    def __init__(self, use_local: bool = True):
-        self.client = DeepSeekClient(use_local_fallback=use_local)
+    def __init__(self, use_local: bool = True, use_cache: bool = LLM_CACHE_ENABLED):
+        self.client = DeepSeekClient(use_local_fallback=use_local, use_cache=use_cache)
         self.pipeline_version = "2.0.0"
     
     def normalize_key(self, text: str) -> str:
@@ -60,26 +62,52 @@ class KGPipeline:
     def _call_llm(self, prompt: str, max_tokens: int = 4096) -> Dict:
         """Call LLM and parse JSON response"""
         try:
-            result = self.client.query(prompt, "", max_tokens=max_tokens)
+            with llm_priority(EXTRACTION):
+                result = self.client.query(prompt, "", max_tokens=max_tokens)
             return self._extract_json(result)
         except Exception as e:
             print(f"LLM call failed: {e}")
             return {}
     
+    def _call_llm_batch(self, prompts: List[str], max_concurrent: int,
+                        progress: callable = None, max_tokens: int = 4096) -> List[tuple]:
+        """Call LLM for many prompts concurrently; returns (parsed, error) per prompt, in order"""
+        results = self.client.batch_extract(
+            prompts,
+            max_concurrent=max_concurrent,
+            max_tokens=max_tokens,
+            progress_callback=progress,
+            json_mode=False
+        )
+        return [
+            ({}, r['error']) if r.get('error') else (self._extract_json(r.get('output', '')), None)
+            for r in results
+        ]
+    
+    def _attach_evidence(self, items: List[Dict], chunk: Dict) -> List[Dict]:
+        """Set evidence page/section/chunk_id from the chunk the prompt was built from"""
+        for item in items:
+            evidence = item.get('evidence')
+            if not isinstance(evidence, dict):
+                evidence = {'quote': evidence} if isinstance(evidence, str) else {}
+            evidence['page'] = chunk.get('page_number', 0)
+            evidence['section'] = chunk.get('section_title', '')
+            evidence['chunk_id'] = chunk.get('chunk_id', '')
+            item['evidence'] = evidence
+        return items
+    
     # ==========================================
     # Stage 1: Definitions Extraction
     # ==========================================
     
     def extract_definitions(self, chunk: Dict) -> List[Dict]:
         """Extract defined terms from a chunk"""
-        prompt = DEFINITIONS_PROMPT.format(
-            chunk_text=chunk['text'],
-            page_number=chunk.get('page_number', 0),
-            section_title=chunk.get('section_title', ''),
-            chunk_id=chunk.get('chunk_id', '')
-        )
-        
-        result = self._call_llm(prompt)
+        return self._postprocess_definitions(self._call_llm(self._definitions_prompt(chunk)), chunk)
+    
+    def _definitions_prompt(self, chunk: Dict) -> str:
+        return DEFINITIONS_PROMPT.format(chunk_text=chunk['text'])
+    
+    def _postprocess_definitions(self, result: Dict, chunk: Dict) -> List[Dict]:
         terms = result.get('defined_terms', [])
         
         # Post-process
@@ -87,7 +115,7 @@ class KGPipeline:
             if 'term_normalized' not in term:
                 term['term_normalized'] = self.normalize_key(term.get('term', ''))
         
-        return terms
+        return self._attach_evidence(terms, chunk)
     
     # ==========================================
     # Stage 2: Entity + Attribute Extraction
@@ -95,14 +123,12 @@ class KGPipeline:
     
     def extract_entities(self, chunk: Dict) -> List[Dict]:
         """Extract entities and attributes from a chunk"""
-        prompt = ENTITY_ATTRIBUTE_PROMPT.format(
-            chunk_text=chunk['text'],
-            page_number=chunk.get('page_number', 0),
-            section_title=chunk.get('section_title', ''),
-            chunk_id=chunk.get('chunk_id', '')
-        )
-        
-        result = self._call_llm(prompt)
+        return self._postprocess_entities(self._call_llm(self._entities_prompt(chunk)), chunk)
+    
+    def _entities_prompt(self, chunk: Dict) -> str:
+        return ENTITY_ATTRIBUTE_PROMPT.format(chunk_text=chunk['text'])
+    
+    def _postprocess_entities(self, result: Dict, chunk: Dict) -> List[Dict]:
         entities = result.get('entities', [])
         
         # Post-process
@@ -115,7 +141,7 @@ class KGPipeline:
             if entity.get('type') not in valid_types:
                 entity['type'] = 'Unknown'
         
-        return entities
+        return self._attach_evidence(entities, chunk)
     
     # ==========================================
     # Stage 3: Relationship Extraction
@@ -123,17 +149,17 @@ class KGPipeline:
     
     def extract_relationships(self, chunk: Dict, known_entities: List[str]) -> List[Dict]:
         """Extract relationships from a chunk"""
+        return self._postprocess_relationships(self._call_llm(self._relationships_prompt(chunk, known_entities)), chunk)
+    
+    def _relationships_prompt(self, chunk: Dict, known_entities: List[str]) -> str:
         entity_list = "\n".join([f"- {e}" for e in known_entities[:50]])  # Limit to 50
         
-        prompt = RELATIONSHIP_PROMPT.format(
+        return RELATIONSHIP_PROMPT.format(
             chunk_text=chunk['text'],
-            entity_list=entity_list,
-            page_number=chunk.get('page_number', 0),
-            section_title=chunk.get('section_title', ''),
-            chunk_id=chunk.get('chunk_id', '')
+            entity_list=entity_list
         )
-        
-        result = self._call_llm(prompt)
+    
+    def _postprocess_relationships(self, result: Dict, chunk: Dict) -> List[Dict]:
         relationships = result.get('relationships', [])
         
         # Validate predicate types
@@ -148,7 +174,7 @@ class KGPipeline:
             if rel.get('predicate') not in valid_predicates:
                 rel['predicate'] = 'related_to'  # Fallback
         
-        return relationships
+        return self._attach_evidence(relationships, chunk)
     
     # ==========================================
     # Stage 4: Event Extraction
@@ -156,14 +182,12 @@ class KGPipeline:
     
     def extract_events(self, chunk: Dict) -> List[Dict]:
         """Extract events from a chunk"""
-        prompt = EVENT_PROMPT.format(
-            chunk_text=chunk['text'],
-            page_number=chunk.get('page_number', 0),
-            section_title=chunk.get('section_title', ''),
-            chunk_id=chunk.get('chunk_id', '')
-        )
-        
-        result = self._call_llm(prompt)
+        return self._postprocess_events(self._call_llm(self._events_prompt(chunk)), chunk)
+    
+    def _events_prompt(self, chunk: Dict) -> str:
+        return EVENT_PROMPT.format(chunk_text=chunk['text'])
+    
+    def _postprocess_events(self, result: Dict, chunk: Dict) -> List[Dict]:
         events = result.get('events', [])
         
         # Parse dates
@@ -171,7 +195,7 @@ class KGPipeline:
             if event.get('date') and not self._is_valid_date(event['date']):
                 event['date'] = None  # Keep date_text only
         
-        return events
+        return self._attach_evidence(events, chunk)
     
     def _is_valid_date(self, date_str: str) -> bool:
         """Check if date string is valid YYYY-MM-DD format"""
@@ -185,19 +209,21 @@ class KGPipeline:
     # Stage 5: Entity Resolution
     # ==========================================
     
-    def resolve_entities(self, entities: List[Dict], batch_size: int = 20) -> Dict:
+    def resolve_entities(self, entities: List[Dict], batch_size: int = 20,
+                         max_concurrent: int = KG_MAX_CONCURRENT) -> Dict:
         """Find duplicate entities to merge"""
-        # Process in batches
+        # Process in batches (concurrently)
         all_merge_candidates = []
         all_aliases = []
         
-        for i in range(0, len(entities), batch_size):
-            batch = entities[i:i+batch_size]
-            batch_json = json.dumps(batch, indent=2)
-            
-            prompt = ENTITY_RESOLUTION_PROMPT.format(entity_batch_json=batch_json)
-            result = self._call_llm(prompt)
-            
+        prompts = [
+            ENTITY_RESOLUTION_PROMPT.format(entity_batch_json=json.dumps(entities[i:i+batch_size], indent=2))
+            for i in range(0, len(entities), batch_size)
+        ]
+        
+        for result, error in self._call_llm_batch(prompts, max_concurrent):
+            if error:
+                print(f"LLM call failed: {error}")
             all_merge_candidates.extend(result.get('merge_candidates', []))
             all_aliases.extend(result.get('confirmed_aliases', []))
         
@@ -254,9 +280,19 @@ class KGPipeline:
     def process_document(
         self, 
         chunks: List[Dict], 
-        progress_callback: callable = None
+        progress_callback: callable = None,
+        max_concurrent: int = KG_MAX_CONCURRENT
     ) -> Dict:
-        """Process all chunks in a document"""
+        """
+        Process all chunks in a document
+        
+        Runs in two concurrent phases through client.batch_extract:
+          1. definitions, entities and events for every chunk (independent)
+          2. relationships, where chunk i sees the entities found in chunks
+             0..i-1 - the same known-entity list the sequential loop built
+        
+        progress_callback is called as (completed_prompts, total_prompts).
+        """
         all_results = {
             'pipeline_version': self.pipeline_version,
             'processed_at': datetime.now().isoformat(),
@@ -268,31 +304,67 @@ class KGPipeline:
             'errors': []
         }
         
+        total_prompts = 4 * len(chunks)
+        
+        def progress(offset):
+            def report(done, _total):
+                if progress_callback:
+                    progress_callback(offset + done, total_prompts)
+                print(f"\rProcessing prompt {offset + done}/{total_prompts}...", end='', flush=True)
+            return report
+        
+        # Phase 1: definitions, entities, events (3 prompts per chunk)
+        stages = [
+            ('definitions', self._definitions_prompt, self._postprocess_definitions),
+            ('entities', self._entities_prompt, self._postprocess_entities),
+            ('events', self._events_prompt, self._postprocess_events),
+        ]
+        prompts = [build(chunk) for chunk in chunks for _, build, _ in stages]
+        phase1 = self._call_llm_batch(prompts, max_concurrent, progress(0))
+        
+        chunk_results = []
+        for i in range(len(chunks)):
+            result = {'defined_terms': [], 'entities': [], 'events': [], 'relationships': [], 'errors': []}
+            for j, (stage, _, postprocess) in enumerate(stages):
+                parsed, error = phase1[3 * i + j]
+                key = 'defined_terms' if stage == 'definitions' else stage
+                try:
+                    if error:
+                        raise RuntimeError(error)
+                    result[key] = postprocess(parsed, chunks[i])
+                except Exception as e:
+                    result['errors'].append(f"{stage}: {str(e)}")
+            chunk_results.append(result)
+        
+        # Phase 2: relationships, with entities from all preceding chunks
         known_entities = []
+        prompts = []
+        for chunk, result in zip(chunks, chunk_results):
+            prompts.append(self._relationships_prompt(chunk, known_entities))
+            known_entities.extend([e['name'] for e in result['entities']])
+        phase2 = self._call_llm_batch(prompts, max_concurrent, progress(3 * len(chunks)))
         
-        for i, chunk in enumerate(chunks):
-            if progress_callback:
-                progress_callback(i + 1, len(chunks))
-            
-            print(f"\rProcessing chunk {i+1}/{len(chunks)}...", end='', flush=True)
-            
-            result = self.process_chunk(chunk, known_entities)
-            
-            # Accumulate results
+        for chunk, result, (parsed, error) in zip(chunks, chunk_results, phase2):
+            try:
+                if error:
+                    raise RuntimeError(error)
+                result['relationships'] = self._postprocess_relationships(parsed, chunk)
+            except Exception as e:
+                result['errors'].append(f"relationships: {str(e)}")
+        
+        # Accumulate results (chunk order)
+        for result in chunk_results:
             all_results['defined_terms'].extend(result['defined_terms'])
             all_results['entities'].extend(result['entities'])
             all_results['relationships'].extend(result['relationships'])
             all_results['events'].extend(result['events'])
             all_results['errors'].extend(result['errors'])
-            
-            # Update known entities for next chunk
-            known_entities.extend([e['name'] for e in result['entities']])
         
         print(f"\n✅ Processed {len(chunks)} chunks")
         
         # Stage 5: Entity resolution
         print("Resolving entities...")
-        resolution = self.resolve_entities(all_results['entities'])
+        resolution = self.resolve_entities(all_results['entities'], max_concurrent=max_concurrent)
         all_results['merge_candidates'] = resolution['merge_candidates']
         all_results['confirmed_aliases'] = resolution['confirmed_aliases']
         
@@ -313,7 +385,7 @@ class KGPipeline:
 # Convenience function for CLI usage
 # ==========================================
 
-def run_pipeline(document_id: str, chunks_path: str, output_path: str):
+def run_pipeline(document_id: str, chunks_path: str, output_path: str, use_cache: bool = LLM_CACHE_ENABLED):
     """Run pipeline on a document"""
     import json
     
@@ -327,7 +399,7 @@ def run_pipeline(document_id: str, chunks_path: str, output_path: str):
             chunk['chunk_id'] = f"{document_id}_chunk_{i}"
     
     # Run pipeline
-    pipeline = KGPipeline()
+    pipeline = KGPipeline(use_cache=use_cache)
     results = pipeline.process_document(chunks)
     
     # Save results
@@ -1,6 +1,11 @@
 """
 Production KG Extraction Prompt Templates
 Specialized prompts for each extraction stage
+
+Static instructions come first and the per-chunk text last, so every
+prompt of a stage shares one long prefix the backend can reuse. Evidence
+page, section and chunk_id are not asked of the model: KGPipeline fills
+them from the chunk each prompt was built from.
 """
 
 # ============================================
@@ -9,14 +14,6 @@ Specialized prompts for each extraction stage
 
 DEFINITIONS_PROMPT = """You are extracting defined terms from an IPO DRHP document.
 
-TEXT:
-{chunk_text}
-
-METADATA:
-- Page: {page_number}
-- Section: {section_title}
-- Chunk ID: {chunk_id}
-
 PATTERNS TO DETECT:
 - "X" means/refers to/shall mean...
 - "X" = definition...
@@ -32,10 +29,7 @@ OUTPUT FORMAT (strict JSON only):
       "definition": "the full definition text",
       "aliases": ["other names for same concept"],
       "evidence": {{
-        "quote": "exact quote from text (max 25 words)",
-        "page": {page_number},
-        "section": "{section_title}",
-        "chunk_id": "{chunk_id}"
+        "quote": "exact quote from text (max 25 words)"
       }}
     }}
   ]
@@ -47,6 +41,9 @@ RULES:
 3. If no definitions found, return {{"defined_terms": []}}
 4. Do not add commentary, only JSON
 
+TEXT:
+{chunk_text}
+
 OUTPUT:"""
 
 
@@ -56,14 +53,6 @@ OUTPUT:"""
 
 ENTITY_ATTRIBUTE_PROMPT = """You are extracting entities and attributes from an IPO document.
 
-TEXT:
-{chunk_text}
-
-METADATA:
-- Page: {page_number}
-- Section: {section_title}
-- Chunk ID: {chunk_id}
-
 ENTITY TYPES (only use these):
 - Company: registered companies (inc. subsidiaries, JVs)
 - Person: individuals (directors, promoters, shareholders)
@@ -96,10 +85,7 @@ OUTPUT FORMAT (strict JSON only):
         "address": "full address"
       }},
       "evidence": {{
-        "quote": "exact quote (max 25 words)",
-        "page": {page_number},
-        "section": "{section_title}",
-        "chunk_id": "{chunk_id}"
+        "quote": "exact quote (max 25 words)"
       }}
     }}
   ]
@@ -111,6 +97,9 @@ RULES:
 3. Extract ALL entities visible in the text
 4. If none found, return {{"entities": []}}
 
+TEXT:
+{chunk_text}
+
 OUTPUT:"""
 
 
@@ -120,17 +109,6 @@ OUTPUT:"""
 
 RELATIONSHIP_PROMPT = """You are extracting relationships between entities from an IPO document.
 
-TEXT:
-{chunk_text}
-
-KNOWN ENTITIES IN THIS DOCUMENT:
-{entity_list}
-
-METADATA:
-- Page: {page_number}
-- Section: {section_title}
-- Chunk ID: {chunk_id}
-
 RELATIONSHIP TYPES (only use these):
 - subsidiary_of: X is subsidiary of Y
 - parent_of: X is parent company of Y
@@ -158,10 +136,7 @@ OUTPUT FORMAT (strict JSON only):
         "effective_date": "2021-04-01"
       }},
       "evidence": {{
-        "quote": "exact quote (max 25 words)",
-        "page": {page_number},
-        "section": "{section_title}",
-        "chunk_id": "{chunk_id}"
+        "quote": "exact quote (max 25 words)"
       }}
     }}
   ]
@@ -172,6 +147,12 @@ RULES:
 2. Include numeric attributes when stated (percentages, share counts)
 3. If none found, return {{"relationships": []}}
 
+TEXT:
+{chunk_text}
+
+KNOWN ENTITIES IN THIS DOCUMENT:
+{entity_list}
+
 OUTPUT:"""
 
 
@@ -181,14 +162,6 @@ OUTPUT:"""
 
 EVENT_PROMPT = """You are extracting events and timeline facts from an IPO document.
 
-TEXT:
-{chunk_text}
-
-METADATA:
-- Page: {page_number}
-- Section: {section_title}
-- Chunk ID: {chunk_id}
-
 EVENT TYPES (only use these):
 - Incorporation: company was incorporated/founded
 - NameChange: company changed name
@@ -215,10 +188,7 @@ OUTPUT FORMAT (strict JSON only):
         {{"entity": "Old Name", "role": "previous_name"}}
       ],
       "evidence": {{
-        "quote": "exact quote (max 25 words)",
-        "page": {page_number},
-        "section": "{section_title}",
-        "chunk_id": "{chunk_id}"
+        "quote": "exact quote (max 25 words)"
       }}
     }}
   ]
@@ -230,6 +200,9 @@ RULES:
 3. Include all relevant participants with their roles
 4. If none found, return {{"events": []}}
 
+TEXT:
+{chunk_text}
+
 OUTPUT:"""
 
 
@@ -239,9 +212,6 @@ OUTPUT:"""
 
 ENTITY_RESOLUTION_PROMPT = """You are identifying duplicate entities that should be merged.
 
-ENTITY LIST:
-{entity_batch_json}
-
 Analyze these entities and identify:
 1. Entities that are the same (different name variants)
 2. Entities that might be aliases of each other
@@ -277,6 +247,9 @@ RULES:
 2. Do not merge different legal entities
 3. If no candidates, return empty arrays
 
+ENTITY LIST:
+{entity_batch_json}
+
 OUTPUT:"""
 
 
@@ -286,12 +259,6 @@ OUTPUT:"""
 
 VALIDATION_PROMPT = """Review these extracted facts for accuracy and completeness.
 
-EXTRACTED DATA:
-{extracted_json}
-
-SOURCE TEXT:
-{chunk_text}
-
 Validate each fact against the source text and report issues.
 
 OUTPUT FORMAT (strict JSON only):
@@ -325,4 +292,10 @@ VALIDATION CHECKS:
 4. Dates are correctly parsed
 5. Relationships are correctly identified
 
+EXTRACTED DATA:
+{extracted_json}
+
+SOURCE TEXT:
+{chunk_text}
+
 OUTPUT:"""
@@ -0,0 +1,198 @@
+"""
+Content-addressed on-disk cache for LLM responses.
+
+Entries are keyed by a SHA-256 of everything that determines a generation
+(endpoint, model, prompt, system prompt, options, json_mode) and hold the
+raw model text, so post-processing (think-tag stripping, JSON parsing)
+still runs on every hit. Re-running a KG extraction or an evaluation only
+pays for prompts that changed.
+
+Storage is a single SQLite file in WAL mode, safe for the concurrent
+batch_extract threads and for several processes. Entries expire after
+LLM_CACHE_TTL seconds and the least recently used are evicted beyond
+LLM_CACHE_MAX_ENTRIES.
+"""
+
+import contextvars
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+from utils.config import (
+    LLM_CACHE_FILE,
+    LLM_CACHE_TTL,
+    LLM_CACHE_MAX_ENTRIES,
+)
+
+
+# Set for the current request/thread by bypass_llm_cache()
+_bypass = contextvars.ContextVar('llm_cache_bypass', default=False)
+
+
+@contextmanager
+def bypass_llm_cache():
+    """Skip cache reads and writes for LLM calls made inside the block"""
+    token = _bypass.set(True)
+    try:
+        yield
+    finally:
+        _bypass.reset(token)
+
+
+def cache_bypassed() -> bool:
+    return _bypass.get()
+
+
+def make_cache_key(**parts) -> str:
+    """Stable hash of the request fields that affect the generated text"""
+    canonical = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+class LLMResponseCache:
+    """SQLite-backed response cache with TTL and LRU size eviction"""
+
+    # Check the entry count every N writes rather than on each one
+    EVICT_EVERY = 100
+
+    def __init__(self, path: str = LLM_CACHE_FILE, ttl: float = LLM_CACHE_TTL,
+                 max_entries: int = LLM_CACHE_MAX_ENTRIES):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.evictions = 0
+
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS llm_responses (
+                    key TEXT PRIMARY KEY,
+                    model TEXT,
+                    response TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    accessed_at REAL NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_llm_responses_accessed ON llm_responses (accessed_at)")
+
+    @contextmanager
+    def _connect(self):
+        # Short-lived connection per call; sqlite3 connections are not shared across threads
+        conn = sqlite3.connect(self.path, timeout=10)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def get(self, key: str) -> Optional[str]:
+        """Cached response text, or None on a miss / expired entry"""
+        now = time.time()
+        with self._connect() as conn:
+            row = conn.execute("SELECT response, created_at FROM llm_responses WHERE key = ?", (key,)).fetchone()
+            if row is not None and self.ttl and now - row[1] > self.ttl:
+                conn.execute("DELETE FROM llm_responses WHERE key = ?", (key,))
+                row = None
+            elif row is not None:
+                conn.execute("UPDATE llm_responses SET accessed_at = ? WHERE key = ?", (now, key))
+
+        with self._lock:
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return row[0]
+
+    def put(self, key: str, response: str, model: str = None):
+        """Store a response (empty responses are not cached)"""
+        if not response:
+            return
+
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO llm_responses (key, model, response, created_at, accessed_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (key, model, response, now, now)
+            )
+
+        with self._lock:
+            self.writes += 1
+            evict = self.writes % self.EVICT_EVERY == 0
+        if evict:
+            self.evict()
+
+    def evict(self) -> int:
+        """Drop expired entries, then the least recently used beyond max_entries"""
+        removed = 0
+        with self._connect() as conn:
+            if self.ttl:
+                removed += conn.execute(
+                    "DELETE FROM llm_responses WHERE created_at < ?", (time.time() - self.ttl,)
+                ).rowcount
+
+            count = conn.execute("SELECT COUNT(*) FROM llm_responses").fetchone()[0]
+            if self.max_entries and count > self.max_entries:
+                removed += conn.execute("""
+                    DELETE FROM llm_responses WHERE key IN (
+                        SELECT key FROM llm_responses ORDER BY accessed_at ASC LIMIT ?
+                    )
+                """, (count - self.max_entries,)).rowcount
+
+        with self._lock:
+            self.evictions += removed
+        return removed
+
+    def clear(self):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM llm_responses")
+
+    def stats(self) -> Dict:
+        with self._connect() as conn:
+            entries = conn.execute("SELECT COUNT(*) FROM llm_responses").fetchone()[0]
+
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': entries,
+                'max_entries': self.max_entries,
+                'ttl_seconds': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'writes': self.writes,
+                'evictions': self.evictions,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+                'size_mb': round(os.path.getsize(self.path) / 1e6, 2) if os.path.exists(self.path) else 0.0
+            }
+
+    def summary(self) -> str:
+        """One-line hit-rate report for scripts"""
+        s = self.stats()
+        return (f"LLM cache: {s['hits']} hits / {s['misses']} misses "
+                f"({s['hit_rate']:.0%} hit rate), {s['entries']} entries")
+
+
+# Global cache instance
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_llm_cache() -> LLMResponseCache:
+    """Get the shared LLM response cache"""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = LLMResponseCache()
+    return _cache
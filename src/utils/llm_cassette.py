@@ -0,0 +1,156 @@
+"""
+Record/replay cassettes for LLM calls.
+
+In 'record' mode every generation DeepSeekClient sends to Ollama is
+appended to a JSONL cassette with its response text and timings (time to
+first token, total duration). In 'replay' mode the same requests are
+answered from the cassette without touching the model, either instantly
+or with the recorded timings scaled by LLM_CASSETTE_DELAY_SCALE, so an
+evaluation run measures retrieval and serving overhead on its own.
+
+Entries are matched by the request fingerprint (the LLM cache key), so a
+replay only hits when prompt, model and options are unchanged. A miss in
+replay mode raises CassetteMiss instead of calling the model.
+
+Select the mode with LLM_CASSETTE_MODE=record|replay in the environment
+of the process that runs DeepSeekClient (e.g. the Flask app).
+"""
+
+import json
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Dict, Iterator, Optional
+
+from utils.config import LLM_CASSETTE_MODE, LLM_CASSETTE_FILE, LLM_CASSETTE_DELAY_SCALE
+
+MODES = ('off', 'record', 'replay')
+
+
+class CassetteMiss(RuntimeError):
+    """Replay mode got a request that was never recorded"""
+
+
+class Cassette:
+    """JSONL cassette of LLM responses keyed by request fingerprint"""
+
+    def __init__(self, path: str = LLM_CASSETTE_FILE, mode: str = LLM_CASSETTE_MODE,
+                 delay_scale: float = LLM_CASSETTE_DELAY_SCALE):
+        if mode not in MODES:
+            raise ValueError(f"Unknown cassette mode '{mode}' (expected one of {', '.join(MODES)})")
+        self.path = path
+        self.mode = mode
+        self.delay_scale = delay_scale
+
+        self._lock = threading.Lock()
+        self._entries: Dict[str, Dict] = {}
+        self.recorded = 0
+        self.hits = 0
+        self.misses = 0
+
+        if mode == 'replay':
+            self._load()
+        elif mode == 'record':
+            os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+
+    @property
+    def replaying(self) -> bool:
+        return self.mode == 'replay'
+
+    @property
+    def recording(self) -> bool:
+        return self.mode == 'record'
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            raise FileNotFoundError(f"Cassette not found: {self.path} (run once with LLM_CASSETTE_MODE=record)")
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    entry = json.loads(line)
+                    # Later recordings of the same request win
+                    self._entries[entry['key']] = entry
+        print(f"📼 Loaded {len(self._entries)} recorded LLM responses from {self.path}")
+
+    def record(self, key: str, endpoint: str, payload: Dict, response: str, ttft: float, duration: float):
+        """Append one generation (prompt fields are kept for readability, not matching)"""
+        entry = {
+            'key': key,
+            'endpoint': endpoint,
+            'model': payload.get('model'),
+            'messages': payload.get('messages'),
+            'options': payload.get('options'),
+            'response': response,
+            'ttft': round(ttft, 4),
+            'duration': round(duration, 4),
+            'recorded_at': datetime.now().isoformat(timespec='seconds'),
+        }
+        line = json.dumps(entry, ensure_ascii=False) + '\n'
+        with self._lock:
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(line)
+            self._entries[key] = entry
+            self.recorded += 1
+
+    def _lookup(self, key: str) -> Dict:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        if entry is None:
+            raise CassetteMiss(f"No recorded response for request {key[:12]} in {self.path}")
+        return entry
+
+    def replay(self, key: str) -> str:
+        """Recorded response text, after the scaled recorded duration"""
+        entry = self._lookup(key)
+        if self.delay_scale:
+            time.sleep(entry['duration'] * self.delay_scale)
+        return entry['response']
+
+    def replay_stream(self, key: str) -> Iterator[str]:
+        """Recorded response as word-sized deltas, paced by the scaled recorded timings"""
+        entry = self._lookup(key)
+        words = entry['response'].split(' ')
+        deltas = [w + (' ' if i < len(words) - 1 else '') for i, w in enumerate(words)]
+
+        interval = 0.0
+        if self.delay_scale:
+            time.sleep(entry['ttft'] * self.delay_scale)
+            interval = max(0.0, entry['duration'] - entry['ttft']) * self.delay_scale / max(1, len(deltas))
+        for i, delta in enumerate(deltas):
+            if i and interval:
+                time.sleep(interval)
+            yield delta
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                'mode': self.mode,
+                'path': self.path,
+                'entries': len(self._entries),
+                'recorded': self.recorded,
+                'hits': self.hits,
+                'misses': self.misses,
+                'delay_scale': self.delay_scale,
+            }
+
+
+# Global cassette instance (None when LLM_CASSETTE_MODE is 'off')
+_cassette = None
+_cassette_lock = threading.Lock()
+
+
+def get_cassette() -> Optional[Cassette]:
+    """Get the shared cassette, or None if record/replay is off"""
+    global _cassette
+    if LLM_CASSETTE_MODE == 'off':
+        return None
+    if _cassette is None:
+        with _cassette_lock:
+            if _cassette is None:
+                _cassette = Cassette()
+    return _cassette
@@ -0,0 +1,381 @@
+"""
+Priority-aware admission for requests to the local LLM backend.
+
+One Ollama instance serves /api/ask users, evaluation runs and background
+KG extraction. Every generation takes a slot from this scheduler first:
+
+  - at most LLM_MAX_CONCURRENT generations run at once (match
+    OLLAMA_NUM_PARALLEL; anything beyond that only queues inside Ollama)
+  - a class is admitted only while no higher-priority class is waiting,
+    so batch work stops taking slots as soon as a user question arrives
+  - LLM_INTERACTIVE_RESERVED slots are kept free for interactive calls,
+    so a question never waits for a 4096-token extraction to finish
+
+The priority of a call comes from the llm_priority() context, so callers
+such as /api/ask or batch_extract set it once around their work.
+
+Slots are accounted across processes: the server, build_kg_parallel.py and
+the other scripts register their waiting and running calls in one SQLite
+table (LLM_SCHEDULER_SHARED_FILE), and every admission decision is taken in
+a write transaction over it. A question asked while a batch script runs
+therefore still blocks the script's next extraction call and finds the
+reserved slot free. Calls already running are never interrupted. Waiters
+are woken at once by releases in their own process and poll for releases
+in other processes, starting at LLM_SCHEDULER_POLL_INTERVAL and doubling up
+to LLM_SCHEDULER_POLL_MAX_INTERVAL. A poll only reads the table; the write
+lock is taken once the counts say the call can be admitted. Rows of
+processes that died without releasing are reaped by pid. With LLM_SCHEDULER_SHARED_FILE
+empty the scheduler only sees its own process.
+"""
+
+import contextvars
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from typing import Callable, Dict, Optional, Tuple
+
+from utils.config import (
+    LLM_MAX_CONCURRENT,
+    LLM_INTERACTIVE_RESERVED,
+    LLM_SCHEDULER_SHARED_FILE,
+    LLM_SCHEDULER_POLL_INTERVAL,
+    LLM_SCHEDULER_POLL_MAX_INTERVAL,
+)
+
+INTERACTIVE = 'interactive'
+EVALUATION = 'evaluation'
+EXTRACTION = 'extraction'
+
+# Highest priority first
+PRIORITIES = (INTERACTIVE, EVALUATION, EXTRACTION)
+
+_priority = contextvars.ContextVar('llm_priority', default=INTERACTIVE)
+
+
+@contextmanager
+def llm_priority(priority: str):
+    """Run LLM calls made inside the block with the given priority class"""
+    if priority not in PRIORITIES:
+        raise ValueError(f"Unknown LLM priority '{priority}' (expected one of {', '.join(PRIORITIES)})")
+    token = _priority.set(priority)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def current_priority() -> str:
+    return _priority.get()
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class SharedSlotTable:
+    """Waiting and running LLM calls of every process, in one SQLite file"""
+
+    # Look for rows of dead processes at most this often (seconds)
+    REAP_INTERVAL = 5.0
+
+    def __init__(self, path: str):
+        self.path = path
+        self._last_reap = 0.0
+
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS llm_slots (
+                    token TEXT PRIMARY KEY,
+                    pid INTEGER NOT NULL,
+                    priority TEXT NOT NULL,
+                    state TEXT NOT NULL,
+                    since REAL NOT NULL
+                )
+            """)
+            # Left behind by an earlier process that had our pid
+            conn.execute("DELETE FROM llm_slots WHERE pid = ?", (os.getpid(),))
+
+    @contextmanager
+    def _connect(self):
+        # Autocommit connection per call; transactions are opened explicitly
+        conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    def _reap(self, conn):
+        now = time.monotonic()
+        if now - self._last_reap < self.REAP_INTERVAL:
+            return
+        self._last_reap = now
+        pids = [row[0] for row in conn.execute("SELECT DISTINCT pid FROM llm_slots")]
+        for pid in pids:
+            if not _pid_alive(pid):
+                conn.execute("DELETE FROM llm_slots WHERE pid = ?", (pid,))
+
+    @staticmethod
+    def _counts(conn) -> Tuple[Dict[str, int], Dict[str, int]]:
+        waiting = {p: 0 for p in PRIORITIES}
+        running = {p: 0 for p in PRIORITIES}
+        for priority, state, count in conn.execute(
+                "SELECT priority, state, COUNT(*) FROM llm_slots GROUP BY priority, state"):
+            if priority in waiting:
+                (running if state == 'running' else waiting)[priority] = count
+        return waiting, running
+
+    def register(self, token: str, priority: str):
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO llm_slots (token, pid, priority, state, since) VALUES (?, ?, ?, 'waiting', ?)",
+                (token, os.getpid(), priority, time.time())
+            )
+
+    def try_admit(self, token: str, can_admit: Callable[[Dict[str, int], int], bool]) -> bool:
+        """Mark a waiting call running if can_admit(waiting, active) holds for all processes"""
+        with self._connect() as conn:
+            # Plain read first: a call that cannot be admitted never takes the write lock
+            self._reap(conn)
+            waiting, running = self._counts(conn)
+            if not can_admit(waiting, sum(running.values())):
+                return False
+
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                waiting, running = self._counts(conn)
+                admitted = can_admit(waiting, sum(running.values()))
+                if admitted:
+                    conn.execute("UPDATE llm_slots SET state = 'running', since = ? WHERE token = ?",
+                                 (time.time(), token))
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        return admitted
+
+    def release(self, token: str):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM llm_slots WHERE token = ?", (token,))
+
+    def counts(self) -> Tuple[Dict[str, int], Dict[str, int]]:
+        """(waiting, running) per class, over all processes"""
+        with self._connect() as conn:
+            return self._counts(conn)
+
+
+class LLMScheduler:
+    """Concurrency cap with strict priority admission between classes, shared by all processes"""
+
+    # Queue-wait samples kept per class for percentiles
+    WAIT_WINDOW = 500
+    # Smoothing for the mean slot hold time used by predicted_wait()
+    SERVICE_EWMA_ALPHA = 0.2
+
+    def __init__(self, max_concurrent: int = LLM_MAX_CONCURRENT,
+                 interactive_reserved: int = LLM_INTERACTIVE_RESERVED,
+                 shared_file: Optional[str] = LLM_SCHEDULER_SHARED_FILE,
+                 poll_interval: float = LLM_SCHEDULER_POLL_INTERVAL,
+                 max_poll_interval: float = LLM_SCHEDULER_POLL_MAX_INTERVAL):
+        self.max_concurrent = max(1, max_concurrent)
+        # Never reserve every slot, or batch work could not run at all
+        self.interactive_reserved = min(max(0, interactive_reserved), self.max_concurrent - 1)
+        self.poll_interval = poll_interval
+        self.max_poll_interval = max(poll_interval, max_poll_interval)
+        self._shared = SharedSlotTable(shared_file) if shared_file else None
+
+        self._cond = threading.Condition()
+        self.active = 0
+        self._waiting = {p: 0 for p in PRIORITIES}
+        self._running = {p: 0 for p in PRIORITIES}
+        self._admitted = {p: 0 for p in PRIORITIES}
+        self._waits = {p: deque(maxlen=self.WAIT_WINDOW) for p in PRIORITIES}
+        self._service_time = None  # EWMA of seconds a slot is held
+        self._generation = 0  # Bumped by every notify, so a polling waiter sees wakeups it missed
+
+    def _can_admit(self, priority: str, waiting: Dict[str, int], active: int) -> bool:
+        rank = PRIORITIES.index(priority)
+        if any(waiting[p] for p in PRIORITIES[:rank]):
+            return False
+        limit = self.max_concurrent if priority == INTERACTIVE else self.max_concurrent - self.interactive_reserved
+        return active < limit
+
+    def _counts(self) -> Tuple[Dict[str, int], Dict[str, int]]:
+        """(waiting, running) per class over every process sharing the slots"""
+        if self._shared is not None:
+            return self._shared.counts()
+        with self._cond:
+            return dict(self._waiting), dict(self._running)
+
+    def _mark_admitted(self, priority: str, start: float):
+        """Account an admitted call; caller holds self._cond"""
+        self._waiting[priority] -= 1
+        self.active += 1
+        self._running[priority] += 1
+        self._admitted[priority] += 1
+        self._waits[priority].append(time.perf_counter() - start)
+        # A lower class may have been blocked only by our waiting entry
+        self._notify()
+
+    def _notify(self):
+        """Wake local waiters; caller holds self._cond"""
+        self._generation += 1
+        self._cond.notify_all()
+
+    def _wait_shared(self, priority: str, token: str):
+        """
+        Poll the shared table until admitted. self._cond is never held while
+        SQLite is touched; a local release wakes the waiter at once, otherwise
+        the interval doubles up to max_poll_interval.
+        """
+        def can_admit(waiting, active):
+            return self._can_admit(priority, waiting, active)
+
+        delay = self.poll_interval
+        while True:
+            with self._cond:
+                generation = self._generation
+            if self._shared.try_admit(token, can_admit):
+                return
+            with self._cond:
+                if self._generation == generation:
+                    self._cond.wait(delay)
+                woken = self._generation != generation
+            delay = self.poll_interval if woken else min(delay * 2, self.max_poll_interval)
+
+    @contextmanager
+    def slot(self, priority: Optional[str] = None):
+        """Hold one backend slot for the duration of the block"""
+        priority = priority or current_priority()
+        if priority not in PRIORITIES:
+            raise ValueError(f"Unknown LLM priority '{priority}'")
+
+        start = time.perf_counter()
+        if self._shared is None:
+            with self._cond:
+                self._waiting[priority] += 1
+                try:
+                    while not self._can_admit(priority, self._waiting, self.active):
+                        self._cond.wait()
+                except BaseException:
+                    self._waiting[priority] -= 1
+                    self._notify()
+                    raise
+                self._mark_admitted(priority, start)
+        else:
+            token = uuid.uuid4().hex
+            self._shared.register(token, priority)
+            with self._cond:
+                self._waiting[priority] += 1
+            try:
+                self._wait_shared(priority, token)
+            except BaseException:
+                self._shared.release(token)
+                with self._cond:
+                    self._waiting[priority] -= 1
+                    self._notify()
+                raise
+            with self._cond:
+                self._mark_admitted(priority, start)
+
+        held_from = time.perf_counter()
+        try:
+            yield
+        finally:
+            held = time.perf_counter() - held_from
+            if self._shared is not None:
+                self._shared.release(token)
+            with self._cond:
+                self.active -= 1
+                self._running[priority] -= 1
+                if self._service_time is None:
+                    self._service_time = held
+                else:
+                    self._service_time += self.SERVICE_EWMA_ALPHA * (held - self._service_time)
+                self._notify()
+
+    def queue_depth(self, priority: str = INTERACTIVE) -> int:
+        """Calls waiting (in any process) that would be admitted before a new call of this priority"""
+        rank = PRIORITIES.index(priority)
+        waiting, _ = self._counts()
+        return sum(waiting[p] for p in PRIORITIES[:rank + 1])
+
+    def predicted_wait(self, priority: str = INTERACTIVE) -> float:
+        """
+        Rough queue wait (seconds) for a new call of this priority: the calls
+        ahead of it, drained max_concurrent at a time at the mean hold time.
+        """
+        rank = PRIORITIES.index(priority)
+        waiting, running = self._counts()
+        if self._can_admit(priority, waiting, sum(running.values())):
+            return 0.0
+        ahead = sum(waiting[p] for p in PRIORITIES[:rank + 1])
+        with self._cond:
+            service_time = self._service_time or 0.0
+        return (ahead + 1) * service_time / self.max_concurrent
+
+    def stats(self) -> Dict:
+        """Waiting/running/active cover all processes; admissions and waits this process only"""
+        waiting_all, running_all = self._counts()
+        with self._cond:
+            snapshot = {
+                p: (waiting_all[p], running_all[p], self._admitted[p], sorted(self._waits[p]))
+                for p in PRIORITIES
+            }
+            service_time = self._service_time or 0.0
+        active = sum(running_all.values())
+
+        def percentile(waits, p):
+            if not waits:
+                return 0.0
+            return round(waits[min(len(waits) - 1, int(p * len(waits)))] * 1000, 1)
+
+        classes = {}
+        for p, (waiting, running, admitted, waits) in snapshot.items():
+            classes[p] = {
+                'waiting': waiting,
+                'running': running,
+                'admitted': admitted,
+                'queue_wait_ms': {
+                    'p50': percentile(waits, 0.50),
+                    'p95': percentile(waits, 0.95),
+                    'max': round(waits[-1] * 1000, 1) if waits else 0.0,
+                    'samples': len(waits)
+                }
+            }
+
+        return {
+            'max_concurrent': self.max_concurrent,
+            'interactive_reserved': self.interactive_reserved,
+            'shared_file': self._shared.path if self._shared is not None else None,
+            'active': active,
+            'mean_service_s': round(service_time, 2),
+            'predicted_interactive_wait_s': round(self.predicted_wait(INTERACTIVE), 2),
+            'classes': classes
+        }
+
+
+# Global scheduler instance
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_llm_scheduler() -> LLMScheduler:
+    """Get the shared LLM scheduler"""
+    global _scheduler
+    if _scheduler is None:
+        with _scheduler_lock:
+            if _scheduler is None:
+                _scheduler = LLMScheduler()
+    return _scheduler
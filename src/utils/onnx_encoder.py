@@ -0,0 +1,95 @@
+"""
+ONNX Runtime encoder for the sentence embedding model.
+
+Mirrors the all-MiniLM-L6-v2 SentenceTransformer pipeline (tokenize ->
+transformer -> attention-masked mean pooling -> L2 normalize) without
+importing torch. The model is exported once with
+scripts/export_onnx_model.py; 'onnx-int8' loads the dynamically
+quantized copy written next to it.
+
+Requires onnxruntime and tokenizers, which are not in requirements.txt:
+    pip install -r requirements-onnx.txt
+"""
+
+import os
+import numpy as np
+from typing import List
+
+from utils.config import ONNX_MODEL_DIR, EMBEDDING_MAX_SEQ_LENGTH, EMBEDDING_TORCH_THREADS
+
+ONNX_MODEL_FILE = "model.onnx"
+ONNX_INT8_MODEL_FILE = "model_int8.onnx"
+TOKENIZER_FILE = "tokenizer.json"
+
+
+class OnnxSentenceEncoder:
+    """Drop-in replacement for SentenceTransformer.encode on CPU"""
+
+    def __init__(self, model_dir: str = ONNX_MODEL_DIR, quantized: bool = False,
+                 max_seq_length: int = EMBEDDING_MAX_SEQ_LENGTH, num_threads: int = EMBEDDING_TORCH_THREADS):
+        try:
+            import onnxruntime as ort
+            from tokenizers import Tokenizer
+        except ImportError as e:
+            raise ImportError(
+                f"EMBEDDING_BACKEND 'onnx' needs onnxruntime and tokenizers ({e}) - "
+                f"run: pip install -r requirements-onnx.txt"
+            ) from e
+
+        model_file = ONNX_INT8_MODEL_FILE if quantized else ONNX_MODEL_FILE
+        model_path = os.path.join(model_dir, model_file)
+        if not os.path.exists(model_path):
+            raise FileNotFoundError(
+                f"{model_path} not found - run scripts/export_onnx_model.py first"
+            )
+
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = num_threads
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(model_path, options, providers=['CPUExecutionProvider'])
+        self.input_names = {i.name for i in self.session.get_inputs()}
+
+        self.tokenizer = Tokenizer.from_file(os.path.join(model_dir, TOKENIZER_FILE))
+        self.tokenizer.enable_truncation(max_length=max_seq_length)
+        self.tokenizer.enable_padding()
+
+        self.model_path = model_path
+        self.max_seq_length = max_seq_length
+
+    def _encode_batch(self, texts: List[str]) -> np.ndarray:
+        encodings = self.tokenizer.encode_batch(texts)
+        input_ids = np.array([e.ids for e in encodings], dtype=np.int64)
+        attention_mask = np.array([e.attention_mask for e in encodings], dtype=np.int64)
+
+        feeds = {'input_ids': input_ids, 'attention_mask': attention_mask}
+        if 'token_type_ids' in self.input_names:
+            feeds['token_type_ids'] = np.array([e.type_ids for e in encodings], dtype=np.int64)
+
+        token_embeddings = self.session.run(None, feeds)[0]
+
+        # Mean pooling over real (non-padding) tokens
+        mask = attention_mask[..., None].astype(np.float32)
+        summed = (token_embeddings * mask).sum(axis=1)
+        pooled = summed / np.clip(mask.sum(axis=1), 1e-9, None)
+
+        return pooled / np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+
+    def encode(self, sentences, batch_size: int = 32, show_progress_bar: bool = False,
+               convert_to_numpy: bool = True, **kwargs) -> np.ndarray:
+        """
+        Encode texts to normalized float32 embeddings.
+
+        Accepts a single string or a list, like SentenceTransformer.encode.
+        """
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+        if not texts:
+            return np.empty((0, 0), dtype=np.float32)
+
+        batches = range(0, len(texts), batch_size)
+        if show_progress_bar:
+            from tqdm import tqdm
+            batches = tqdm(batches, desc="Batches")
+
+        embeddings = np.vstack([self._encode_batch(texts[i:i + batch_size]) for i in batches]).astype(np.float32)
+        return embeddings[0] if single else embeddings
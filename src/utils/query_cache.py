@@ -0,0 +1,142 @@
+"""
+Bounded LRU cache for query embeddings.
+
+Questions are keyed by model name + encoder backend (torch, onnx or the
+int8-quantized onnx-int8, whose vectors differ) + whitespace-normalized
+text, so the same question asked through different RAG modes (or repeated
+by the evaluation scripts) is encoded once, and switching backends never
+serves another backend's vectors. An optional SQLite tier keeps
+embeddings across restarts; entries there are float32 blobs.
+"""
+
+import hashlib
+import os
+import sqlite3
+import threading
+import numpy as np
+from collections import OrderedDict
+from typing import Dict, Optional
+
+from utils.config import (
+    EMBEDDING_MODEL_NAME,
+    EMBEDDING_BACKEND,
+    QUERY_EMBEDDING_CACHE_SIZE,
+    QUERY_EMBEDDING_CACHE_DISK,
+    QUERY_EMBEDDING_CACHE_FILE,
+)
+
+
+def normalize_query(text: str) -> str:
+    """Collapse whitespace; case is kept since cased models encode it"""
+    return " ".join(text.split())
+
+
+class QueryEmbeddingCache:
+    """Thread-safe in-memory LRU with an optional SQLite tier"""
+
+    def __init__(self, max_size: int = QUERY_EMBEDDING_CACHE_SIZE, disk_path: Optional[str] = None):
+        self.max_size = max_size
+        self.disk_path = disk_path
+        self._entries: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        if disk_path:
+            os.makedirs(os.path.dirname(disk_path) or '.', exist_ok=True)
+            with self._connect() as conn:
+                conn.execute("""
+                    CREATE TABLE IF NOT EXISTS query_embeddings (
+                        key TEXT PRIMARY KEY,
+                        embedding BLOB NOT NULL
+                    )
+                """)
+
+    def _connect(self) -> sqlite3.Connection:
+        # One short-lived connection per call; sqlite3 objects are not thread-safe
+        return sqlite3.connect(self.disk_path, timeout=5)
+
+    @staticmethod
+    def make_key(text: str, model_name: str = EMBEDDING_MODEL_NAME, backend: str = EMBEDDING_BACKEND) -> str:
+        # Backend names include the quantization mode ('onnx-int8')
+        digest = hashlib.sha1(normalize_query(text).encode('utf-8')).hexdigest()
+        return f"{model_name}:{backend}:{digest}"
+
+    def get(self, key: str) -> Optional[np.ndarray]:
+        with self._lock:
+            embedding = self._entries.get(key)
+            if embedding is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return embedding
+
+        if self.disk_path:
+            with self._connect() as conn:
+                row = conn.execute("SELECT embedding FROM query_embeddings WHERE key = ?", (key,)).fetchone()
+            if row is not None:
+                embedding = np.frombuffer(row[0], dtype=np.float32)
+                embedding.setflags(write=False)
+                with self._lock:
+                    self.disk_hits += 1
+                self._remember(key, embedding)
+                return embedding
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key: str, embedding: np.ndarray) -> np.ndarray:
+        """Store an embedding (as a read-only float32 copy) and return it"""
+        embedding = np.array(embedding, dtype=np.float32)
+        embedding.setflags(write=False)
+        self._remember(key, embedding)
+
+        if self.disk_path:
+            with self._connect() as conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO query_embeddings (key, embedding) VALUES (?, ?)",
+                    (key, embedding.tobytes())
+                )
+        return embedding
+
+    def _remember(self, key: str, embedding: np.ndarray):
+        with self._lock:
+            self._entries[key] = embedding
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.disk_hits = self.misses = 0
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'hits': self.hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'hit_rate': round((self.hits + self.disk_hits) / lookups, 4) if lookups else 0.0,
+                'disk_tier': bool(self.disk_path)
+            }
+
+
+# Global cache instance
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_query_cache() -> QueryEmbeddingCache:
+    """Get the shared query embedding cache"""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                disk_path = QUERY_EMBEDDING_CACHE_FILE if QUERY_EMBEDDING_CACHE_DISK else None
+                _cache = QueryEmbeddingCache(QUERY_EMBEDDING_CACHE_SIZE, disk_path)
+    return _cache
@@ -0,0 +1,175 @@
+"""
+Per-document registry of RAG instances for /api/ask.
+
+Replaces the single global rag_instances dict, which held the retrievers
+of one document at a time: two users asking about different documents
+kept resetting it and rebuilding each other's retrievers (and mutated it
+mid-request while another thread was reading it).
+
+Entries are keyed by (document_id, kind), e.g. ('doc_1', 'vector'). They
+are built once by the caller's factory and then shared read-only:
+  - concurrent first requests for the same entry wait for a single build
+  - documents are kept in LRU order and evicted as a whole once more than
+    RAG_REGISTRY_MAX_DOCUMENTS are resident, or their resident vector
+    indexes exceed RAG_REGISTRY_MAX_INDEX_MB
+  - eviction also drops the document's resident vector index, so the
+    registry bounds the memory the memory search backend holds
+
+Limits are checked after each build, once VectorRAG has loaded its index.
+Selecting evictions, dropping their indexes and registering builds all
+happen under the registry lock, and documents with a build in flight are
+never evicted, so no index is loaded for a document the registry has just
+given up. A request keeps using the handles it got even if its document
+is evicted meanwhile; it simply is not cached for the next request.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Tuple, TypeVar
+
+from utils.config import RAG_REGISTRY_MAX_DOCUMENTS, RAG_REGISTRY_MAX_INDEX_MB
+
+T = TypeVar('T')
+
+
+def _resident_index_bytes(document_id: str) -> int:
+    from utils.vector_index import resident_index_bytes
+    return resident_index_bytes(document_id)
+
+
+def _drop_resident_index(document_id: str):
+    from utils.vector_index import invalidate_document_index
+    invalidate_document_index(document_id)
+
+
+class RAGRegistry:
+    """LRU of per-document RAG instances with single-flight construction"""
+
+    def __init__(self, max_documents: int = RAG_REGISTRY_MAX_DOCUMENTS,
+                 max_index_mb: float = RAG_REGISTRY_MAX_INDEX_MB):
+        self.max_documents = max(1, max_documents)
+        self.max_index_bytes = int(max_index_mb * 1024 * 1024) if max_index_mb else 0
+
+        self._lock = threading.Lock()
+        self._documents: 'OrderedDict[str, Dict[str, object]]' = OrderedDict()
+        self._building: Dict[Tuple[str, str], threading.Event] = {}
+        self.hits = 0
+        self.builds = 0
+        self.build_waits = 0
+        self.build_errors = 0
+        self.evictions = 0
+        self.build_seconds = 0.0
+
+    def get(self, document_id: str, kind: str, factory: Callable[[], T]) -> T:
+        """
+        Shared instance of `kind` for a document, built with factory() on a miss.
+
+        Only one caller builds a given entry; the others wait for it. If the
+        build fails, the error goes to the builder and a waiter retries.
+        """
+        key = (document_id, kind)
+        while True:
+            with self._lock:
+                entries = self._documents.get(document_id)
+                if entries is not None and kind in entries:
+                    self._documents.move_to_end(document_id)
+                    self.hits += 1
+                    return entries[kind]
+
+                pending = self._building.get(key)
+                if pending is None:
+                    pending = self._building[key] = threading.Event()
+                    break
+                self.build_waits += 1
+
+            pending.wait()
+
+        start = time.perf_counter()
+        try:
+            instance = factory()
+        except Exception:
+            with self._lock:
+                self.build_errors += 1
+                del self._building[key]
+            pending.set()
+            raise
+
+        with self._lock:
+            self._documents.setdefault(document_id, {})[kind] = instance
+            self._documents.move_to_end(document_id)
+            self.builds += 1
+            self.build_seconds += time.perf_counter() - start
+            del self._building[key]
+            evicted = self._evict(document_id)
+        pending.set()
+
+        for doc in evicted:
+            print(f"♻️ Evicted RAG instances for: {doc}")
+        return instance
+
+    def _evict(self, keep: str) -> list:
+        """
+        Drop least recently used documents until within limits; caller holds the lock.
+
+        Never evicts `keep` or a document with a build in flight (its new
+        instance could hold an index that would no longer be accounted).
+        """
+        building = {doc for doc, _ in self._building}
+        evicted = []
+        while True:
+            over_count = len(self._documents) > self.max_documents
+            over_memory = (self.max_index_bytes and
+                           sum(_resident_index_bytes(doc) for doc in self._documents) > self.max_index_bytes)
+            if not (over_count or over_memory):
+                break
+            victim = next((doc for doc in self._documents if doc != keep and doc not in building), None)
+            if victim is None:
+                break
+            del self._documents[victim]
+            # Under the lock, so a request for the victim rebuilds rather than reusing this index
+            _drop_resident_index(victim)
+            self.evictions += 1
+            evicted.append(victim)
+        return evicted
+
+    def invalidate(self, document_id: str = None):
+        """Forget a document's instances (or all), e.g. after it is re-processed"""
+        with self._lock:
+            if document_id is None:
+                self._documents.clear()
+            else:
+                self._documents.pop(document_id, None)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            documents = {doc: sorted(entries) for doc, entries in self._documents.items()}
+            stats = {
+                'max_documents': self.max_documents,
+                'max_index_mb': round(self.max_index_bytes / (1024 * 1024), 1),
+                'hits': self.hits,
+                'builds': self.builds,
+                'build_waits': self.build_waits,
+                'build_errors': self.build_errors,
+                'evictions': self.evictions,
+                'mean_build_ms': round(self.build_seconds / self.builds * 1000, 1) if self.builds else 0.0,
+                'building': len(self._building),
+            }
+        stats['documents'] = documents  # least recently used first
+        stats['resident_index_mb'] = round(sum(_resident_index_bytes(doc) for doc in documents) / (1024 * 1024), 1)
+        return stats
+
+
+# Global registry instance
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_rag_registry() -> RAGRegistry:
+    """Get the shared per-document RAG registry"""
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                _registry = RAGRegistry()
+    return _registry
@@ -5,7 +5,7 @@ Semantic Router using DeepSeek LLM for intelligent query routing and decompositi
 import json
 import re
 from typing import Dict, List, Optional
-from utils.deepseek_client import DeepSeekClient
+from utils.deepseek_client import get_shared_client
 
 
 ROUTER_SYSTEM_PROMPT = """You are an expert Query Router and Planner for an IPO analysis system.
@@ -84,7 +84,7 @@ class SemanticRouter:
     """
 
     def __init__(self):
-        self.client = DeepSeekClient()
+        self.client = get_shared_client()
 
     def get_routing_plan(self, question: str) -> Dict:
         """
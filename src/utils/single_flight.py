@@ -0,0 +1,195 @@
+"""
+Single-flight coalescing of identical in-flight LLM requests.
+
+When several callers send the same prompt fingerprint (see
+llm_cache.make_cache_key) while a generation for it is still running,
+only the first one reaches Ollama; the others wait and share its result.
+
+Streams are shared the same way: every participant reads the deltas from
+one buffer, and whoever needs the next delta pulls it from the underlying
+generator. A caller that disconnects early therefore does not stall the
+others, and the HTTP stream is closed only when the last reader leaves.
+"""
+
+import threading
+from typing import Callable, Dict, Iterator, Optional, TypeVar
+
+from utils.config import LLM_SINGLE_FLIGHT
+
+T = TypeVar('T')
+
+
+class _Call:
+    """One in-flight non-streaming call"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error: Optional[BaseException] = None
+
+
+class _Stream:
+    """One in-flight stream, replayable from the start by late joiners"""
+
+    def __init__(self, source: Iterator[str]):
+        self.source = source
+        self.cond = threading.Condition()
+        self.deltas = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.pulling = False
+        self.readers = 0
+
+
+class SingleFlight:
+    """Coalesces concurrent calls that share a key"""
+
+    def __init__(self, enabled: bool = LLM_SINGLE_FLIGHT):
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._calls: Dict[str, _Call] = {}
+        self._streams: Dict[str, _Stream] = {}
+        self.leaders = 0
+        self.coalesced = 0
+        self.stream_leaders = 0
+        self.coalesced_streams = 0
+
+    def do(self, key: Optional[str], fn: Callable[[], T]) -> T:
+        """
+        Run fn(), or wait for the identical call already running.
+
+        Followers get the leader's result (or its exception) as-is, so fn
+        should return an immutable value such as the raw response text.
+        """
+        if not self.enabled or key is None:
+            return fn()
+
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.leaders += 1
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def stream(self, key: Optional[str], factory: Callable[[], Iterator[str]]) -> Iterator[str]:
+        """
+        Yield the deltas of factory(), sharing one generator between concurrent callers.
+
+        A caller joining mid-stream first receives the deltas already produced.
+        """
+        if not self.enabled or key is None:
+            yield from factory()
+            return
+
+        with self._lock:
+            flight = self._streams.get(key)
+            if flight is None:
+                flight = self._streams[key] = _Stream(factory())
+                self.stream_leaders += 1
+            else:
+                self.coalesced_streams += 1
+            flight.readers += 1
+
+        position = 0
+        try:
+            while True:
+                with flight.cond:
+                    while position >= len(flight.deltas) and not flight.done and flight.pulling:
+                        flight.cond.wait()
+                    if position < len(flight.deltas):
+                        delta = flight.deltas[position]
+                        position += 1
+                    elif flight.done:
+                        if flight.error is not None:
+                            raise flight.error
+                        return
+                    else:
+                        # Nobody is reading from the source: pull the next delta ourselves
+                        flight.pulling = True
+                        delta = None
+
+                if delta is None:
+                    self._pull(key, flight)
+                    continue
+                yield delta
+        finally:
+            with self._lock:
+                flight.readers -= 1
+                abandoned = flight.readers == 0 and not flight.done
+                if abandoned and self._streams.get(key) is flight:
+                    del self._streams[key]
+            if abandoned:
+                # Last reader left early: close the HTTP stream
+                flight.source.close()
+
+    def _pull(self, key: str, flight: _Stream):
+        """Advance the shared generator by one delta (caller holds the pulling flag)"""
+        finished = False
+        error = None
+        try:
+            delta = next(flight.source)
+        except StopIteration:
+            finished = True
+        except BaseException as e:
+            # Every reader re-raises it, including this one
+            finished, error = True, e
+
+        if finished:
+            with self._lock:
+                if self._streams.get(key) is flight:
+                    del self._streams[key]
+
+        with flight.cond:
+            if finished:
+                flight.done = True
+                flight.error = error
+            else:
+                flight.deltas.append(delta)
+            flight.pulling = False
+            flight.cond.notify_all()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                'enabled': self.enabled,
+                'in_flight': len(self._calls),
+                'streams_in_flight': len(self._streams),
+                'leaders': self.leaders,
+                'coalesced': self.coalesced,
+                'stream_leaders': self.stream_leaders,
+                'coalesced_streams': self.coalesced_streams,
+            }
+
+
+# Global instance
+_single_flight = None
+_single_flight_lock = threading.Lock()
+
+
+def get_single_flight() -> SingleFlight:
+    """Get the shared single-flight group"""
+    global _single_flight
+    if _single_flight is None:
+        with _single_flight_lock:
+            if _single_flight is None:
+                _single_flight = SingleFlight()
+    return _single_flight
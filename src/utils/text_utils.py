@@ -12,6 +12,7 @@ from utils.config import (
     MAX_CHUNK_WORDS,
     TARGET_CHUNK_WORDS,
     CHAPTER_ROUTING_RULES,
+    COMPLEXITY_BUDGETS,
 )
 
 
@@ -274,10 +275,23 @@ def detect_question_complexity(question: str) -> tuple:
     # DeepSeek-R1 doesn't follow formatting instructions properly
     if very_complex_count > 0 or complex_count >= 3:
         # Very complex - use Llama3 with extended timeout and more tokens
-        return "llama3", 300, "complex"
+        level = "complex"
     elif complex_count >= 1:
         # Moderately complex - use Llama3 with standard timeout
-        return "llama3", 180, "moderate"
+        level = "moderate"
     else:
         # Simple - use Llama3 for speed
-        return "llama3", 120, "simple"
+        level = "simple"
+    
+    return "llama3", COMPLEXITY_BUDGETS[level]['timeout'], level
+
+
+def question_budget(question: str) -> Dict:
+    """
+    Generation and retrieval budget for a question, from COMPLEXITY_BUDGETS.
+    
+    Returns:
+        dict: complexity, num_predict, timeout, top_k, kg_entities, kg_facts
+    """
+    _, _, level = detect_question_complexity(question)
+    return {'complexity': level, **COMPLEXITY_BUDGETS[level]}
@@ -0,0 +1,339 @@
+"""
+In-memory vector index for per-document similarity search.
+
+Each document's embeddings are loaded once and kept resident as a
+contiguous, L2-normalized float32 matrix. Top-k search is then a single
+matrix-vector product plus argpartition, and only the winning chunk texts
+are fetched from the database.
+
+With USE_EMBEDDING_STORE the matrix is memory-mapped from the per-document
+.npy store (utils.embedding_store), shared by every server process; it is
+written from the database the first time a document is opened. A store is
+only used while its chunk ids are exactly the document's embedded chunks
+and their count is documents.total_chunks; a store left by a deleted and
+re-ingested document, or by an interrupted write, is rebuilt instead.
+
+With VECTOR_INDEX_QUANTIZATION = 'int8' the resident matrix is replaced by
+per-dimension-scaled int8 codes (4x smaller). Candidates are scored with
+integer dot products and the best few hundred are re-ranked against
+full-precision vectors loaded from storage.
+"""
+
+import threading
+import numpy as np
+from typing import Dict, List, Tuple
+
+from utils.config import (
+    DEFAULT_TOP_K,
+    VECTOR_INDEX_QUANTIZATION,
+    INT8_RERANK_CANDIDATES,
+    USE_EMBEDDING_STORE,
+)
+from utils.embedding_store import get_embedding_store
+from database.repositories import ChunkRepository, EmbeddingRepository
+
+
+def normalize_rows(vectors: np.ndarray) -> np.ndarray:
+    """
+    L2-normalize vectors into a contiguous float32 array.
+
+    Args:
+        vectors: 1D vector or 2D matrix
+
+    Returns:
+        Normalized float32 array of the same shape
+    """
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return np.ascontiguousarray(vectors / (norms + 1e-8), dtype=np.float32)
+
+
+def top_k_indices(scores: np.ndarray, top_k: int) -> np.ndarray:
+    """
+    Indices of the top_k highest scores, best first.
+
+    Uses argpartition so only the winners are sorted.
+    """
+    k = min(top_k, len(scores))
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+
+    if k < len(scores):
+        candidates = np.argpartition(-scores, k - 1)[:k]
+    else:
+        candidates = np.arange(len(scores))
+
+    return candidates[np.argsort(-scores[candidates])]
+
+
+def load_document_matrix(document_id: str, use_store: bool = USE_EMBEDDING_STORE) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Normalized embedding matrix for a document.
+
+    Opens the memory-mapped store if present; otherwise loads from the
+    database and (with use_store) writes the store for next time.
+
+    Returns:
+        Tuple of (chunk_ids array, (n, dim) float32 matrix)
+    """
+    store = get_embedding_store()
+    if use_store:
+        opened = store.open(document_id)
+        if opened is not None and _store_matches_database(document_id, opened[0]):
+            return opened
+
+    chunk_ids, embeddings = EmbeddingRepository.get_document_embeddings(document_id)
+    chunk_ids = np.asarray(chunk_ids, dtype=np.int64)
+    if not len(chunk_ids):
+        return chunk_ids, embeddings
+
+    matrix = normalize_rows(embeddings)
+    if use_store:
+        store.write(document_id, chunk_ids, matrix)
+        opened = store.open(document_id)
+        if opened is not None:
+            return opened
+
+    return chunk_ids, matrix
+
+
+def _store_matches_database(document_id: str, chunk_ids: np.ndarray) -> bool:
+    """True if the store holds exactly the document's embedded chunks, total_chunks of them"""
+    total_chunks, db_chunk_ids = EmbeddingRepository.get_embedded_chunk_ids(document_id)
+    matches = (total_chunks is not None and len(chunk_ids) == total_chunks and
+               np.array_equal(np.sort(chunk_ids), np.sort(np.asarray(db_chunk_ids, dtype=np.int64))))
+    if not matches:
+        print(f"⚠️ Embedding store for {document_id} does not match the database, rebuilding it")
+    return matches
+
+
+class DocumentVectorIndex:
+    """Resident embedding matrix for a single document"""
+
+    def __init__(self, document_id: str, chunk_ids: np.ndarray, matrix: np.ndarray):
+        self.document_id = document_id
+        self.chunk_ids = np.asarray(chunk_ids, dtype=np.int64)
+        self.matrix = matrix
+
+    @classmethod
+    def load(cls, document_id: str) -> "DocumentVectorIndex":
+        """Open the index from the embedding store or the embeddings table"""
+        chunk_ids, matrix = load_document_matrix(document_id)
+
+        source = "mmap" if isinstance(matrix, np.memmap) else "memory"
+        print(f"Vector index loaded for {document_id}: {matrix.shape[0]} chunks ({source})")
+        return cls(document_id, chunk_ids, matrix)
+
+    def __len__(self):
+        return len(self.chunk_ids)
+
+    @property
+    def nbytes(self) -> int:
+        return self.matrix.nbytes + self.chunk_ids.nbytes
+
+    def search(self, query_embedding: np.ndarray, top_k: int = DEFAULT_TOP_K) -> List[Tuple[int, float]]:
+        """
+        Find the most similar chunks.
+
+        Args:
+            query_embedding: Query vector (any norm)
+            top_k: Number of results to return
+
+        Returns:
+            List of (chunk_id, similarity) tuples, best first
+        """
+        if len(self) == 0:
+            return []
+
+        query = normalize_rows(query_embedding)
+        scores = self.matrix @ query
+
+        return [(int(self.chunk_ids[i]), float(scores[i])) for i in top_k_indices(scores, top_k)]
+
+
+class QuantizedDocumentIndex:
+    """Int8 scalar-quantized embedding index with float re-ranking"""
+
+    # Rows scored per block, bounds the int32 temporaries during search
+    BLOCK_ROWS = 4096
+
+    def __init__(self, document_id: str, chunk_ids: np.ndarray, codes: np.ndarray,
+                 scales: np.ndarray, rerank_candidates: int = INT8_RERANK_CANDIDATES,
+                 full_vectors: np.ndarray = None):
+        self.document_id = document_id
+        self.chunk_ids = np.asarray(chunk_ids, dtype=np.int64)
+        self.codes = codes
+        self.scales = scales
+        self.rerank_candidates = rerank_candidates
+        # Memory-mapped full-precision rows for re-ranking (None = fetch from database)
+        self.full_vectors = full_vectors
+
+    @classmethod
+    def from_matrix(cls, document_id: str, chunk_ids, matrix: np.ndarray,
+                    rerank_candidates: int = INT8_RERANK_CANDIDATES,
+                    full_vectors: np.ndarray = None) -> "QuantizedDocumentIndex":
+        """
+        Quantize a normalized float matrix to int8.
+
+        Each dimension gets its own scale so its full range maps onto
+        [-127, 127].
+        """
+        scales = np.abs(matrix).max(axis=0) / 127.0 if len(matrix) else np.ones(0)
+        scales = np.where(scales > 0, scales, 1.0).astype(np.float32)
+        codes = np.clip(np.round(matrix / scales), -127, 127).astype(np.int8)
+        return cls(document_id, chunk_ids, np.ascontiguousarray(codes), scales, rerank_candidates, full_vectors)
+
+    @classmethod
+    def load(cls, document_id: str) -> "QuantizedDocumentIndex":
+        """Quantize the matrix from the embedding store or the embeddings table"""
+        chunk_ids, matrix = load_document_matrix(document_id)
+        full_vectors = matrix if isinstance(matrix, np.memmap) else None
+        return cls.from_matrix(document_id, chunk_ids, matrix, full_vectors=full_vectors)
+
+    def __len__(self):
+        return len(self.chunk_ids)
+
+    @property
+    def nbytes(self) -> int:
+        return self.codes.nbytes + self.scales.nbytes + self.chunk_ids.nbytes
+
+    def approximate_scores(self, query: np.ndarray) -> np.ndarray:
+        """
+        Approximate similarities from integer dot products.
+
+        The per-dimension scales are folded into the query, which is then
+        quantized to int8 itself, so scoring is pure int8 x int8 -> int32.
+        """
+        scaled_query = query * self.scales
+        query_scale = np.abs(scaled_query).max() / 127.0 or 1.0
+        query_codes = np.round(scaled_query / query_scale).astype(np.int32)
+
+        scores = np.empty(len(self), dtype=np.int32)
+        for start in range(0, len(self), self.BLOCK_ROWS):
+            block = self.codes[start:start + self.BLOCK_ROWS]
+            scores[start:start + len(block)] = block.astype(np.int32) @ query_codes
+
+        return scores.astype(np.float32) * query_scale
+
+    def search(self, query_embedding: np.ndarray, top_k: int = DEFAULT_TOP_K,
+               rerank_candidates: int = None) -> List[Tuple[int, float]]:
+        """
+        Find the most similar chunks.
+
+        Args:
+            query_embedding: Query vector (any norm)
+            top_k: Number of results to return
+            rerank_candidates: Candidates re-scored at full precision (0 = none)
+
+        Returns:
+            List of (chunk_id, similarity) tuples, best first
+        """
+        if len(self) == 0:
+            return []
+
+        if rerank_candidates is None:
+            rerank_candidates = self.rerank_candidates
+
+        query = normalize_rows(query_embedding)
+        approx = self.approximate_scores(query)
+        candidates = top_k_indices(approx, max(top_k, rerank_candidates))
+
+        if not rerank_candidates:
+            return [(int(self.chunk_ids[i]), float(approx[i])) for i in candidates[:top_k]]
+
+        # Re-rank with full-precision vectors from the mmap store or the database
+        if self.full_vectors is not None:
+            rows = np.sort(candidates)
+            found_ids, vectors = self.chunk_ids[rows], self.full_vectors[rows]
+        else:
+            found_ids, vectors = EmbeddingRepository.get_embeddings_by_chunk_ids(self.chunk_ids[candidates])
+        if not len(found_ids):
+            return []
+
+        exact = normalize_rows(vectors) @ query
+        return [(int(found_ids[i]), float(exact[i])) for i in top_k_indices(exact, top_k)]
+
+
+def build_document_index(document_id: str, quantization: str = VECTOR_INDEX_QUANTIZATION):
+    """Build the index variant selected by VECTOR_INDEX_QUANTIZATION"""
+    if quantization == 'int8':
+        return QuantizedDocumentIndex.load(document_id)
+    return DocumentVectorIndex.load(document_id)
+
+
+# Global index cache, one entry per document
+_indexes: Dict[str, DocumentVectorIndex] = {}
+_build_locks: Dict[str, threading.Lock] = {}
+_lock = threading.Lock()
+
+
+def get_document_index(document_id: str):
+    """
+    Get or build the resident index for a document (cached).
+
+    Concurrent callers for the same document wait for a single load.
+    Empty indexes are returned but not cached: the document's embeddings
+    may not have been stored yet.
+    """
+    index = _indexes.get(document_id)
+    if index is not None:
+        return index
+
+    with _lock:
+        build_lock = _build_locks.setdefault(document_id, threading.Lock())
+
+    with build_lock:
+        index = _indexes.get(document_id)
+        if index is None:
+            index = build_document_index(document_id)
+            if len(index):
+                with _lock:
+                    _indexes[document_id] = index
+
+    return index
+
+
+def resident_index_bytes(document_id: str) -> int:
+    """Memory held by a document's resident index (0 if not loaded)"""
+    index = _indexes.get(document_id)
+    return index.nbytes if index is not None else 0
+
+
+def invalidate_document_index(document_id: str = None):
+    """Drop the cached index for a document (or all documents)"""
+    with _lock:
+        if document_id is None:
+            _indexes.clear()
+        else:
+            _indexes.pop(document_id, None)
+
+
+def search_document(query_embedding, document_id: str, top_k: int = DEFAULT_TOP_K, index=None) -> List[Dict]:
+    """
+    Search a document through its resident index.
+
+    Pass the index a caller already holds (e.g. VectorRAG's) to search it
+    without reloading a document that was evicted meanwhile. An empty one
+    is loaded again, in case the embeddings have been stored since.
+
+    Returns the same result dicts as EmbeddingRepository.search_similar.
+    """
+    if index is None or len(index) == 0:
+        index = get_document_index(document_id)
+    hits = index.search(query_embedding, top_k)
+    chunks = ChunkRepository.get_by_ids([chunk_id for chunk_id, _ in hits])
+
+    results = []
+    for chunk_id, score in hits:
+        chunk = chunks.get(chunk_id)
+        if not chunk:
+            continue
+        results.append({
+            'chunk_id': chunk_id,
+            'text': chunk['text'],
+            'page_number': chunk['page_number'],
+            'metadata': chunk['metadata'],
+            'similarity': score
+        })
+
+    return results
@@ -5,15 +5,12 @@ import sys
 sys.path.insert(0, 'src')
 
 from database.repositories import EmbeddingRepository
-from utils.embedding_utils import get_embedding_model
-
-# Get model 
-print("Loading embedding model...")
-model = get_embedding_model()
+from utils.embedding_utils import encode_query
 
 # Create embedding for 'who is ceo'
+print("Loading embedding model...")
 query = 'who is ceo'
-embedding = model.encode([query], convert_to_numpy=True)[0]
+embedding = encode_query(query)
 
 print("\n" + "="*60)
 print("Testing search for EMT IPO...")
@@ -0,0 +1,48 @@
+"""Queries sent during a bulk encode are served between slices, not after the whole batch."""
+
+import os
+import sys
+import threading
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+import utils.embedding_utils as embedding_utils
+from utils.encoding_service import EncodingService
+
+
+class SlowModel:
+    """Stands in for the embedding model: a fixed cost per encode call"""
+
+    def __init__(self, seconds_per_call: float = 0.02):
+        self.seconds_per_call = seconds_per_call
+
+    def encode(self, texts, convert_to_numpy=True, **kwargs):
+        time.sleep(self.seconds_per_call)
+        return np.ones((len(texts), 4), dtype=np.float32)
+
+
+def test_query_finishes_before_concurrent_bulk_encode(monkeypatch):
+    monkeypatch.setattr(embedding_utils, '_model', SlowModel())
+    service = EncodingService(max_batch_size=8, max_wait_ms=1, bulk_slice=4)
+
+    finished = {}
+
+    def bulk():
+        embeddings = service.encode_batch([f"chunk {i}" for i in range(200)])  # 50 slices, ~1s
+        finished['bulk'] = time.monotonic()
+        finished['bulk_rows'] = len(embeddings)
+
+    bulk_thread = threading.Thread(target=bulk)
+    bulk_thread.start()
+    time.sleep(0.1)  # every slice is queued by now
+
+    query_embedding = service.encode("who is the ceo?")
+    finished['query'] = time.monotonic()
+    bulk_thread.join()
+
+    assert query_embedding.shape == (4,)
+    assert finished['bulk_rows'] == 200
+    assert finished['query'] < finished['bulk']